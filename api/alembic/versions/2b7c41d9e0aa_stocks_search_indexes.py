@@ -0,0 +1,53 @@
+"""stocks search indexes
+
+Revision ID: 2b7c41d9e0aa
+Revises: ed002c071d3e
+Create Date: 2026-10-17 09:00:00.000000
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "2b7c41d9e0aa"
+down_revision: Union[str, Sequence[str], None] = "ed002c071d3e"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Prefix search (symbol LIKE 'AA%') can't use the collation-aware unique
+    # index outside the C locale; text_pattern_ops can.
+    op.create_index(
+        "ix_stocks_symbol_pattern",
+        "stocks",
+        ["symbol"],
+        postgresql_ops={"symbol": "text_pattern_ops"},
+    )
+    # Fuzzy search: trigram GIN indexes serve `col % :q` and ILIKE '%q%'
+    op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    op.create_index(
+        "ix_stocks_symbol_trgm",
+        "stocks",
+        ["symbol"],
+        postgresql_using="gin",
+        postgresql_ops={"symbol": "gin_trgm_ops"},
+    )
+    op.create_index(
+        "ix_stocks_name_trgm",
+        "stocks",
+        ["name"],
+        postgresql_using="gin",
+        postgresql_ops={"name": "gin_trgm_ops"},
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index("ix_stocks_name_trgm", table_name="stocks")
+    op.drop_index("ix_stocks_symbol_trgm", table_name="stocks")
+    op.drop_index("ix_stocks_symbol_pattern", table_name="stocks")
+    # pg_trgm is left installed; other objects may depend on it
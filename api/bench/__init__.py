@@ -0,0 +1,2 @@
+# api/bench/__init__.py
+# Micro-benchmarks. Run from api/, e.g. `python -m bench.bench_bars_from_df`.
@@ -0,0 +1,79 @@
+# api/bench/bench_async_provider.py
+"""
+AsyncProviderAdapter latency/throughput against MockProvider with an injected
+upstream delay, and event-loop lag measured while the fetches run.
+
+    python -m bench.bench_async_provider
+"""
+from __future__ import annotations
+
+import asyncio
+import time
+from typing import Dict, List
+
+from providers.async_adapter import AsyncProviderAdapter
+from providers.base import Quote
+from providers.mock_provider import MockProvider
+
+DELAY_S = 0.100  # per upstream call
+
+
+class _SlowMock(MockProvider):
+    def get_quotes(self, symbols: List[str]) -> Dict[str, Quote]:
+        time.sleep(DELAY_S)
+        return super().get_quotes(symbols)
+
+    def get_ohlc(self, symbol, interval, range_):
+        time.sleep(DELAY_S)
+        return super().get_ohlc(symbol, interval, range_)
+
+
+async def _loop_lag(stop: asyncio.Event) -> float:
+    """Worst scheduling delay seen by a 10ms heartbeat."""
+    worst = 0.0
+    while not stop.is_set():
+        t0 = time.perf_counter()
+        await asyncio.sleep(0.010)
+        worst = max(worst, time.perf_counter() - t0 - 0.010)
+    return worst
+
+
+async def _measure(label: str, coro_factory) -> None:
+    stop = asyncio.Event()
+    lag_task = asyncio.create_task(_loop_lag(stop))
+    await asyncio.sleep(0)  # let the heartbeat start before we (maybe) block
+    t0 = time.perf_counter()
+    n = await coro_factory()
+    elapsed = time.perf_counter() - t0
+    stop.set()
+    lag = await lag_task
+    print(f"{label:<34} {elapsed * 1e3:8.0f} ms  {n / elapsed:8.1f} req/s  max loop lag {lag * 1e3:6.1f} ms")
+
+
+async def main() -> None:
+    slow = _SlowMock()
+    adapter = AsyncProviderAdapter(slow, max_workers=32, max_concurrency=32, quote_chunk_size=50)
+
+    async def blocking_on_loop(n: int) -> int:
+        # What a naive `async def` endpoint calling the sync provider does
+        for i in range(n):
+            slow.get_ohlc(f"S{i}", "5m", "5d")
+        return n
+
+    async def concurrent_ohlc(n: int) -> int:
+        await asyncio.gather(*(adapter.get_ohlc(f"S{i}", "5m", "5d") for i in range(n)))
+        return n
+
+    async def quotes(n_symbols: int) -> int:
+        await adapter.get_quotes([f"S{i}" for i in range(n_symbols)])
+        return 1
+
+    await _measure("sync provider on the loop, 20 ohlc", lambda: blocking_on_loop(20))
+    for n in (20, 200):
+        await _measure(f"adapter, {n} concurrent ohlc", lambda n=n: concurrent_ohlc(n))
+    for n in (50, 500, 2000):
+        await _measure(f"adapter, quotes for {n} symbols", lambda n=n: quotes(n))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,49 @@
+# api/bench/bench_hotset.py
+"""
+Hotset engine throughput: prints/s into the rolling windows across a large
+universe, and the cost of computing one flush's worth of changes.
+
+    python -m bench.bench_hotset
+"""
+from __future__ import annotations
+
+import random
+import time
+
+from hotset import HotsetEngine
+
+N_SYMBOLS = 5_000
+N_PRINTS = 500_000
+PRINTS_PER_MIN = 20_000
+
+
+def main() -> None:
+    rng = random.Random(7)
+    syms = [f"S{i:04d}" for i in range(N_SYMBOLS)]
+    prints = [
+        (rng.choice(syms), 10_000 + i // PRINTS_PER_MIN, rng.random() * 50_000, rng.choice("CP"))
+        for i in range(N_PRINTS)
+    ]
+    print(f"{N_PRINTS:,} prints over {N_SYMBOLS:,} symbols, {PRINTS_PER_MIN:,}/min")
+
+    engine = HotsetEngine()
+    t0 = time.perf_counter()
+    flush_s = 0.0
+    flushes = 0
+    last_min = prints[0][1]
+    for sym, minute, prem, side in prints:
+        if minute != last_min:
+            f0 = time.perf_counter()
+            engine.changes(last_min)
+            flush_s += time.perf_counter() - f0
+            flushes += 1
+            last_min = minute
+        engine.add(sym, minute, prem, side)
+    total = time.perf_counter() - t0
+    ingest = total - flush_s
+    print(f"ingest  {N_PRINTS / ingest:12,.0f} prints/s  ({ingest / N_PRINTS * 1e6:.2f} us/print)")
+    print(f"flush   {flush_s / max(flushes, 1) * 1e3:12.1f} ms avg over {flushes} minute flushes")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,47 @@
+# api/bench/bench_indicators.py
+"""
+Indicator engine over 1M bars: one vectorized pass for a full overlay set,
+then the O(1) per-bar incremental update.
+
+    python -m bench.bench_indicators
+"""
+from __future__ import annotations
+
+import time
+
+from indicators import IndicatorEngine
+from providers.mock_provider import MockProvider
+from providers.series import BarColumns
+
+SPEC = "sma20,sma50,ema20,ema200,rsi14,macd,vwap,bb20"
+
+
+def main() -> None:
+    a = MockProvider(max_bars=1_000_000).ohlc_arrays("AAPL", "1m", "5y")
+    cols = BarColumns(a["t"].astype("int64"), a["o"], a["h"], a["l"], a["c"], a["v"])
+    print(f"{len(cols):,} bars, spec={SPEC}")
+
+    engine = IndicatorEngine(SPEC)
+    t0 = time.perf_counter()
+    out = engine.compute(cols)
+    full = time.perf_counter() - t0
+    print(f"full pass      {full * 1e3:8.1f} ms  ({len(out)} series, {full / len(cols) * 1e9:.0f} ns/bar)")
+
+    n_updates = 10_000
+    t, step = int(cols.t[-1]), 60
+    t0 = time.perf_counter()
+    for i in range(n_updates):
+        t += step
+        engine.update(t, 101.0, 99.0, 100.0 + (i % 7) * 0.1, 1_000.0)
+    per = (time.perf_counter() - t0) / n_updates
+    print(f"update (new)   {per * 1e6:8.1f} us/bar")
+
+    t0 = time.perf_counter()
+    for i in range(n_updates):
+        engine.update(t, 101.0, 99.0, 100.0 + (i % 7) * 0.1, 1_000.0)  # forming-bar replace
+    per = (time.perf_counter() - t0) / n_updates
+    print(f"update (same)  {per * 1e6:8.1f} us/bar")
+
+
+if __name__ == "__main__":
+    main()
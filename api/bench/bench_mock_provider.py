@@ -0,0 +1,56 @@
+# api/bench/bench_mock_provider.py
+"""
+MockProvider throughput at load-test sizes, plus a cross-process determinism
+check (two interpreters with different PYTHONHASHSEEDs must agree).
+
+    python -m bench.bench_mock_provider
+"""
+from __future__ import annotations
+
+import json
+import os
+import subprocess
+import sys
+import time
+
+from providers.mock_provider import MockProvider
+
+_PROBE = (
+    "import json; from providers.mock_provider import MockProvider as M; m = M(); "
+    "print(json.dumps([m.get_quotes(['AAPL', 'MSFT']), [b['c'] for b in m.get_ohlc('AAPL', '5m', '5d')]]))"
+)
+
+
+def _probe(hash_seed: str) -> list:
+    env = {**os.environ, "PYTHONHASHSEED": hash_seed}
+    out = subprocess.check_output([sys.executable, "-c", _PROBE], env=env, text=True)
+    quotes, closes = json.loads(out)
+    for q in quotes.values():
+        q.pop("ts")
+    return [quotes, closes]
+
+
+def main() -> None:
+    assert _probe("1") == _probe("2"), "mock output differs across processes"
+    print("cross-process output identical")
+
+    m = MockProvider(max_bars=None)
+    for n_days, label in ((5, "5d/1m"), (1825, "5y/1m")):
+        rng = "5d" if n_days == 5 else "5y"
+        t0 = time.perf_counter()
+        m.ohlc_arrays("AAPL", "1m", rng)
+        t_cols = time.perf_counter() - t0
+        t0 = time.perf_counter()
+        bars = m.get_ohlc("AAPL", "1m", rng)
+        t_bars = time.perf_counter() - t0
+        print(f"{label:>6}: {len(bars):>9,} bars  arrays {t_cols * 1e3:7.1f} ms  List[Bar] {t_bars * 1e3:8.1f} ms")
+
+    for n in (1_000, 10_000):
+        syms = [f"SYM{i}" for i in range(n)]
+        t0 = time.perf_counter()
+        m.get_quotes(syms)
+        print(f"{n:>6} quotes {(time.perf_counter() - t0) * 1e3:7.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
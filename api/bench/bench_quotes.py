@@ -0,0 +1,71 @@
+# api/bench/bench_quotes.py
+"""
+Batched YFinanceProvider.get_quotes vs. one serial upstream call per symbol,
+against a local stub of yf.download (fixed round-trip + small per-symbol cost).
+
+    python -m bench.bench_quotes
+"""
+from __future__ import annotations
+
+import time
+from typing import List
+
+import pandas as pd
+
+import providers.yfinance_provider as yfp
+
+ROUND_TRIP_S = 0.050   # simulated network latency per upstream call
+PER_SYMBOL_S = 0.0002  # simulated server-side cost per symbol in a batch
+
+
+def _stub_download(tickers, **kwargs) -> pd.DataFrame:
+    syms: List[str] = [tickers] if isinstance(tickers, str) else list(tickers)
+    time.sleep(ROUND_TRIP_S + PER_SYMBOL_S * len(syms))
+    idx = pd.to_datetime(["2025-09-02", "2025-09-03"])
+    frames = {}
+    for s in syms:
+        if s.startswith("BAD"):
+            continue  # Yahoo simply omits unknown tickers
+        base = 100.0 + (sum(map(ord, s)) % 50)
+        frames[s] = pd.DataFrame(
+            {"Open": [base, base], "High": [base + 1] * 2, "Low": [base - 1] * 2,
+             "Close": [base, base * 1.01], "Volume": [1e6, 1.1e6]},
+            index=idx,
+        )
+    if not frames:
+        return pd.DataFrame()
+    return pd.concat(frames, axis=1)
+
+
+def _serial_baseline(symbols: List[str]) -> int:
+    got = 0
+    for s in symbols:
+        if _stub_download(s) is not None:
+            got += 1
+    return got
+
+
+def main() -> None:
+    yfp.yf.download = _stub_download
+    provider = yfp.YFinanceProvider(quote_chunk_size=100, quote_workers=4)
+
+    for n in (10, 100, 1000):
+        symbols = [f"S{i:04d}" for i in range(n - 1)] + ["BAD0"]
+
+        t0 = time.perf_counter()
+        out = provider.get_quotes(symbols)
+        batched = time.perf_counter() - t0
+        assert len(out) == n - 1 and "BAD0" not in out
+
+        if n <= 100:
+            t0 = time.perf_counter()
+            _serial_baseline(symbols)
+            serial = time.perf_counter() - t0
+        else:
+            serial = n * (ROUND_TRIP_S + PER_SYMBOL_S)  # extrapolated, too slow to run
+        print(f"{n:>5} symbols  serial {serial * 1e3:8.0f} ms  batched {batched * 1e3:6.0f} ms"
+              f"  x{serial / batched:6.1f}")
+
+
+if __name__ == "__main__":
+    main()
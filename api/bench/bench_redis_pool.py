@@ -0,0 +1,77 @@
+# api/bench/bench_redis_pool.py
+"""
+Requests/s for a cached-value endpoint under concurrency, against a real Redis
+(REDIS_URL):
+
+  before   async endpoint on a sync client: GET, then TTL (blocks the loop)
+  pooled   shared async pool, GET+TTL in one pipeline
+  pooled+  the same with the in-process L1 in front
+
+    REDIS_URL=redis://localhost:6379/0 python -m bench.bench_redis_pool
+"""
+from __future__ import annotations
+
+import asyncio
+import time
+
+import httpx
+import redis
+from fastapi import FastAPI
+
+from l1cache import L1Cache, TwoTierCache
+from redis_client import REDIS_URL, aredis, redis_client
+
+KEY = "fs:bench:pool"
+CONCURRENCY = 64
+REQUESTS = 5_000
+
+
+def build_app() -> FastAPI:
+    app = FastAPI()
+    legacy = redis.Redis.from_url(REDIS_URL, decode_responses=True)
+    no_l1 = TwoTierCache(redis_client, aredis, REDIS_URL, l1=L1Cache(ttl=0))
+    with_l1 = TwoTierCache(redis_client, aredis, REDIS_URL)
+
+    @app.get("/before")
+    async def before():
+        return {"value": legacy.get(KEY), "ttl": legacy.ttl(KEY)}
+
+    @app.get("/pooled")
+    async def pooled():
+        value, ttl = await no_l1.aget_with_ttl(KEY)
+        return {"value": value, "ttl": ttl}
+
+    @app.get("/pooled+")
+    async def pooled_l1():
+        value, ttl = await with_l1.aget_with_ttl(KEY)
+        return {"value": value, "ttl": ttl}
+
+    return app
+
+
+async def run(client: httpx.AsyncClient, path: str) -> float:
+    sem = asyncio.Semaphore(CONCURRENCY)
+
+    async def one():
+        async with sem:
+            r = await client.get(path)
+            r.raise_for_status()
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(REQUESTS)))
+    return REQUESTS / (time.perf_counter() - t0)
+
+
+async def main() -> None:
+    redis_client.set(KEY, "x" * 256, ex=600)
+    app = build_app()
+    print(f"{REQUESTS:,} requests, concurrency {CONCURRENCY}, {REDIS_URL}")
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench") as client:
+        for path in ("/before", "/pooled", "/pooled+"):
+            await run(client, path)   # warm connections
+            print(f"{path:10s} {await run(client, path):10,.0f} req/s")
+    redis_client.delete(KEY)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,97 @@
+# api/bench/bench_stocks.py
+"""
+Symbol universe at 100k rows: per-row ORM inserts (the old POST /stocks) vs
+bulk upsert, OFFSET vs keyset paging deep into the table, and search.
+
+Runs against BENCH_DATABASE_URL (default: a throwaway SQLite file). Point it
+at a scratch Postgres with the migrations applied to exercise COPY and the
+trigram indexes; the stocks table is emptied first.
+
+    BENCH_DATABASE_URL=postgresql+psycopg2://... python -m bench.bench_stocks
+"""
+from __future__ import annotations
+
+import os
+import random
+import string
+import tempfile
+import time
+
+from sqlalchemy import create_engine, delete, select
+from sqlalchemy.orm import Session
+
+import stocks
+from models import Base, Stock
+
+N_ROWS = 100_000
+ORM_SAMPLE = 2_000
+PAGE = 100
+WORDS = ["Holdings", "Capital", "Energy", "Bio", "Systems", "Global", "Trust", "Pharma", "Networks", "Foods"]
+
+
+def universe(n: int, seed: int = 11) -> list:
+    rng = random.Random(seed)
+    seen, rows = set(), []
+    while len(rows) < n:
+        sym = "".join(rng.choices(string.ascii_uppercase, k=rng.randint(1, 5)))
+        if sym in seen:
+            continue
+        seen.add(sym)
+        rows.append({"symbol": sym, "name": f"{sym.title()} {rng.choice(WORDS)} {rng.choice(WORDS)}"})
+    return rows
+
+
+def timed(label: str, fn, n: int = 1):
+    t0 = time.perf_counter()
+    for _ in range(n):
+        out = fn()
+    dt = (time.perf_counter() - t0) / n
+    print(f"{label:34s} {dt * 1e3:10.2f} ms")
+    return out, dt
+
+
+def main() -> None:
+    url = os.getenv("BENCH_DATABASE_URL") or f"sqlite:///{tempfile.mkdtemp()}/bench.db"
+    engine = create_engine(url)
+    Base.metadata.create_all(engine)
+    with engine.begin() as conn:
+        conn.execute(delete(Stock))
+    rows = universe(N_ROWS)
+    print(f"{N_ROWS:,} symbols on {engine.dialect.name}")
+
+    def orm_rows():
+        with Session(engine) as db:
+            for r in rows[:ORM_SAMPLE]:
+                s = Stock(**r)
+                db.add(s)
+                db.commit()
+                db.refresh(s)
+
+    _, dt = timed(f"ORM insert+commit ({ORM_SAMPLE:,} rows)", orm_rows)
+    print(f"{'  -> extrapolated to 100k':34s} {dt * N_ROWS / ORM_SAMPLE:10.0f} s")
+    with engine.begin() as conn:
+        conn.execute(delete(Stock))
+
+    timed("bulk upsert (fresh load)", lambda: stocks.bulk_upsert(engine, rows))
+    renamed = [dict(r, name=r["name"] + " Inc") if i % 100 == 0 else r for i, r in enumerate(rows)]
+    timed("bulk upsert (1% renamed)", lambda: stocks.bulk_upsert(engine, renamed))
+
+    with engine.connect() as conn:
+        last_page_start = conn.execute(
+            select(Stock.symbol).order_by(Stock.symbol).offset(N_ROWS - PAGE - 1).limit(1)
+        ).scalar()
+
+    def offset_page():
+        with engine.connect() as conn:
+            return conn.execute(
+                select(Stock.id, Stock.symbol, Stock.name).order_by(Stock.symbol).offset(N_ROWS - PAGE).limit(PAGE)
+            ).all()
+
+    timed("OFFSET page near the end", offset_page, n=20)
+    timed("keyset page near the end", lambda: stocks.page(engine, last_page_start, PAGE), n=20)
+    timed("search prefix 'AB'", lambda: stocks.search(engine, "AB"), n=50)
+    timed("search fuzzy 'pharma cap'", lambda: stocks.search(engine, "pharma cap"), n=20)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,42 @@
+# api/bench/bench_symbol_index.py
+"""
+Symbol autocomplete over 100k symbols: index build time, then per-keystroke
+search latency (what the command bar does while a user types).
+
+    python -m bench.bench_symbol_index
+"""
+from __future__ import annotations
+
+import time
+
+from bench.bench_stocks import N_ROWS, universe
+from symbol_index import _Snapshot
+
+QUERIES = ["A", "AA", "AAP", "MS", "Z", "h", "hold", "pharma", "global cap", "bio sys", "xq"]
+
+
+def main() -> None:
+    rows = [(r["symbol"], r["name"]) for r in universe(N_ROWS)]
+    t0 = time.perf_counter()
+    snap = _Snapshot.build(rows)
+    print(f"build {len(rows):,} symbols   {(time.perf_counter() - t0) * 1e3:8.1f} ms  ({len(snap.lead) + len(snap.other):,} name words)")
+
+    n = 2_000
+    worst = 0.0
+    for q in QUERIES:
+        t0 = time.perf_counter()
+        for _ in range(n):
+            hits = snap.search(q, 10)
+        per = (time.perf_counter() - t0) / n
+        worst = max(worst, per)
+        print(f"search {q!r:14s} {per * 1e6:8.1f} us  {len(hits):2d} hits  {[h['symbol'] for h in hits[:3]]}")
+    print(f"worst query        {worst * 1e6:8.1f} us")
+
+    upserts = [{"symbol": f"NEW{i}", "name": f"New Listing {i} Holdings"} for i in range(100)]
+    t0 = time.perf_counter()
+    snap.with_upserts(upserts)
+    print(f"apply 100 upserts  {(time.perf_counter() - t0) * 1e3:8.1f} ms  (copy-on-write)")
+
+
+if __name__ == "__main__":
+    main()
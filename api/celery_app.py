@@ -1,16 +1,29 @@
 ﻿# api/celery_app.py
-import os
 import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timezone
 from random import random, choice
 
-from celery import Celery
+from celery import Celery, chord
+from celery.signals import (
+    celeryd_init, task_failure, task_postrun, task_prerun, task_revoked, worker_init, worker_process_init,
+)
 from dotenv import load_dotenv
-import redis
 
-load_dotenv()  # loads .env next to this file if present
+from hotset import HOTSET_ZSET, HotsetConsumer
+from l1cache import INVALIDATE_CHANNEL, publish_invalidation
+from metrics import REGISTRY, histogram
+from providers import CachingProvider, build_upstream, is_fallback
+from providers.caching_provider import EMPTY_TTL, OHLC_TTL, quote_key
+from pubsub import publish_prints, publish_quotes
+from queues import QUEUE_PROFILES, REFRESH, TASK_QUEUES, TASK_ROUTES, release
+from ratelimit import TokenBucket
+from redis_client import REDIS_URL, redis_client
+from tape import TAPE_PAGE_PREFIX, TAPE_STREAM, append_prints
 
-REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+load_dotenv()  # loads .env next to this file if present
 
 celery_app = Celery(
     "flowsnipr",
@@ -18,17 +31,75 @@ celery_app = Celery(
     backend=REDIS_URL,
 )
 
-# ---- NEW: redis client for tasks ----
-_r = redis.Redis.from_url(REDIS_URL, decode_responses=True)
+# ---- NEW: redis client for tasks (shared pool, see redis_client.py) ----
+_r = redis_client
 
 # ---- OPTIONAL nicety (not required) ----
 celery_app.conf.broker_connection_retry_on_startup = True
 celery_app.conf.timezone = "UTC"
 
+# ---- Queues: interactive / refresh / backfill (see queues.py) ----
+celery_app.conf.task_queues = TASK_QUEUES
+celery_app.conf.task_routes = TASK_ROUTES
+celery_app.conf.task_default_queue = REFRESH
+
+# WORKER_PROFILE=<queue> sizes this worker for one queue and consumes only it;
+# -c / --prefetch-multiplier / -Q on the command line still win.
+WORKER_PROFILE = os.getenv("WORKER_PROFILE")
+if WORKER_PROFILE:
+    _profile = QUEUE_PROFILES[WORKER_PROFILE]
+    celery_app.conf.worker_concurrency = _profile["concurrency"]
+    celery_app.conf.worker_prefetch_multiplier = _profile["prefetch_multiplier"]
+
+@celeryd_init.connect
+def _select_profile_queue(sender=None, instance=None, options=None, **kwargs):
+    if WORKER_PROFILE and not (options or {}).get("queues"):
+        instance.app.amqp.queues.select([WORKER_PROFILE])
+
+# ---- Metrics: task durations; each worker process flushes to METRICS_DIR ----
+TASK_RUNS = histogram("celery_task_duration_seconds", "Celery task run time by task and final state.",
+                      ("task", "state"))
+_task_started = {}
+
+@worker_init.connect
+@worker_process_init.connect
+def _start_metrics_flusher(**kwargs):
+    REGISTRY.start_flusher()
+
+@task_prerun.connect
+def _task_started_at(task_id=None, **kwargs):
+    _task_started[task_id] = time.perf_counter()
+
+@task_postrun.connect
+def _task_finished(sender=None, task_id=None, state=None, **kwargs):
+    started = _task_started.pop(task_id, None)
+    if started is not None:
+        TASK_RUNS.labels(sender.name, state or "UNKNOWN").observe(time.perf_counter() - started)
+
+@task_postrun.connect
+@task_failure.connect
+def _release_dedup(sender=None, task_id=None, args=None, kwargs=None, **extra):
+    # Lets the next identical enqueue (queues.enqueue) through; releasing twice is a no-op
+    try:
+        release(_r, sender.name, args or (), kwargs or {}, task_id)
+    except Exception:
+        pass  # the key's TTL covers it
+
+@task_revoked.connect
+def _release_dedup_revoked(sender=None, request=None, **extra):
+    # Revoked before it ran: task_postrun never fires
+    try:
+        release(_r, request.task_name, request.args or (), request.kwargs or {}, request.id)
+    except Exception:
+        pass
+
 @celery_app.task
 def hello_task(name: str = "world"):
     return f"hello {name}"
 
+# Always refreshed (and pushed to stream clients), on top of fs:universe
+WATCHLIST = ["AAPL", "MSFT", "TSLA", "NVDA", "AMZN", "META", "SPY", "QQQ"]
+
 # ---- NEW: mock generators ----
 def _now_iso():
     return datetime.now(timezone.utc).isoformat()
@@ -51,36 +122,200 @@ def _mock_tape(n=6):
         })
     return arr
 
-def _mock_hotset(n=8):
-    syms = ["AAPL", "MSFT", "TSLA", "NVDA", "AMZN", "META", "SPY", "QQQ"]
-    return [{
-        "symbol": s,
-        "score": round(50 + 50 * random(), 2),
-        "updated": _now_iso(),
-    } for s in syms[:n]]
-
 # ---- NEW: scheduled tasks that write to Redis ----
 @celery_app.task
 def refresh_tape():
     payload = _mock_tape()
-    _r.set("fs:tape", json.dumps(payload), ex=180)  # TTL 3m
+    ids = append_prints(_r, payload)  # capped stream; readers page by cursor
+    publish_prints(_r, payload)  # push to /v1/stream clients
+    publish_invalidation(_r, prefix=TAPE_PAGE_PREFIX)  # API processes drop cached tape pages
     # return for logs
-    return {"wrote": len(payload), "key": "fs:tape", "at": _now_iso()}
+    return {"wrote": len(payload), "key": TAPE_STREAM, "last_id": ids[-1] if ids else None, "at": _now_iso()}
+
+_hotset = None
 
 @celery_app.task
 def refresh_hotset():
-    payload = _mock_hotset()
-    _r.set("fs:hotset", json.dumps(payload), ex=180)  # TTL 3m
-    return {"wrote": len(payload), "key": "fs:hotset", "at": _now_iso()}
+    # One process scores at a time (Redis lock); state is checkpointed to
+    # Redis, so any worker process can pick up where the last run stopped.
+    global _hotset
+    if _hotset is None:
+        _hotset = HotsetConsumer(_r)
+    return {**_hotset.run_once(), "key": HOTSET_ZSET, "at": _now_iso()}
+
+# ---- Universe quote refresh: chunked fan-out, shared upstream rate limit ----
+# refresh_universe (beat) splits fs:universe + WATCHLIST into chunks and runs
+# chord(refresh_quote_chunk per chunk) -> refresh_universe_done. Each chunk
+# takes a token from a Redis bucket shared by all workers, makes one batched
+# upstream call, and writes its quotes in one pipeline (MSET + EXPIREs) under
+# the same keys CachingProvider reads.
+UNIVERSE_KEY = "fs:universe"              # Redis set of tracked symbols
+UNIVERSE_INTERVAL = 15.0                  # seconds (beat)
+UNIVERSE_CHUNK = int(os.getenv("UNIVERSE_CHUNK", "100"))
+UNIVERSE_LOCK = "fs:universe:refreshing"  # one refresh in flight at a time
+UPSTREAM_RATE = float(os.getenv("QUOTES_UPSTREAM_RATE", "10"))    # batched calls / s, all workers
+UPSTREAM_BURST = float(os.getenv("QUOTES_UPSTREAM_BURST", "10"))
+REFRESHED_QUOTE_TTL = int(2 * UNIVERSE_INTERVAL)  # survives one late run
+
+_upstream = None
+_bucket = None
+
+def _get_upstream():
+    global _upstream, _bucket
+    if _upstream is None:
+        _upstream = build_upstream()
+        _bucket = TokenBucket(_r, "fs:rl:quotes", UPSTREAM_RATE, UPSTREAM_BURST)
+    return _upstream, _bucket
+
+def _universe():
+    return sorted(set(_r.smembers(UNIVERSE_KEY)) | set(WATCHLIST))
+
+@celery_app.task
+def refresh_universe():
+    if not _r.set(UNIVERSE_LOCK, _now_iso(), nx=True, ex=int(UNIVERSE_INTERVAL * 4)):
+        return {"skipped": "previous refresh still running", "at": _now_iso()}
+    symbols = _universe()
+    chunks = [symbols[i:i + UNIVERSE_CHUNK] for i in range(0, len(symbols), UNIVERSE_CHUNK)]
+    chord(refresh_quote_chunk.s(c) for c in chunks)(refresh_universe_done.s(time.time()))
+    return {"symbols": len(symbols), "chunks": len(chunks), "at": _now_iso()}
+
+@celery_app.task
+def refresh_quote_chunk(symbols):
+    upstream, bucket = _get_upstream()
+    # Give up rather than pile into the next beat; the chunk's quotes stay cached a little longer
+    if not bucket.acquire(1, timeout=UNIVERSE_INTERVAL):
+        return {"symbols": len(symbols), "written": 0, "throttled": True}
+    try:
+        quotes = upstream.get_quotes(symbols)
+    except Exception as e:
+        # Don't fail the chord (its callback releases the lock); cached quotes just age out
+        return {"symbols": len(symbols), "written": 0, "throttled": False, "error": str(e)}
+    if is_fallback(quotes):
+        # Upstream down: synthetic quotes must not replace real ones or reach stream clients
+        return {"symbols": len(symbols), "written": 0, "throttled": False, "error": "upstream unavailable"}
+
+    keys = {s: quote_key(upstream.name, s) for s in symbols}
+    pipe = _r.pipeline(transaction=False)
+    for s in symbols:
+        if s in quotes:
+            pipe.set(keys[s], json.dumps(quotes[s]), ex=REFRESHED_QUOTE_TTL)
+        else:
+            # Missing from a partial answer (e.g. one failed chunk upstream):
+            # mark it unknown only if we hold no quote, never blank a good one
+            pipe.set(keys[s], "null", ex=EMPTY_TTL, nx=True)
+    pipe.publish(INVALIDATE_CHANNEL, json.dumps({"origin": "", "keys": list(keys.values())}))
+    pipe.execute()
+    publish_quotes(_r, quotes)  # push to /v1/stream clients
+    return {"symbols": len(symbols), "written": len(quotes), "throttled": False}
+
+@celery_app.task
+def refresh_universe_done(results, started):
+    _r.delete(UNIVERSE_LOCK)
+    return {
+        "chunks": len(results),
+        "written": sum(r["written"] for r in results),
+        "throttled": sum(1 for r in results if r["throttled"]),
+        "seconds": round(time.time() - started, 2),
+        "at": _now_iso(),
+    }
+
+# ---- Refresh-ahead for hot charts ----
+# CachingProvider counts OHLC reads in a decaying ZSET. Every WARM_INTERVAL the
+# hottest entries whose cached copy expires within the lead window are
+# re-fetched (at most WARM_BUDGET upstream calls per run), so popular charts
+# stay warm; entries whose count decays below WARM_MIN_SCORE just expire.
+WARM_INTERVAL = 5.0                                            # seconds (beat)
+WARM_BUDGET = int(os.getenv("OHLC_WARM_BUDGET", "20"))         # upstream fetches per run
+WARM_MIN_SCORE = float(os.getenv("OHLC_WARM_MIN_SCORE", "2"))  # decayed reads
+WARM_SCAN = 200                                                # hottest entries considered
+WARM_CONCURRENCY = 4
+WARM_LOCK = "fs:warm:running"
+
+_cache = None
+
+def _get_cache():
+    global _cache
+    if _cache is None:
+        _cache = CachingProvider(_get_upstream()[0], _r)
+    return _cache
+
+def _warm_lead_ms(interval):
+    # Two beats, or a quarter of the TTL for slow intervals
+    return int(max(2 * WARM_INTERVAL, OHLC_TTL.get(interval, 60) / 4) * 1000)
+
+@celery_app.task
+def warm_hot_ohlc():
+    if not _r.set(WARM_LOCK, _now_iso(), nx=True, ex=int(WARM_INTERVAL * 6)):
+        return {"skipped": "previous run still going", "at": _now_iso()}
+    try:
+        cache = _get_cache()
+        dropped = cache.decay_access()
+        due = [
+            (sym, interval, range_)
+            for sym, interval, range_, score, ttl_ms in cache.hot_ohlc(WARM_SCAN)
+            if score >= WARM_MIN_SCORE and ttl_ms != -1 and ttl_ms < _warm_lead_ms(interval)
+        ]
+        todo = due[:WARM_BUDGET]
+        with ThreadPoolExecutor(max_workers=WARM_CONCURRENCY) as pool:
+            done = list(pool.map(lambda e: _warm_one(cache, *e), todo))
+        return {
+            "due": len(due),
+            "refreshed": sum(1 for d in done if d),
+            "over_budget": len(due) - len(todo),
+            "forgotten": dropped,
+            "at": _now_iso(),
+        }
+    finally:
+        _r.delete(WARM_LOCK)
+
+def _warm_one(cache, symbol, interval, range_):
+    try:
+        return cache.refresh_ohlc(symbol, interval, range_)
+    except Exception:
+        return False  # the cached copy expires and the next reader fetches it
+
+# ---- On-demand OHLC loads (enqueued from /tasks/*) ----
+@celery_app.task
+def fetch_ohlc(symbol, interval, range_):
+    """User-triggered: load one chart into the cache now (interactive queue)."""
+    refreshed = _get_cache().refresh_ohlc(symbol, interval, range_)
+    return {"symbol": symbol, "interval": interval, "range": range_, "refreshed": refreshed}
+
+@celery_app.task
+def backfill_ohlc(symbols, interval, range_):
+    """Bulk historical load (backfill queue); one symbol at a time so it never bursts upstream."""
+    cache = _get_cache()
+    done, failed = 0, []
+    for symbol in symbols:
+        try:
+            cache.refresh_ohlc(symbol, interval, range_)
+            done += 1
+        except Exception:
+            failed.append(symbol)
+    return {"symbols": len(symbols), "loaded": done, "failed": failed, "at": _now_iso()}
 
 # ---- NEW: beat schedule ----
+# "expires": a run still queued when the next one is due is dropped, so a
+# backlog on the refresh queue never stacks up duplicate refreshes.
 celery_app.conf.beat_schedule = {
     "refresh_tape_every_30s": {
         "task": "celery_app.refresh_tape",
         "schedule": 30.0,
+        "options": {"expires": 30.0},
     },
-    "refresh_hotset_every_60s": {
+    "refresh_universe_every_15s": {
+        "task": "celery_app.refresh_universe",
+        "schedule": UNIVERSE_INTERVAL,
+        "options": {"expires": UNIVERSE_INTERVAL},
+    },
+    "refresh_hotset_every_5s": {
         "task": "celery_app.refresh_hotset",
-        "schedule": 60.0,
+        "schedule": 5.0,
+        "options": {"expires": 5.0},
+    },
+    "warm_hot_ohlc_every_5s": {
+        "task": "celery_app.warm_hot_ohlc",
+        "schedule": WARM_INTERVAL,
+        "options": {"expires": WARM_INTERVAL},
     },
 }
@@ -0,0 +1,123 @@
+# api/health.py
+"""
+Health probes run in the background; /healthz and /readyz read the cached result.
+
+Each probe is a blocking callable run on a small dedicated thread pool with
+its own deadline, and all probes of a round run concurrently, so one round
+costs as much as the slowest probe (capped by its timeout), not the sum.
+A probe still stuck from an earlier round isn't started again: it reports
+"timeout" until its thread comes back, so a hung Postgres can't pile up
+threads.
+"""
+from __future__ import annotations
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Callable, Dict, List, Optional
+import asyncio
+import logging
+import time
+
+log = logging.getLogger(__name__)
+
+HEALTH_INTERVAL = 5.0   # seconds between probe rounds
+
+
+@dataclass
+class Probe:
+    name: str
+    check: Callable[[], object]   # raises or returns False on failure
+    timeout: float = 2.0
+    required: bool = True         # counts towards readiness
+
+
+class HealthMonitor:
+    def __init__(self, probes: List[Probe], interval: float = HEALTH_INTERVAL) -> None:
+        self.probes = probes
+        self.interval = interval
+        self._pool = ThreadPoolExecutor(max_workers=len(probes) * 2, thread_name_prefix="health")
+        self._running: Dict[str, Future] = {}
+        self._results: Dict[str, dict] = {}
+        self._checked_at: Optional[float] = None
+        self._task: Optional[asyncio.Task] = None
+        self._round: Optional[asyncio.Task] = None
+
+    # ---------- lifecycle ----------
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._loop(), name="health-prober")
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+    async def _loop(self) -> None:
+        while True:
+            try:
+                await self.refresh()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                log.exception("health probe round failed")
+            await asyncio.sleep(self.interval)
+
+    # ---------- probing ----------
+
+    async def refresh(self) -> None:
+        """Run one round; concurrent callers share it."""
+        if self._round is None or self._round.done():
+            self._round = asyncio.ensure_future(self._run_round())
+        await asyncio.shield(self._round)
+
+    async def _run_round(self) -> None:
+        results = await asyncio.gather(*(self._run_probe(p) for p in self.probes))
+        self._results = {p.name: r for p, r in zip(self.probes, results)}
+        self._checked_at = time.time()
+
+    async def _run_probe(self, probe: Probe) -> dict:
+        pending = self._running.get(probe.name)
+        if pending is not None and not pending.done():
+            return {"status": "timeout", "latency_ms": None, "error": "previous check still running"}
+
+        start = time.perf_counter()
+        fut = self._pool.submit(probe.check)
+        self._running[probe.name] = fut
+        try:
+            ok = await asyncio.wait_for(asyncio.wrap_future(fut), probe.timeout)
+        except asyncio.TimeoutError:
+            return {"status": "timeout", "latency_ms": round(probe.timeout * 1000, 1),
+                    "error": f"no answer within {probe.timeout}s"}
+        except Exception as e:
+            return {"status": "down", "latency_ms": self._ms(start), "error": str(e)}
+        status = "down" if ok is False else "ok"
+        return {"status": status, "latency_ms": self._ms(start)}
+
+    @staticmethod
+    def _ms(start: float) -> float:
+        return round((time.perf_counter() - start) * 1000, 1)
+
+    # ---------- reads ----------
+
+    async def snapshot(self) -> dict:
+        """Cached status; only the very first call (before any round) waits for probes."""
+        if self._checked_at is None:
+            await self.refresh()
+        age = time.time() - self._checked_at
+        return {
+            "probes": self._results,
+            "checked_at": datetime.fromtimestamp(self._checked_at, tz=timezone.utc).isoformat(),
+            "age_s": round(age, 2),
+            # Prober stopped refreshing: don't keep reporting an old "ok"
+            "stale": age > 3 * self.interval + max(p.timeout for p in self.probes),
+        }
+
+    def ready(self, snap: dict) -> bool:
+        required = [p.name for p in self.probes if p.required]
+        return not snap["stale"] and all(snap["probes"].get(n, {}).get("status") == "ok" for n in required)
@@ -0,0 +1,367 @@
+# api/hotset.py
+"""
+Hotset: symbols ranked by recent options flow, scored incrementally from the tape.
+
+Each symbol keeps a 30-slot ring of per-minute buckets (premium, call premium,
+put premium, print count) plus running sums for the 1m / 5m / 30m windows.
+A print touches one bucket and three sums; moving the clock forward subtracts
+the buckets falling out of each window. Nothing is ever recomputed from the
+raw prints.
+
+Only symbols whose score changed are written back: the ones that printed since
+the last flush, and the ones whose old buckets just aged out of a window
+(tracked per minute, so the rest of the universe isn't touched).
+
+Redis layout:
+  fs:hotset:z        sorted set, symbol -> score (/v1/hotset reads it with ZREVRANGE)
+  fs:hotset:stats    hash, symbol -> JSON window aggregates
+  fs:hotset:updated  ISO time of the last flush
+  fs:hotset:state    checkpoint hash: rev, tape cursor, engine clock
+  fs:hotset:rings    hash, symbol -> JSON minute ring (only changed symbols are rewritten)
+  fs:hotset:changes  capped stream, one entry per checkpoint listing the symbols it wrote
+  fs:hotset:lock     held by the one process scoring right now
+"""
+from __future__ import annotations
+from collections import defaultdict
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Set, Tuple
+import json
+import time
+import uuid
+
+import redis
+
+from singleflight import release_token
+from tape import MAX_PAGE, read_since
+
+HOTSET_ZSET = "fs:hotset:z"
+HOTSET_STATS = "fs:hotset:stats"
+HOTSET_UPDATED = "fs:hotset:updated"
+HOTSET_STATE = "fs:hotset:state"
+HOTSET_RINGS = "fs:hotset:rings"
+HOTSET_CHANGES = "fs:hotset:changes"
+HOTSET_LOCK = "fs:hotset:lock"
+LOCK_TTL = 60          # seconds; upper bound on one run
+CHANGES_MAXLEN = 1000  # checkpoints a process can fall behind and still catch up by symbol
+
+WINDOWS = (1, 5, 30)   # minutes
+_SLOTS = 30            # ring size == longest window
+# Weights on the per-minute premium rate of each window: reacts to bursts
+# but a symbol needs sustained flow to stay on top.
+_WEIGHTS = {1: 0.5, 5: 0.3, 30: 0.2}
+
+
+class _SymbolFlow:
+    __slots__ = ("head", "prem", "call", "put", "count", "sums")
+
+    def __init__(self, minute: int) -> None:
+        self.head = minute
+        self.prem = [0.0] * _SLOTS
+        self.call = [0.0] * _SLOTS
+        self.put = [0.0] * _SLOTS
+        self.count = [0] * _SLOTS
+        # window -> [prem, call, put, count]
+        self.sums: Dict[int, list] = {w: [0.0, 0.0, 0.0, 0] for w in WINDOWS}
+
+    def advance(self, minute: int) -> None:
+        """Move the head to `minute`, expiring buckets that leave each window."""
+        if minute <= self.head:
+            return
+        if minute - self.head >= _SLOTS:
+            self.__init__(minute)
+            return
+        for k in range(self.head + 1, minute + 1):
+            for w in WINDOWS:
+                slot = (k - w) % _SLOTS
+                s = self.sums[w]
+                s[0] -= self.prem[slot]
+                s[1] -= self.call[slot]
+                s[2] -= self.put[slot]
+                s[3] -= self.count[slot]
+            slot = k % _SLOTS   # the 30m-old bucket, reused for minute k
+            self.prem[slot] = self.call[slot] = self.put[slot] = 0.0
+            self.count[slot] = 0
+        self.head = minute
+
+    def add(self, minute: int, prem: float, side: str) -> bool:
+        """Add one print; False if it is older than the longest window."""
+        self.advance(minute)
+        age = self.head - minute
+        if age >= _SLOTS:
+            return False
+        slot = minute % _SLOTS
+        call = prem if side == "C" else 0.0
+        put = prem if side == "P" else 0.0
+        self.prem[slot] += prem
+        self.call[slot] += call
+        self.put[slot] += put
+        self.count[slot] += 1
+        for w in WINDOWS:
+            if age < w:
+                s = self.sums[w]
+                s[0] += prem
+                s[1] += call
+                s[2] += put
+                s[3] += 1
+        return True
+
+    @classmethod
+    def from_ring(cls, head: int, prem: list, call: list, put: list, count: list) -> "_SymbolFlow":
+        flow = cls(head)
+        flow.prem, flow.call, flow.put, flow.count = list(prem), list(call), list(put), list(count)
+        for w in WINDOWS:
+            s = flow.sums[w]
+            for age in range(w):
+                slot = (head - age) % _SLOTS
+                s[0] += flow.prem[slot]
+                s[1] += flow.call[slot]
+                s[2] += flow.put[slot]
+                s[3] += flow.count[slot]
+        return flow
+
+    def ring(self) -> list:
+        return [self.head, self.prem, self.call, self.put, self.count]
+
+    def score(self) -> float:
+        return sum(_WEIGHTS[w] * max(self.sums[w][0], 0.0) / w for w in WINDOWS)
+
+    def stats(self) -> dict:
+        out = {}
+        for w in WINDOWS:
+            prem, call, put, count = self.sums[w]
+            out[f"prem_{w}m"] = round(max(prem, 0.0), 2)
+            out[f"prints_{w}m"] = count
+        call, put = self.sums[5][1], self.sums[5][2]
+        # +1 all calls, -1 all puts, over the 5m window
+        out["skew_5m"] = round((call - put) / (call + put), 4) if call + put > 0 else 0.0
+        return out
+
+
+def _minute_of(entry_id: str) -> int:
+    """Stream IDs start with the arrival time in ms."""
+    return int(entry_id.split("-", 1)[0]) // 60_000
+
+
+class HotsetEngine:
+    """In-memory scorer; feed it tape prints, then flush() the changes to Redis."""
+
+    def __init__(self) -> None:
+        self.flows: Dict[str, _SymbolFlow] = {}
+        self._dirty: Set[str] = set()
+        # minute -> symbols with a non-empty bucket for that minute; their
+        # scores change again when that minute leaves the 1m/5m/30m windows
+        self._touched: Dict[int, Set[str]] = defaultdict(set)
+        self._clock: Optional[int] = None   # minute of the last flush
+        # Since the last checkpoint: symbols whose ring gained prints / that were dropped
+        self._written: Set[str] = set()
+        self._removed: Set[str] = set()
+
+    # ---------- checkpoint ----------
+
+    def put(self, symbol: str, ring: list) -> None:
+        """Install a checkpointed ring (replacing any local one)."""
+        flow = self.flows[symbol] = _SymbolFlow.from_ring(*ring)
+        for age in range(_SLOTS):
+            if flow.count[(flow.head - age) % _SLOTS]:
+                self._touched[flow.head - age].add(symbol)
+
+    def drop(self, symbol: str) -> None:
+        self.flows.pop(symbol, None)
+
+    def take_changes(self) -> Tuple[Dict[str, list], List[str]]:
+        """(rings to write, symbols to delete) since the last call. A ring
+        that only aged is not rewritten: the stored one expires the same way."""
+        rings = {s: self.flows[s].ring() for s in self._written if s in self.flows}
+        gone = [s for s in self._removed if s not in self.flows]
+        self._written.clear()
+        self._removed.clear()
+        return rings, gone
+
+    def add(self, symbol: str, minute: int, prem: float, side: str) -> None:
+        flow = self.flows.get(symbol)
+        if flow is None:
+            flow = self.flows[symbol] = _SymbolFlow(minute)
+        if flow.add(minute, prem, side):
+            self._dirty.add(symbol)
+            self._touched[minute].add(symbol)
+            self._written.add(symbol)
+
+    def add_prints(self, prints: List[dict]) -> int:
+        """Prints as returned by tape.read_since (each carries its stream `id`)."""
+        n = 0
+        for p in prints:
+            try:
+                self.add(p["symbol"], _minute_of(p["id"]), float(p.get("prem") or 0.0), p.get("side", ""))
+                n += 1
+            except (KeyError, ValueError, TypeError):
+                continue
+        return n
+
+    def _expire(self, now_min: int) -> None:
+        """Mark symbols whose buckets left a window between the last flush and now."""
+        last = self._clock if self._clock is not None else now_min
+        for w in WINDOWS:
+            for m in range(max(last - w + 1, now_min - _SLOTS - w), now_min - w + 1):
+                self._dirty.update(self._touched.get(m, ()))
+        for m in [m for m in self._touched if m <= now_min - _SLOTS]:
+            del self._touched[m]
+        self._clock = now_min
+
+    def changes(self, now_min: int) -> Tuple[Dict[str, float], Dict[str, str], List[str]]:
+        """(scores, stats JSON, symbols to drop) for everything dirty as of `now_min`."""
+        self._expire(now_min)
+        scores: Dict[str, float] = {}
+        stats: Dict[str, str] = {}
+        gone: List[str] = []
+        for sym in self._dirty:
+            flow = self.flows.get(sym)
+            if flow is None:
+                continue
+            flow.advance(now_min)
+            score = flow.score()
+            if score <= 0.0 or flow.sums[30][3] <= 0:
+                gone.append(sym)
+                del self.flows[sym]
+                self._removed.add(sym)
+            else:
+                scores[sym] = round(score, 2)
+                stats[sym] = json.dumps(flow.stats())
+        self._dirty.clear()
+        return scores, stats, gone
+
+    def flush(self, r: redis.Redis, now: Optional[float] = None, full: bool = False) -> int:
+        """
+        Write changed scores in one pipeline; returns how many symbols changed.
+        `full` (after a rebuild) also drops published symbols this engine
+        doesn't know, without ever emptying the ranking readers see.
+        """
+        now = time.time() if now is None else now
+        if full:
+            self._dirty.update(self.flows)
+        scores, stats, gone = self.changes(int(now) // 60)
+        if full:
+            gone += [s for s in r.zrange(HOTSET_ZSET, 0, -1) if s not in self.flows and s not in gone]
+        pipe = r.pipeline(transaction=False)
+        if scores:
+            pipe.zadd(HOTSET_ZSET, scores)
+            pipe.hset(HOTSET_STATS, mapping=stats)
+        if gone:
+            pipe.zrem(HOTSET_ZSET, *gone)
+            pipe.hdel(HOTSET_STATS, *gone)
+        pipe.set(HOTSET_UPDATED, datetime.fromtimestamp(now, tz=timezone.utc).isoformat())
+        pipe.execute()
+        return len(scores) + len(gone)
+
+
+class HotsetConsumer:
+    """
+    Tails the tape stream into a HotsetEngine, safely from any number of
+    worker processes: a run holds fs:hotset:lock (runs that can't get it are
+    skipped) and ends by checkpointing the cursor plus the rings of the
+    symbols that run changed. A process whose local engine is behind the
+    latest checkpoint reloads only the symbols listed in fs:hotset:changes
+    since its own revision (all rings if it fell off the capped stream); with
+    no checkpoint at all, the last 30 minutes still held in the stream are
+    replayed and the ranking is reconciled in place.
+    """
+
+    def __init__(self, r: redis.Redis) -> None:
+        self.r = r
+        self.engine = HotsetEngine()
+        self.cursor: Optional[str] = None
+        self.rev: Optional[str] = None   # checkpoint the local engine matches
+
+    def run_once(self, max_prints: int = 50_000, now: Optional[float] = None) -> dict:
+        now = time.time() if now is None else now
+        token = uuid.uuid4().hex
+        if not self.r.set(HOTSET_LOCK, token, nx=True, ex=LOCK_TTL):
+            return {"skipped": "another process is scoring"}
+        try:
+            rebuilt = self._sync(now)
+            consumed = 0
+            while consumed < max_prints:
+                items, self.cursor = read_since(self.r, self.cursor, MAX_PAGE)
+                consumed += self.engine.add_prints(items)
+                if len(items) < MAX_PAGE:
+                    break
+            changed = self.engine.flush(self.r, now, full=rebuilt)
+            self._checkpoint(full=rebuilt)
+        finally:
+            release_token(self.r, HOTSET_LOCK, token)
+        return {"prints": consumed, "changed": changed, "symbols": len(self.engine.flows), "cursor": self.cursor}
+
+    def _sync(self, now: float) -> bool:
+        """Bring the local engine up to the checkpoint; True if it was rebuilt from the stream."""
+        rev, cursor, clock = self.r.hmget(HOTSET_STATE, "rev", "cursor", "clock")
+        if rev is None:
+            self.engine = HotsetEngine()
+            self.cursor = f"{int((now - _SLOTS * 60) * 1000)}-0"
+            self.rev = None
+            return True
+        if rev == self.rev:
+            return False
+        symbols = self._changed_since(self.rev)
+        if symbols is None:
+            self.engine = HotsetEngine()
+            for sym, ring in self.r.hgetall(HOTSET_RINGS).items():
+                self.engine.put(sym, json.loads(ring))
+        elif symbols:
+            for sym, ring in zip(symbols, self.r.hmget(HOTSET_RINGS, symbols)):
+                if ring is None:
+                    self.engine.drop(sym)
+                else:
+                    self.engine.put(sym, json.loads(ring))
+        self.engine._clock = int(clock) if clock else None
+        self.engine.take_changes()   # what we just loaded is already checkpointed
+        self.cursor, self.rev = cursor, rev
+        return False
+
+    def _changed_since(self, rev: Optional[str]) -> Optional[List[str]]:
+        """Symbols written by checkpoints after `rev`; None if `rev` isn't in the change log."""
+        if rev is None:
+            return None
+        entries = self.r.xrange(HOTSET_CHANGES, min=rev, max="+")
+        if not entries or entries[0][0] != rev:
+            return None
+        symbols: Set[str] = set()
+        for _, fields in entries[1:]:
+            symbols.update(json.loads(fields["symbols"]))
+        return sorted(symbols)
+
+    def _checkpoint(self, full: bool = False) -> None:
+        """Write the changed rings and the new revision in one MULTI."""
+        rings, gone = self.engine.take_changes()
+        if full:
+            rings = {s: f.ring() for s, f in self.engine.flows.items()}
+        pipe = self.r.pipeline()
+        if full:
+            # Older revisions can't catch up by symbol across a rebuild
+            pipe.delete(HOTSET_RINGS, HOTSET_CHANGES)
+        if rings:
+            pipe.hset(HOTSET_RINGS, mapping={s: json.dumps(r) for s, r in rings.items()})
+        if gone:
+            pipe.hdel(HOTSET_RINGS, *gone)
+        pipe.eval(_COMMIT, 2, HOTSET_CHANGES, HOTSET_STATE, CHANGES_MAXLEN,
+                  json.dumps([*rings, *gone]), self.cursor or "", "" if self.engine._clock is None else self.engine._clock)
+        self.rev = pipe.execute()[-1]
+
+
+# Log the checkpoint and point the state at it; the log entry's ID is the revision
+_COMMIT = """
+local rev = redis.call('XADD', KEYS[1], 'MAXLEN', '~', ARGV[1], '*', 'symbols', ARGV[2])
+redis.call('HSET', KEYS[2], 'rev', rev, 'cursor', ARGV[3], 'clock', ARGV[4])
+return rev
+"""
+
+
+def top(r: redis.Redis, n: int, with_stats: bool = False) -> dict:
+    """Top-n ranking: one ZREVRANGE (+ the flush time) in a single round trip."""
+    pipe = r.pipeline(transaction=False)
+    pipe.zrevrange(HOTSET_ZSET, 0, n - 1, withscores=True)
+    pipe.get(HOTSET_UPDATED)
+    ranked, updated = pipe.execute()
+    items = [{"symbol": s, "score": score, "updated": updated} for s, score in ranked]
+    if with_stats and items:
+        for item, raw in zip(items, r.hmget(HOTSET_STATS, [i["symbol"] for i in items])):
+            item["stats"] = json.loads(raw) if raw else None
+    return {"items": items, "updated": updated}
@@ -0,0 +1,448 @@
+# api/indicators.py
+"""
+Technical indicators over array-backed bars (providers.series.BarColumns).
+
+- IndicatorEngine.compute(cols) evaluates every requested indicator in one
+  vectorized pass and leaves each indicator's running state (EMA seeds,
+  rolling windows, VWAP session sums) at the last bar.
+- IndicatorEngine.update(...) then advances all of them in O(1) per bar.
+  Re-sending the last timestamp replaces the still-forming bar instead of
+  appending, matching incremental OHLC refresh.
+
+Spec strings (comma-separated): sma20, ema50, rsi14, macd (12/26/9) or
+macd_12_26_9, vwap, bb20 (2 std) or bb20_2.
+"""
+from __future__ import annotations
+from typing import Dict, List, Optional, Tuple
+from collections import OrderedDict, deque
+import logging
+import re
+import threading
+
+import numpy as np
+import pandas as pd
+
+from providers.series import BarColumns
+
+MAX_INDICATORS = 16
+
+log = logging.getLogger(__name__)
+
+
+# ---------- vectorized building blocks ----------
+
+def _sma(x: np.ndarray, n: int) -> np.ndarray:
+    out = np.full(len(x), np.nan)
+    if len(x) >= n:
+        c = np.cumsum(np.r_[0.0, x])
+        out[n - 1:] = (c[n:] - c[:-n]) / n
+    return out
+
+
+def _ema(x: np.ndarray, alpha: float) -> np.ndarray:
+    # adjust=False is the classic recursive EMA seeded with the first value
+    return pd.Series(x).ewm(alpha=alpha, adjust=False).mean().to_numpy()
+
+
+def _shallow(obj):
+    """copy.copy without the reduce protocol; state snapshots run once per bar."""
+    c = object.__new__(type(obj))
+    c.__dict__.update(obj.__dict__)
+    return c
+
+
+# ---------- indicators (batch + O(1) step) ----------
+
+class _SMA:
+    def __init__(self, n: int) -> None:
+        self.n = n
+        self.window: deque = deque(maxlen=n)
+        self.total = 0.0
+
+    def names(self) -> List[str]:
+        return [f"sma{self.n}"]
+
+    def clone(self) -> "_SMA":
+        c = _shallow(self)
+        c.window = self.window.copy()
+        return c
+
+    def batch(self, cols: BarColumns) -> Dict[str, np.ndarray]:
+        tail = cols.c[-self.n:].tolist()
+        self.window = deque(tail, maxlen=self.n)
+        self.total = float(sum(tail))
+        return {f"sma{self.n}": _sma(cols.c, self.n)}
+
+    def step(self, t, h, l, c, v) -> Dict[str, float]:
+        if len(self.window) == self.n:
+            self.total -= self.window[0]
+        self.window.append(c)
+        self.total += c
+        val = self.total / self.n if len(self.window) == self.n else np.nan
+        return {f"sma{self.n}": val}
+
+
+class _EMA:
+    def __init__(self, n: int, key: Optional[str] = None) -> None:
+        self.n = n
+        self.alpha = 2.0 / (n + 1)
+        self.key = key or f"ema{n}"
+        self.value: Optional[float] = None
+
+    def names(self) -> List[str]:
+        return [self.key]
+
+    def clone(self) -> "_EMA":
+        return _shallow(self)
+
+    def batch_values(self, x: np.ndarray) -> np.ndarray:
+        out = _ema(x, self.alpha) if len(x) else np.array([])
+        self.value = float(out[-1]) if len(out) else None
+        return out
+
+    def step_value(self, x: float) -> float:
+        self.value = x if self.value is None else self.value + self.alpha * (x - self.value)
+        return self.value
+
+    def batch(self, cols: BarColumns) -> Dict[str, np.ndarray]:
+        return {self.key: self.batch_values(cols.c)}
+
+    def step(self, t, h, l, c, v) -> Dict[str, float]:
+        return {self.key: self.step_value(c)}
+
+
+class _RSI:
+    """Wilder's RSI: smoothed average gain / loss with alpha = 1/n."""
+
+    def __init__(self, n: int) -> None:
+        self.n = n
+        self.alpha = 1.0 / n
+        self.prev_close: Optional[float] = None
+        self.gain: Optional[float] = None
+        self.loss: Optional[float] = None
+        self.count = 0
+
+    def names(self) -> List[str]:
+        return [f"rsi{self.n}"]
+
+    def clone(self) -> "_RSI":
+        return _shallow(self)
+
+    @staticmethod
+    def _rsi(gain, loss):
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return np.where(loss == 0, 100.0, 100.0 - 100.0 / (1.0 + gain / loss))
+
+    def batch(self, cols: BarColumns) -> Dict[str, np.ndarray]:
+        c = cols.c
+        out = np.full(len(c), np.nan)
+        self.count = len(c)
+        self.prev_close = float(c[-1]) if len(c) else None
+        if len(c) < 2:
+            return {f"rsi{self.n}": out}
+        d = np.diff(c)
+        gain = _ema(np.maximum(d, 0.0), self.alpha)
+        loss = _ema(np.maximum(-d, 0.0), self.alpha)
+        self.gain, self.loss = float(gain[-1]), float(loss[-1])
+        rsi = self._rsi(gain, loss)
+        rsi[: self.n - 1] = np.nan   # warm-up
+        out[1:] = rsi
+        return {f"rsi{self.n}": out}
+
+    def step(self, t, h, l, c, v) -> Dict[str, float]:
+        self.count += 1
+        if self.prev_close is None:
+            self.prev_close = c
+            return {f"rsi{self.n}": np.nan}
+        d = c - self.prev_close
+        self.prev_close = c
+        g, lo = max(d, 0.0), max(-d, 0.0)
+        if self.gain is None:
+            self.gain, self.loss = g, lo
+        else:
+            self.gain += self.alpha * (g - self.gain)
+            self.loss += self.alpha * (lo - self.loss)
+        if self.count <= self.n:
+            return {f"rsi{self.n}": np.nan}
+        rsi = 100.0 if self.loss == 0 else 100.0 - 100.0 / (1.0 + self.gain / self.loss)
+        return {f"rsi{self.n}": rsi}
+
+
+class _MACD:
+    def __init__(self, fast: int = 12, slow: int = 26, signal: int = 9) -> None:
+        self.prefix = "macd" if (fast, slow, signal) == (12, 26, 9) else f"macd_{fast}_{slow}_{signal}"
+        self.fast, self.slow, self.sig = _EMA(fast), _EMA(slow), _EMA(signal)
+
+    def names(self) -> List[str]:
+        return [self.prefix, f"{self.prefix}_signal", f"{self.prefix}_hist"]
+
+    def clone(self) -> "_MACD":
+        c = _shallow(self)
+        c.fast, c.slow, c.sig = self.fast.clone(), self.slow.clone(), self.sig.clone()
+        return c
+
+    def batch(self, cols: BarColumns) -> Dict[str, np.ndarray]:
+        line = self.fast.batch_values(cols.c) - self.slow.batch_values(cols.c)
+        signal = self.sig.batch_values(line)
+        return {self.prefix: line, f"{self.prefix}_signal": signal, f"{self.prefix}_hist": line - signal}
+
+    def step(self, t, h, l, c, v) -> Dict[str, float]:
+        line = self.fast.step_value(c) - self.slow.step_value(c)
+        signal = self.sig.step_value(line)
+        return {self.prefix: line, f"{self.prefix}_signal": signal, f"{self.prefix}_hist": line - signal}
+
+
+class _VWAP:
+    """Session VWAP on typical price, reset at each UTC day boundary."""
+
+    def __init__(self) -> None:
+        self.day: Optional[int] = None
+        self.pv = 0.0
+        self.vol = 0.0
+
+    def names(self) -> List[str]:
+        return ["vwap"]
+
+    def clone(self) -> "_VWAP":
+        return _shallow(self)
+
+    def batch(self, cols: BarColumns) -> Dict[str, np.ndarray]:
+        if len(cols) == 0:
+            return {"vwap": np.array([])}
+        tp = (cols.h + cols.l + cols.c) / 3.0
+        vol = np.nan_to_num(cols.v)
+        day = cols.t // 86400
+        starts = np.r_[0, np.flatnonzero(np.diff(day)) + 1]
+        # Cumulative sums that restart at each session start
+        cpv, cv = np.cumsum(tp * vol), np.cumsum(vol)
+        seg = np.repeat(np.arange(len(starts)), np.diff(np.r_[starts, len(cols)]))
+        base_pv = np.r_[0.0, cpv][starts][seg]
+        base_v = np.r_[0.0, cv][starts][seg]
+        pv, v = cpv - base_pv, cv - base_v
+        self.day, self.pv, self.vol = int(day[-1]), float(pv[-1]), float(v[-1])
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return {"vwap": np.where(v > 0, pv / v, np.nan)}
+
+    def step(self, t, h, l, c, v) -> Dict[str, float]:
+        day = int(t) // 86400
+        if day != self.day:
+            self.day, self.pv, self.vol = day, 0.0, 0.0
+        vol = 0.0 if v is None or v != v else float(v)   # v != v: NaN
+        self.pv += (h + l + c) / 3.0 * vol
+        self.vol += vol
+        return {"vwap": self.pv / self.vol if self.vol > 0 else np.nan}
+
+
+class _Bollinger:
+    def __init__(self, n: int = 20, k: float = 2.0) -> None:
+        self.n, self.k = n, k
+        self.prefix = f"bb{n}" if k == 2.0 else f"bb{n}_{k:g}"
+        self.window: deque = deque(maxlen=n)
+        self.s1 = 0.0
+        self.s2 = 0.0
+
+    def names(self) -> List[str]:
+        return [f"{self.prefix}_mid", f"{self.prefix}_upper", f"{self.prefix}_lower"]
+
+    def clone(self) -> "_Bollinger":
+        c = _shallow(self)
+        c.window = self.window.copy()
+        return c
+
+    def _bands(self, mid, std):
+        return {
+            f"{self.prefix}_mid": mid,
+            f"{self.prefix}_upper": mid + self.k * std,
+            f"{self.prefix}_lower": mid - self.k * std,
+        }
+
+    def batch(self, cols: BarColumns) -> Dict[str, np.ndarray]:
+        x = cols.c
+        mid = _sma(x, self.n)
+        var = np.maximum(_sma(x * x, self.n) - mid * mid, 0.0)
+        tail = x[-self.n:].tolist()
+        self.window = deque(tail, maxlen=self.n)
+        self.s1, self.s2 = float(sum(tail)), float(sum(v * v for v in tail))
+        return self._bands(mid, np.sqrt(var))
+
+    def step(self, t, h, l, c, v) -> Dict[str, float]:
+        if len(self.window) == self.n:
+            old = self.window[0]
+            self.s1 -= old
+            self.s2 -= old * old
+        self.window.append(c)
+        self.s1 += c
+        self.s2 += c * c
+        if len(self.window) < self.n:
+            return self._bands(np.nan, np.nan)
+        mid = self.s1 / self.n
+        return self._bands(mid, max(self.s2 / self.n - mid * mid, 0.0) ** 0.5)
+
+
+# ---------- spec parsing ----------
+
+_SPEC = re.compile(r"^(sma|ema|rsi|bb|macd|vwap)(\d*)((?:_[\d.]+)*)$")
+
+
+def parse_spec(spec: str) -> List[object]:
+    """'sma20,rsi14,macd' -> indicator objects. Raises ValueError on bad input."""
+    out: List[object] = []
+    for raw in (s.strip().lower() for s in spec.split(",")):
+        if not raw:
+            continue
+        m = _SPEC.match(raw)
+        if not m:
+            raise ValueError(f"unknown indicator: {raw}")
+        kind, n, extra = m.group(1), m.group(2), [p for p in m.group(3).split("_") if p]
+        if kind == "vwap":
+            out.append(_VWAP())
+        elif kind == "macd":
+            if n:
+                raise ValueError(f"use macd or macd_fast_slow_signal, not {raw}")
+            params = [int(p) for p in extra] or [12, 26, 9]
+            if len(params) != 3:
+                raise ValueError(f"macd needs three periods: {raw}")
+            out.append(_MACD(*params))
+        else:
+            if not n or not 1 <= int(n) <= 1000:
+                raise ValueError(f"{kind} needs a period between 1 and 1000: {raw}")
+            if kind == "sma":
+                out.append(_SMA(int(n)))
+            elif kind == "ema":
+                out.append(_EMA(int(n)))
+            elif kind == "rsi":
+                out.append(_RSI(int(n)))
+            else:
+                out.append(_Bollinger(int(n), float(extra[0]) if extra else 2.0))
+    if len(out) > MAX_INDICATORS:
+        raise ValueError(f"at most {MAX_INDICATORS} indicators")
+    return out
+
+
+# ---------- engine ----------
+
+class IndicatorEngine:
+    """Batch + incremental evaluation of a set of indicators over one series."""
+
+    def __init__(self, spec: str) -> None:
+        self.spec = spec
+        self._inds = parse_spec(spec)
+        self._before_last: Optional[List[object]] = None
+        self.last_t: Optional[int] = None
+
+    def names(self) -> List[str]:
+        return [n for ind in self._inds for n in ind.names()]
+
+    def compute(self, cols: BarColumns) -> Dict[str, np.ndarray]:
+        """Full pass. State ends at the last bar, which stays replaceable."""
+        if len(cols) == 0:
+            return {n: np.array([]) for n in self.names()}
+        head = cols.between(None, int(cols.t[-1]))
+        out: Dict[str, np.ndarray] = {}
+        for ind in self._inds:
+            out.update(ind.batch(head))
+        last = self.update(int(cols.t[-1]), cols.h[-1], cols.l[-1], cols.c[-1], float(cols.v[-1]))
+        return {k: np.r_[v, last[k]] for k, v in out.items()}
+
+    def update(self, t: int, h: float, l: float, c: float, v: float | None) -> Dict[str, float]:
+        """Advance by one bar in O(1); same `t` as the previous call replaces that bar."""
+        if self.last_t is not None and t == self.last_t and self._before_last is not None:
+            self._inds = [ind.clone() for ind in self._before_last]
+        else:
+            self._before_last = [ind.clone() for ind in self._inds]
+        self.last_t = t
+        out: Dict[str, float] = {}
+        for ind in self._inds:
+            out.update(ind.step(t, float(h), float(l), float(c), v))
+        return out
+
+
+class IndicatorCache:
+    """
+    Per-process LRU of (series key, spec) -> engine + last output, so a series
+    that only grew by a few bars (incremental refresh) is updated in O(new bars)
+    instead of recomputed. Only appends qualify: EMA/RSI/MACD depend on where
+    the series starts, so a series whose front was trimmed is recomputed.
+    Every `parity_every`-th incremental result is checked against a full pass
+    (0 disables); on a mismatch the full result wins and the drift is logged.
+    """
+
+    def __init__(self, maxsize: int = 256, max_incremental: int = 500, parity_every: int = 100) -> None:
+        self.maxsize = maxsize
+        self.max_incremental = max_incremental
+        self.parity_every = parity_every
+        self._extended = 0
+        self._data: "OrderedDict[Tuple, Tuple[IndicatorEngine, np.ndarray, Dict[str, np.ndarray]]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def evaluate(self, key: Tuple, spec: str, cols: BarColumns) -> Dict[str, np.ndarray]:
+        ck = (*key, spec)
+        with self._lock:
+            hit = self._data.pop(ck, None)
+
+        out = self._extend(hit, cols) if hit is not None else None
+        if out is None:
+            engine = IndicatorEngine(spec)
+            out = engine.compute(cols)
+        else:
+            engine = hit[0]
+            if self._parity_due():
+                engine, out = self._check_parity(key, spec, cols, engine, out)
+
+        with self._lock:
+            self._data[ck] = (engine, cols.t, out)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+        return out
+
+    def _parity_due(self) -> bool:
+        if self.parity_every <= 0:
+            return False
+        with self._lock:
+            self._extended += 1
+            return self._extended % self.parity_every == 0
+
+    def _check_parity(self, key: Tuple, spec: str, cols: BarColumns, engine: IndicatorEngine,
+                      out: Dict[str, np.ndarray]) -> Tuple[IndicatorEngine, Dict[str, np.ndarray]]:
+        fresh = IndicatorEngine(spec)
+        full = fresh.compute(cols)
+        drifted = [k for k in full if not np.allclose(out[k], full[k], rtol=1e-9, atol=1e-9, equal_nan=True)]
+        if not drifted:
+            return engine, out
+        log.warning("incremental indicators drifted from a full pass for %s %s: %s", key, spec, ", ".join(drifted))
+        return fresh, full
+
+    def _extend(self, hit, cols: BarColumns) -> Optional[Dict[str, np.ndarray]]:
+        engine, old_t, old_out = hit
+        if len(cols) == 0 or len(old_t) == 0 or engine.last_t is None:
+            return None
+        # The new series must contain our last bar and agree with us from its start
+        pos = int(np.searchsorted(cols.t, engine.last_t))
+        if pos >= len(cols) or cols.t[pos] != engine.last_t:
+            return None
+        # Same first bar as before: a trimmed front changes every path-dependent value
+        if old_t[0] != cols.t[0] or len(old_t) != pos + 1:
+            return None
+        if len(cols) - pos > self.max_incremental:
+            return None
+
+        new_vals: Dict[str, List[float]] = {k: [] for k in old_out}
+        for i in range(pos, len(cols)):
+            step = engine.update(int(cols.t[i]), cols.h[i], cols.l[i], cols.c[i], float(cols.v[i]))
+            for k, v in step.items():
+                new_vals[k].append(v)
+        # Bars before `pos` are final; `pos` itself was the forming bar
+        return {k: np.r_[old_out[k][:-1], new_vals[k]] for k in old_out}
+
+
+def to_json_lists(values: Dict[str, np.ndarray], decimals: int = 4) -> Dict[str, List[float | None]]:
+    """NaN -> None, rounded, ready for JSON."""
+    out: Dict[str, List[float | None]] = {}
+    for k, arr in values.items():
+        arr = np.round(np.asarray(arr, dtype=np.float64), decimals)
+        lst = arr.tolist()
+        nan = np.isnan(arr)
+        if nan.any():
+            lst = [None if m else x for x, m in zip(lst, nan.tolist())]
+        out[k] = lst
+    return out
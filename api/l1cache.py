@@ -0,0 +1,339 @@
+# api/l1cache.py
+"""
+In-process L1 cache in front of Redis.
+
+L1Cache holds already-decoded values in an LRU bounded by entry count and
+approximate bytes, each with its own expiry. TwoTierCache puts it in front of
+a Redis client: reads try L1, then one pipelined GET+TTL, and keep the value
+in L1 no longer than Redis still would. Writes go to Redis, refresh the local
+copy and broadcast the key on fs:pub:invalidate so other API processes drop
+theirs. If the invalidation listener loses Redis it clears L1 on reconnect,
+since messages may have been missed; the short L1 TTL bounds staleness while
+it's down.
+"""
+from __future__ import annotations
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+import asyncio
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+
+import redis
+import redis.asyncio as aioredis
+
+from metrics import counter
+
+log = logging.getLogger(__name__)
+
+INVALIDATE_CHANNEL = "fs:pub:invalidate"   # message: {"origin", "keys"} or {"origin", "prefix"}
+L1_TTL = 5.0                               # seconds; upper bound on cross-process staleness
+L1_MAX_ENTRIES = 10_000
+L1_MAX_BYTES = 64 * 1024 * 1024
+
+_MISS = object()
+
+# TwoTierCache reads by where they were answered: l1, redis, or miss
+CACHE_READS = counter("cache_reads_total", "Two-tier cache reads by the tier that answered.", ("tier",))
+_L1_HIT, _REDIS_HIT, _MISSED = (CACHE_READS.labels(t) for t in ("l1", "redis", "miss"))
+
+
+def _approx_size(value: Any) -> int:
+    if isinstance(value, (str, bytes, bytearray)):
+        return len(value) + 64
+    try:
+        return len(json.dumps(value, separators=(",", ":"), default=str)) + 64
+    except (TypeError, ValueError):
+        return 1024
+
+
+class L1Cache:
+    """Thread-safe TTL + LRU map; `get` returns `default` for missing or expired keys."""
+
+    def __init__(
+        self,
+        max_entries: int = L1_MAX_ENTRIES,
+        max_bytes: int = L1_MAX_BYTES,
+        ttl: float = L1_TTL,
+    ) -> None:
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._data: "OrderedDict[str, Tuple[Any, float, int]]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, key: str, default: Any = None) -> Any:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None or entry[1] <= now:
+                if entry is not None:
+                    self._drop(key)
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None, size: Optional[int] = None) -> None:
+        ttl = self.ttl if ttl is None else min(ttl, self.ttl)
+        if ttl <= 0:
+            return
+        size = _approx_size(value) if size is None else size
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._data:
+                self._drop(key)
+            self._data[key] = (value, time.monotonic() + ttl, size)
+            self._bytes += size
+            while len(self._data) > self.max_entries or self._bytes > self.max_bytes:
+                oldest = next(iter(self._data))
+                self._drop(oldest)
+                self.evictions += 1
+
+    def invalidate(self, keys: Iterable[str]) -> None:
+        with self._lock:
+            for key in keys:
+                if key in self._data:
+                    self._drop(key)
+                    self.invalidations += 1
+
+    def invalidate_prefix(self, prefix: str) -> None:
+        with self._lock:
+            for key in [k for k in self._data if k.startswith(prefix)]:
+                self._drop(key)
+                self.invalidations += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+            self._bytes = 0
+
+    def _drop(self, key: str) -> None:
+        _, _, size = self._data.pop(key)
+        self._bytes -= size
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._data),
+            "bytes": self._bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else None,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+        }
+
+
+def publish_invalidation(r: redis.Redis, keys: Iterable[str] = (), prefix: Optional[str] = None, origin: str = "") -> int:
+    """Tell every API process to drop its L1 copies (used by Celery writers too)."""
+    msg: Dict[str, Any] = {"origin": origin}
+    if prefix is not None:
+        msg["prefix"] = prefix
+    else:
+        msg["keys"] = list(keys)
+        if not msg["keys"]:
+            return 0
+    return int(r.publish(INVALIDATE_CHANNEL, json.dumps(msg)))
+
+
+class TwoTierCache:
+    """
+    L1 (this process) over L2 (Redis). Values are strings in Redis; `decode`
+    turns them into what L1 keeps (json.loads for JSON payloads, identity for
+    plain strings), so hits skip both the round trip and the parse.
+
+    L1 entries remember when the Redis copy expires, so callers that report a
+    TTL get it without asking Redis. Sync methods are for threadpool endpoints
+    and workers, the `a*` ones for async endpoints.
+    """
+
+    def __init__(
+        self,
+        redis_client: redis.Redis,
+        aredis_client: aioredis.Redis,
+        redis_url: str,
+        l1: Optional[L1Cache] = None,
+    ) -> None:
+        self.r = redis_client
+        self.ar = aredis_client
+        self.redis_url = redis_url
+        self.l1 = l1 or L1Cache()
+        self.origin = f"{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._task: Optional[asyncio.Task] = None
+
+    # ---------- L1 ----------
+
+    def _l1_get(self, key: str) -> Tuple[Any, int]:
+        entry = self.l1.get(key, _MISS)
+        if entry is _MISS:
+            return _MISS, -2
+        _L1_HIT.inc()
+        value, deadline = entry
+        return value, -1 if deadline is None else max(0, round(deadline - time.monotonic()))
+
+    def _l1_put(self, key: str, value: Any, ttl: int, size: int) -> None:
+        # Never outlive the Redis copy; keys without expiry get the L1 default
+        deadline = None if ttl < 0 else time.monotonic() + ttl
+        self.l1.set(key, (value, deadline), None if ttl < 0 else ttl, size=size + 64)
+
+    def remember(self, key: str, value: Any, ttl: Optional[float] = None, size: Optional[int] = None) -> None:
+        """L1-only entry for values computed from Redis (e.g. a tape page)."""
+        self.l1.set(key, (value, None), ttl, size)
+
+    def peek(self, key: str) -> Any:
+        """L1 only; None on a miss."""
+        value, _ = self._l1_get(key)
+        if value is _MISS:
+            _MISSED.inc()
+            return None
+        return value
+
+    # ---------- sync ----------
+
+    def get(self, key: str, decode: Callable[[str], Any] = lambda s: s) -> Any:
+        return self.get_with_ttl(key, decode)[0]
+
+    def get_with_ttl(self, key: str, decode: Callable[[str], Any] = lambda s: s) -> Tuple[Any, int]:
+        """(value, Redis TTL); one pipelined GET+TTL on an L1 miss."""
+        value, ttl = self._l1_get(key)
+        if value is not _MISS:
+            return value, ttl
+        pipe = self.r.pipeline(transaction=False)
+        pipe.get(key)
+        pipe.ttl(key)
+        return self._fill(key, *pipe.execute(), decode)
+
+    def set(self, key: str, raw: str, ttl: int, value: Any = _MISS) -> bool:
+        """Write `raw` to Redis; `value` is its decoded form for L1 (defaults to `raw`)."""
+        ok = bool(self.r.set(key, raw, ex=ttl))
+        self._after_set(key, raw, ttl, value)
+        publish_invalidation(self.r, [key], origin=self.origin)
+        return ok
+
+    # ---------- async ----------
+
+    async def aget_with_ttl(self, key: str, decode: Callable[[str], Any] = lambda s: s) -> Tuple[Any, int]:
+        value, ttl = self._l1_get(key)
+        if value is not _MISS:
+            return value, ttl
+        pipe = self.ar.pipeline(transaction=False)
+        pipe.get(key)
+        pipe.ttl(key)
+        return self._fill(key, *await pipe.execute(), decode)
+
+    async def aget(self, key: str, decode: Callable[[str], Any] = lambda s: s) -> Any:
+        return (await self.aget_with_ttl(key, decode))[0]
+
+    async def aset(self, key: str, raw: str, ttl: int, value: Any = _MISS) -> bool:
+        pipe = self.ar.pipeline(transaction=False)
+        pipe.set(key, raw, ex=ttl)
+        pipe.publish(INVALIDATE_CHANNEL, json.dumps({"origin": self.origin, "keys": [key]}))
+        ok, _ = await pipe.execute()
+        self._after_set(key, raw, ttl, value)
+        return bool(ok)
+
+    async def aget_many(self, keys: List[str], decode: Callable[[str], Any] = lambda s: s) -> Dict[str, Any]:
+        """
+        Values for the keys that exist: L1 first, then one round trip for the
+        rest (MGET + their TTLs, pipelined). Missing keys are left out.
+        """
+        found: Dict[str, Any] = {}
+        misses: List[str] = []
+        for key in keys:
+            value, _ = self._l1_get(key)
+            if value is _MISS:
+                misses.append(key)
+            else:
+                found[key] = value
+        if misses:
+            pipe = self.ar.pipeline(transaction=False)
+            pipe.mget(misses)
+            for key in misses:
+                pipe.ttl(key)
+            raws, *ttls = await pipe.execute()
+            for key, raw, ttl in zip(misses, raws, ttls):
+                value, _ = self._fill(key, raw, ttl, decode)   # counts the hit or miss
+                if raw is not None:
+                    found[key] = value
+        return found
+
+    # ---------- shared ----------
+
+    def _fill(self, key: str, raw: Optional[str], ttl: Optional[int], decode) -> Tuple[Any, int]:
+        ttl = int(ttl) if ttl is not None else -2
+        if raw is None:
+            _MISSED.inc()
+            return None, ttl
+        _REDIS_HIT.inc()
+        value = decode(raw)
+        self._l1_put(key, value, ttl, len(raw))
+        return value, ttl
+
+    def _after_set(self, key: str, raw: str, ttl: int, value: Any) -> None:
+        self._l1_put(key, raw if value is _MISS else value, ttl, len(raw))
+
+    # ---------- invalidation listener ----------
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._listen(), name="l1-invalidate")
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def _apply(self, data: str) -> None:
+        try:
+            msg = json.loads(data)
+        except ValueError:
+            return
+        if msg.get("origin") == self.origin:
+            return  # our own write; L1 already holds the new value
+        if "prefix" in msg:
+            self.l1.invalidate_prefix(msg["prefix"])
+        else:
+            self.l1.invalidate(msg.get("keys") or ())
+
+    async def _listen(self) -> None:
+        backoff = 0.5
+        while True:
+            client = aioredis.Redis.from_url(self.redis_url, decode_responses=True)
+            pubsub = client.pubsub(ignore_subscribe_messages=True)
+            try:
+                await pubsub.subscribe(INVALIDATE_CHANNEL)
+                self.l1.clear()   # anything cached while we weren't listening may be stale
+                backoff = 0.5
+                async for msg in pubsub.listen():
+                    if msg.get("type") == "message":
+                        self._apply(msg["data"])
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                log.warning("L1 invalidation listener lost Redis (%s); retrying in %.1fs", e, backoff)
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, 10.0)
+            finally:
+                try:
+                    await pubsub.aclose()
+                    await client.aclose()
+                except Exception:
+                    pass
@@ -1,39 +1,74 @@
 ﻿import os
 import json
 import asyncio
+import logging
 import time
-from typing import Optional
+from typing import List, Optional
 
-import redis
 from celery.result import AsyncResult
 from dotenv import load_dotenv
-from fastapi import FastAPI, Query
-from sqlalchemy import Column, Integer, String, create_engine, text
-from sqlalchemy.orm import Session, declarative_base
+from fastapi import FastAPI, HTTPException, Query, Request, Response, WebSocket, WebSocketDisconnect
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, Field
+from redis.exceptions import ConnectionError as RedisConnectionError
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
 from starlette.middleware.cors import CORSMiddleware
 
-from celery_app import celery_app, hello_task
+import stocks
+from celery_app import backfill_ohlc, celery_app, fetch_ohlc, hello_task
+from health import HealthMonitor, Probe
+from hotset import top as hotset_top
+from indicators import IndicatorCache, parse_spec, to_json_lists
+from l1cache import TwoTierCache
+from metrics import CONTENT_TYPE, REGISTRY, MetricsMiddleware, counter, gauge
+from models import Base, Stock
+from providers import AsyncProviderAdapter, build_provider
+from providers.base import Interval, Range, is_fallback
+from providers.caching_provider import FALLBACK_TTL, OHLC_TTL, quote_key
+from providers.series import BarColumns
+from queues import RETRY_AFTER, Backlogged, depths, enqueue
+from redis_client import REDIS_URL, ablocking, aredis, redis_client
+from singleflight import SingleFlight
+from streaming import StreamHub, parse_channels, parse_symbols
+from symbol_index import SymbolIndex, record_changes
+from tape import MAX_PAGE, MAX_POLL, TAPE_PAGE_PREFIX, read_since, valid_cursor, wait_since
+from wire import UnsupportedFormat, encode, etag_for, etag_matches, negotiate, series_version
 
 # Load environment variables from api/.env
 load_dotenv(override=True)
 
+log = logging.getLogger(__name__)
+
 # --- Config / Clients ---
 DATABASE_URL = os.getenv("DATABASE_URL")
-REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
 
 # SQLAlchemy engine
 engine = create_engine(DATABASE_URL, pool_pre_ping=True)
-Base = declarative_base()
 
-# Redis client (used by /healthz and /v1/*)
-redis_client = redis.Redis.from_url(REDIS_URL, decode_responses=True)
+# Redis: shared pools from redis_client.py; `aredis` for anything on the event loop
+
+# Two-tier cache for hot keys: per-process L1 over Redis, invalidated via pub/sub
+cache = TwoTierCache(redis_client, aredis, REDIS_URL)
+
+# Market data: cached provider stack, awaited off the event loop
+MAX_QUOTE_SYMBOLS = 500
+market = AsyncProviderAdapter(build_provider(redis_client))
+indicator_cache = IndicatorCache()
 
-# --- Example table ---
-class Stock(Base):
-    __tablename__ = "stocks"
-    id = Column(Integer, primary_key=True, index=True)
-    symbol = Column(String, unique=True, nullable=False)
-    name = Column(String, nullable=True)
+# One Redis pub/sub subscription per process, fanned out to stream clients
+stream_hub = StreamHub(REDIS_URL)
+STREAM_HEARTBEAT = 15.0  # seconds between keep-alives on idle streams
+
+# --- Tables (models.py, migrated by Alembic) ---
+# Input limits follow the column sizes, so bad rows are a 422 rather than a DB error
+SYMBOL_MAX = Stock.__table__.c.symbol.type.length
+NAME_MAX = Stock.__table__.c.name.type.length
+
+class StockIn(BaseModel):
+    symbol: str = Field(min_length=1, max_length=SYMBOL_MAX)
+    name: Optional[str] = Field(None, max_length=NAME_MAX)
 
 # --- FastAPI app ---
 app = FastAPI()
@@ -46,18 +81,51 @@ app.add_middleware(
     allow_methods=["GET", "POST", "OPTIONS"],
     allow_headers=["*"],
 )
+app.add_middleware(MetricsMiddleware)
+
+# ---------- Metrics ----------
+# GET /metrics -> Prometheus text; with METRICS_DIR set it merges every API and
+# worker process writing there (see metrics.py)
+DEMO_LATCH = counter("demo_latch_requests_total", "/demo-latch answers by source.", ("source",))
+gauge("l1_cache_entries", "Entries in this process's L1 cache.", mode="pid", fn=lambda: len(cache.l1))
+gauge("l1_cache_bytes", "Approximate bytes held by this process's L1 cache.", mode="pid",
+      fn=lambda: cache.l1.stats()["bytes"])
+
+@app.on_event("startup")
+async def start_metrics_flusher():
+    REGISTRY.start_flusher()
+
+@app.get("/metrics")
+def metrics_text():
+    return Response(content=REGISTRY.render(), media_type=CONTENT_TYPE)
 
 @app.on_event("startup")
 def on_startup():
     # Create tables automatically on startup if missing
     Base.metadata.create_all(bind=engine)
 
-# ---------- Basic health ----------
+@app.on_event("startup")
+async def start_stream_hub():
+    stream_hub.start()
+    cache.start()
+
+@app.on_event("shutdown")
+async def stop_stream_hub():
+    await stream_hub.stop()
+    await cache.stop()
+
+# ---------- Health ----------
+# /livez   cheap liveness: the process is up and serving (no I/O)
+# /readyz  readiness from the cached probe round: 503 unless db + redis are ok
+# /healthz full cached status with per-probe latency; never blocks on a probe
 @app.get("/health")
 def health():
     return {"status": "ok"}
 
-# ---------- Consolidated healthz (DB + Redis + Celery worker) ----------
+@app.get("/livez")
+async def livez():
+    return {"status": "ok"}
+
 def _check_db() -> None:
     with engine.connect() as conn:
         conn.execute(text("SELECT 1"))
@@ -70,29 +138,37 @@ def _check_worker() -> bool:
     pong = celery_app.control.ping(timeout=1.0)
     return bool(pong)
 
-@app.get("/healthz")
-def healthz():
-    status = {"db": "down", "redis": "down", "worker": "down"}
-
-    try:
-        _check_db()
-        status["db"] = "ok"
-    except Exception as e:
-        status["db_error"] = str(e)
+health_monitor = HealthMonitor([
+    Probe("db", _check_db, timeout=2.0),
+    Probe("redis", _check_redis, timeout=1.0),
+    Probe("worker", _check_worker, timeout=2.0, required=False),  # API serves cached data without one
+])
 
-    try:
-        _check_redis()
-        status["redis"] = "ok"
-    except Exception as e:
-        status["redis_error"] = str(e)
+@app.on_event("startup")
+async def start_health_monitor():
+    health_monitor.start()
 
-    try:
-        if _check_worker():
-            status["worker"] = "ok"
-    except Exception as e:
-        status["worker_error"] = str(e)
+@app.on_event("shutdown")
+async def stop_health_monitor():
+    await health_monitor.stop()
 
-    return status
+@app.get("/healthz")
+async def healthz():
+    snap = await health_monitor.snapshot()
+    # Flat "ok"/"down" per dependency, as before, plus the probe details
+    status = {name: ("ok" if r["status"] == "ok" else "down") for name, r in snap["probes"].items()}
+    for name, r in snap["probes"].items():
+        if r.get("error"):
+            status[f"{name}_error"] = r["error"]
+    return {**status, **snap}
+
+@app.get("/readyz")
+async def readyz(response: Response):
+    snap = await health_monitor.snapshot()
+    ready = health_monitor.ready(snap)
+    if not ready:
+        response.status_code = 503
+    return {"ready": ready, **snap}
 
 # ---------- ENV TEST ----------
 @app.get("/env-test")
@@ -117,25 +193,92 @@ def ping_db():
 
 # ---------- Stocks endpoints ----------
 @app.post("/stocks")
-def create_stock(symbol: str, name: str | None = None):
+def create_stock(
+    symbol: str = Query(..., min_length=1, max_length=SYMBOL_MAX),
+    name: str | None = Query(None, max_length=NAME_MAX),
+):
     with Session(engine) as db:
         s = Stock(symbol=symbol.upper(), name=name)
         db.add(s)
         db.commit()
         db.refresh(s)
+        record_changes(redis_client, [{"symbol": s.symbol, "name": s.name}])
         return {"id": s.id, "symbol": s.symbol, "name": s.name}
 
+@app.post("/stocks/bulk")
+def bulk_upsert_stocks(rows: List[StockIn]):
+    """Insert or update many symbols at once: [{"symbol": "AAPL", "name": "Apple Inc."}, ...]"""
+    if len(rows) > stocks.MAX_BULK:
+        raise HTTPException(status_code=413, detail=f"at most {stocks.MAX_BULK} rows per request")
+    normalized = stocks.normalize(r.model_dump() for r in rows)
+    result = stocks.bulk_upsert(engine, normalized)
+    record_changes(redis_client, normalized)
+    return result
+
 @app.get("/stocks")
-def list_stocks():
-    with Session(engine) as db:
-        rows = db.query(Stock).order_by(Stock.symbol).all()
-        return [{"id": r.id, "symbol": r.symbol, "name": r.name} for r in rows]
+def list_stocks(after: Optional[str] = None, limit: int = Query(100, ge=1, le=stocks.MAX_PAGE)):
+    """Keyset pages ordered by symbol; pass `next` back as `after` (null on the last page)."""
+    items, next_after = stocks.page(engine, after, limit)
+    return {"items": items, "next": next_after}
+
+@app.get("/stocks/search")
+def search_stocks(q: str = Query(..., min_length=1), limit: int = Query(stocks.SEARCH_LIMIT, ge=1, le=100)):
+    """Symbol prefix matches first, then fuzzy matches on symbol / company name."""
+    return stocks.search(engine, q, limit)
+
+# ---------- Symbol autocomplete (in-memory index, no DB per keystroke) ----------
+symbol_index = SymbolIndex(engine, redis_client)
+
+@app.on_event("startup")
+async def start_symbol_index():
+    symbol_index.start()
+
+@app.on_event("shutdown")
+async def stop_symbol_index():
+    await symbol_index.stop()
+
+@app.get("/v1/symbols/search")
+async def search_symbols(q: str = Query(..., min_length=1), limit: int = Query(10, ge=1, le=50)):
+    """Ranked matches: exact symbol, symbol prefix, then company-name word prefixes."""
+    if not symbol_index.ready:
+        raise HTTPException(status_code=503, detail="symbol index is loading")
+    return symbol_index.search(q, limit)
+
+# ---------- Celery task endpoints ----------
+# Enqueues are admission-checked against queue depth (503 + Retry-After when
+# backlogged) and de-duplicated on arguments: "status" is "duplicate" when an
+# identical task is already pending and its id is returned instead.
+MAX_BACKFILL_SYMBOLS = 500
+
+def _enqueue(task, *args):
+    try:
+        task_id, queued = enqueue(redis_client, task, args)
+    except Backlogged as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(RETRY_AFTER)})
+    return {"task_id": task_id, "status": "queued" if queued else "duplicate"}
 
-# ---------- Celery demo endpoints ----------
 @app.post("/tasks/hello")
 def run_hello(name: str = "world"):
-    job = hello_task.delay(name)
-    return {"task_id": job.id, "status": "queued"}
+    return _enqueue(hello_task, name)
+
+@app.post("/tasks/fetch")
+def run_fetch(symbol: str = Query(...), interval: Interval = Query("1d"), range_: Range = Query("1y", alias="range")):
+    """Load one chart into the cache on the interactive queue."""
+    return _enqueue(fetch_ohlc, symbol.strip().upper(), interval, range_)
+
+@app.post("/tasks/backfill")
+def run_backfill(symbols: str = Query(..., description="comma-separated"),
+                 interval: Interval = Query("1d"), range_: Range = Query("max", alias="range")):
+    """Bulk historical load on the backfill queue."""
+    syms = sorted({s.strip().upper() for s in symbols.split(",") if s.strip()})
+    if not syms or len(syms) > MAX_BACKFILL_SYMBOLS:
+        raise HTTPException(status_code=400, detail=f"1..{MAX_BACKFILL_SYMBOLS} symbols")
+    return _enqueue(backfill_ohlc, syms, interval, range_)
+
+@app.get("/tasks/queues")
+def task_queues():
+    """Waiting tasks per queue."""
+    return depths(redis_client)
 
 @app.get("/tasks/status/{task_id}")
 def task_status(task_id: str):
@@ -148,16 +291,203 @@ def task_status(task_id: str):
     return payload
 
 # ---------- API surface (read-only & cached) ----------
+# Tape lives in a capped Redis Stream; clients page with the last id they saw.
+# GET /v1/tape?since=<id>&limit=100        -> {"items": [...], "cursor": "<id>"}
+# GET /v1/tape/poll?since=<id>&timeout=25  -> same, but waits for new prints
+def _check_cursor(since: Optional[str]) -> None:
+    # Before it reaches Redis or a page-cache key
+    if not valid_cursor(since):
+        raise HTTPException(status_code=400, detail="since must be a stream id like 1700000000000-0")
+
 @app.get("/v1/tape")
-def get_tape():
-    """Return the mock tape array written by Celery Beat/Worker (key: fs:tape)."""
-    raw = redis_client.get("fs:tape")
-    if not raw:
-        return []
+def get_tape(since: Optional[str] = None, limit: int = Query(100, ge=1, le=MAX_PAGE)):
+    """Prints after `since` (oldest first); without `since`, the latest `limit` prints."""
+    _check_cursor(since)
+    key = f"{TAPE_PAGE_PREFIX}{since or ''}:{limit}"
+    page = cache.peek(key)
+    if page is None:
+        items, cursor = read_since(redis_client, since, limit)
+        page = {"items": items, "cursor": cursor}
+        cache.remember(key, page)
+    return page
+
+@app.get("/v1/tape/poll")
+async def poll_tape(
+    since: Optional[str] = None,
+    limit: int = Query(100, ge=1, le=MAX_PAGE),
+    timeout: float = Query(MAX_POLL, ge=0, le=MAX_POLL),
+):
+    """Long-poll: returns as soon as prints newer than `since` exist, or empty after `timeout`."""
+    _check_cursor(since)
     try:
-        return json.loads(raw)
-    except Exception:
-        return []
+        items, cursor = await wait_since(ablocking, since, limit, timeout)
+    except RedisConnectionError:
+        # Long-poll pool exhausted (or Redis away): tell the client to come back
+        raise HTTPException(status_code=503, detail="too many pollers", headers={"Retry-After": "1"})
+    return {"items": items, "cursor": cursor}
+
+@app.get("/v1/hotset")
+def get_hotset(n: int = Query(20, ge=1, le=200), stats: bool = False):
+    """Top-n symbols by recent options premium flow (scored by the refresh_hotset task)."""
+    return hotset_top(redis_client, n, with_stats=stats)
+
+@app.get("/v1/quotes")
+async def get_quotes(symbols: str = Query(..., description="Comma-separated, e.g. AAPL,MSFT")):
+    """Normalized quotes keyed by symbol; unknown symbols are simply absent."""
+    syms = list(dict.fromkeys(s.strip().upper() for s in symbols.split(",") if s.strip()))
+    if not syms:
+        raise HTTPException(status_code=400, detail="symbols is required")
+    if len(syms) > MAX_QUOTE_SYMBOLS:
+        raise HTTPException(status_code=400, detail=f"at most {MAX_QUOTE_SYMBOLS} symbols")
+    # Cached quotes straight from L1 / one MGET; only the rest go through the provider stack
+    keys = {s: quote_key(market.name, s) for s in syms}
+    cached = await cache.aget_many(list(keys.values()), decode=json.loads)
+    out = {s: cached[k] for s, k in keys.items() if cached.get(k) is not None}
+    missing = [s for s, k in keys.items() if k not in cached]  # "null" entries are known misses
+    if missing:
+        out.update(await market.get_quotes(missing))
+    return out
+
+def _indicators_for(symbol: str, interval: str, range_: str, spec: str, bars: list, version: str) -> dict:
+    """
+    Indicator values for `bars`, cached in Redis next to the bar series.
+    The key carries the series version (the one behind the ETag), so any
+    change to the bars, including the still-forming last one, gets new
+    values; misses are computed incrementally where possible.
+    """
+    if not bars:
+        return {}
+    key = f"fs:ind:{symbol}:{interval}:{range_}:{spec}:{version}"
+    cached = redis_client.get(key)
+    if cached is not None:
+        return json.loads(cached)
+    values = indicator_cache.evaluate(
+        (symbol, interval, range_), spec, BarColumns.from_bars(bars)
+    )
+    payload = to_json_lists(values)
+    ttl = FALLBACK_TTL if is_fallback(bars) else OHLC_TTL.get(interval, 60)
+    redis_client.set(key, json.dumps(payload), ex=ttl)
+    return payload
+
+@app.get("/v1/ohlc")
+async def get_ohlc(
+    request: Request,
+    symbol: str = Query(...),
+    interval: Interval = Query("1d"),
+    range_: Range = Query("1y", alias="range"),
+    indicators: Optional[str] = Query(None, description="e.g. sma20,ema50,rsi14,macd,vwap,bb20"),
+    format_: Optional[str] = Query(None, alias="format", description="json | columnar | msgpack | arrow"),
+):
+    """
+    OHLC bars for one symbol, oldest -> newest (see contract.md).
+    With `indicators`, returns {"bars": [...], "indicators": {name: [...]}}.
+    Format is negotiated via `format` or Accept; responses carry a strong
+    ETag and If-None-Match on an unchanged series gets a bare 304.
+    """
+    sym = symbol.strip().upper()
+    spec = None
+    if indicators:
+        spec = ",".join(s.strip().lower() for s in indicators.split(",") if s.strip())
+        try:
+            parse_spec(spec)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    try:
+        fmt = negotiate(format_, request.headers.get("accept"))
+    except UnsupportedFormat as e:
+        raise HTTPException(status_code=406, detail=str(e))
+
+    # Revalidation: compare against the version stored with the cache entry,
+    # without reading or decoding the bars
+    if_none_match = request.headers.get("if-none-match")
+    counted = bool(if_none_match)   # ohlc_version records the read for refresh-ahead
+    if if_none_match:
+        stored = await market.ohlc_version(sym, interval, range_)
+        if stored is not None:
+            etag = etag_for(stored, fmt, spec or "")
+            if etag_matches(if_none_match, etag):
+                return Response(status_code=304, headers={"ETag": etag, "Vary": "Accept", "Cache-Control": "no-cache"})
+
+    bars, version = await market.get_ohlc_versioned(sym, interval, range_, count=not counted)
+    version = version or series_version(bars)   # resampled: no stored version
+    etag = etag_for(version, fmt, spec or "")
+    headers = {"ETag": etag, "Vary": "Accept", "Cache-Control": "no-cache"}
+    if etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers=headers)
+
+    values = None
+    if spec:
+        values = await run_in_threadpool(_indicators_for, sym, interval, range_, spec, bars, version)
+    body, media_type = encode(bars, fmt, values)
+    return Response(content=body, media_type=media_type, headers=headers)
+
+# ---------- Streaming (tape + quotes, pushed from Redis pub/sub) ----------
+# WS  /v1/stream?symbols=AAPL,MSFT&channels=tape,quotes
+#     -> JSON arrays of {"type": "tape"|"quote", "data": {...}}; [{"type": "ping"}] when idle.
+#     Send {"symbols": "AAPL,NVDA"} (or null for all) to change the filter;
+#     anything else gets [{"type": "error", "data": "..."}] and is ignored.
+# GET /v1/stream/sse?symbols=...&channels=...  -> same events as text/event-stream
+@app.websocket("/v1/stream")
+async def stream_ws(ws: WebSocket, symbols: Optional[str] = None, channels: Optional[str] = None):
+    await ws.accept()
+    sub = stream_hub.subscribe(parse_symbols(symbols), parse_channels(channels))
+
+    async def read_filters():
+        # Only a disconnect ends this; bad input is answered, not fatal
+        while True:
+            try:
+                msg = json.loads(await ws.receive_text())
+            except ValueError:
+                msg = None
+            raw = msg.get("symbols", ()) if isinstance(msg, dict) else ()
+            if isinstance(raw, list) and all(isinstance(s, str) for s in raw):
+                raw = ",".join(raw)
+            if raw is None or isinstance(raw, str):
+                sub.set_symbols(parse_symbols(raw))
+            else:
+                await ws.send_json([{"type": "error", "data": 'expected {"symbols": "AAPL,MSFT" | [..] | null}'}])
+
+    reader = asyncio.create_task(read_filters())
+    try:
+        while True:
+            # Wake on whichever comes first so a dead reader ends the stream at once
+            batch_task = asyncio.ensure_future(sub.next_batch(STREAM_HEARTBEAT))
+            await asyncio.wait({reader, batch_task}, return_when=asyncio.FIRST_COMPLETED)
+            if reader.done():
+                batch_task.cancel()
+                break
+            await ws.send_json(batch_task.result() or [{"type": "ping"}])
+    except (WebSocketDisconnect, RuntimeError):
+        pass
+    finally:
+        reader.cancel()
+        stream_hub.unsubscribe(sub)
+    if reader.done() and not reader.cancelled():
+        exc = reader.exception()
+        if exc is not None and not isinstance(exc, WebSocketDisconnect):
+            log.warning("stream reader failed: %r", exc)
+
+@app.get("/v1/stream/sse")
+async def stream_sse(request: Request, symbols: Optional[str] = None, channels: Optional[str] = None):
+    sub = stream_hub.subscribe(parse_symbols(symbols), parse_channels(channels))
+
+    async def events():
+        try:
+            while not await request.is_disconnected():
+                batch = await sub.next_batch(STREAM_HEARTBEAT)
+                if not batch:
+                    yield ": ping\n\n"
+                    continue
+                for ev in batch:
+                    yield f"event: {ev['type']}\ndata: {json.dumps(ev['data'])}\n\n"
+        finally:
+            stream_hub.unsubscribe(sub)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 # =========================
 # Step 2: Cache + Latch
@@ -167,38 +497,25 @@ def get_tape():
 DEMO_CACHE_TTL = 30  # seconds
 DEMO_LATCH_TTL = 5   # seconds
 
+# Both go through the two-tier cache: L1 hits skip Redis entirely
 def cache_set(key: str, value: str, ttl: int = DEMO_CACHE_TTL) -> bool:
-    return bool(redis_client.set(key, value, ex=ttl))
+    return cache.set(key, value, ttl)
 
 def cache_get(key: str) -> Optional[str]:
-    val = redis_client.get(key)
-    return val
+    return cache.get(key)
 
-def cache_ttl(key: str) -> int:
-    t = redis_client.ttl(key)
-    return int(t) if t is not None else -2  # Redis: -2 = key missing, -1 = no expire
+def cache_get_with_ttl(key: str) -> tuple:
+    """(value, ttl); Redis: -2 = key missing, -1 = no expire"""
+    return cache.get_with_ttl(key)
 
-# ---- Latch (request coalescing) helpers ----
-def latch_acquire(name: str, ttl: int = DEMO_LATCH_TTL) -> bool:
-    """
-    Try to acquire a short-lived 'latch' so only one request performs upstream work.
-    Returns True if acquired (do the work), False otherwise.
-    """
-    return bool(redis_client.set(name, "1", nx=True, ex=ttl))
+# ---- Latch (request coalescing) ----
+# SingleFlight: in-process shared futures + a Redis latch whose leader
+# publishes completion/failure, so followers wait on an event, not a poll.
+single_flight = SingleFlight(aredis, REDIS_URL, latch_ttl=DEMO_LATCH_TTL)
 
-def latch_key_for(resource_key: str) -> str:
-    return f"fs:latch:{resource_key}"
-
-async def wait_for_latch_release(name: str, timeout: float = 6.0):
-    """
-    If we didn't acquire the latch, poll for its disappearance for up to `timeout`.
-    Coalesces concurrent requests onto the first one that acquired the latch.
-    """
-    start = time.time()
-    while time.time() - start < timeout:
-        if not redis_client.exists(name):
-            return
-        await asyncio.sleep(0.05)
+@app.on_event("shutdown")
+async def stop_single_flight():
+    await single_flight.stop()
 
 # ---- Step 2a: Simple demo cache endpoint ----
 # POST /demo-cache?key=foo&value=bar -> sets value with TTL=30s
@@ -210,41 +527,50 @@ def demo_cache_set(key: str = Query(...), value: str = Query(...)):
 
 @app.get("/demo-cache")
 def demo_cache_get(key: str = Query(...)):
-    val = cache_get(key)
-    ttl = cache_ttl(key)
+    val, ttl = cache_get_with_ttl(key)
     return {"key": key, "value": val, "ttl": ttl}
 
+@app.get("/cache/stats")
+def cache_stats():
+    """L1 hit/miss counters for this process."""
+    return cache.l1.stats()
+
 # ---- Step 2b: Demo latch (coalescing) endpoint ----
 # Simulates an upstream fetch that takes ~1s, but collapses concurrent callers.
 # GET /demo-latch?key=quotes:AAPL
 @app.get("/demo-latch")
-async def demo_latch(key: str = Query(...)):
+async def demo_latch(key: str = Query(...), fail: bool = False):
     """
     Pattern:
-      - try to acquire latch for the resource key
-      - if acquired: do 'the work' (simulate ~1s upstream), write result to cache
-      - if not acquired: wait until latch disappears, then return cached result
+      - cached: return it
+      - else single-flight: one caller does 'the work' (simulate ~1s upstream)
+        and writes the cache; concurrent callers here or in other processes
+        get the leader's result when it finishes
+      - ?fail=true makes the leader fail; everyone waiting on it gets a 502
     Result is cached for 30s.
     """
     rkey = f"fs:demo:{key}"
-    lkey = latch_key_for(rkey)
 
     # If cached, fast-path
-    existing = cache_get(rkey)
+    existing, ttl = await cache.aget_with_ttl(rkey)
     if existing is not None:
-        return {"source": "cache", "key": key, "value": existing, "ttl": cache_ttl(rkey)}
+        DEMO_LATCH.labels("cache").inc()
+        return {"source": "cache", "key": key, "value": existing, "ttl": ttl}
 
-    # Try to acquire the latch
-    if latch_acquire(lkey, DEMO_LATCH_TTL):
-        # We are the leader — simulate upstream work
+    async def work() -> str:
         await asyncio.sleep(1.0)  # pretend network+compute
+        if fail:
+            raise RuntimeError(f"upstream failed for {key}")
         value = f"payload_for_{key}_{int(time.time())}"
-        cache_set(rkey, value, DEMO_CACHE_TTL)
-        # latch auto-expires in ~5s
-        return {"source": "upstream", "key": key, "value": value, "ttl": DEMO_CACHE_TTL}
-    else:
-        # Someone else is doing the work; wait for latch to clear
-        await wait_for_latch_release(lkey, timeout=6.0)
-        # Then read the cache (might still be missing if leader failed)
-        value = cache_get(rkey)
-        return {"source": "coalesced", "key": key, "value": value, "ttl": cache_ttl(rkey)}
+        await cache.aset(rkey, value, DEMO_CACHE_TTL)
+        return value
+
+    try:
+        value, led = await single_flight.run(rkey, work, lookup=lambda: cache.aget(rkey))
+    except RuntimeError as e:  # our simulated failure, or LeaderFailed / SingleFlightError for followers
+        DEMO_LATCH.labels("failed").inc()
+        raise HTTPException(status_code=502, detail=str(e))
+    source = "upstream" if led else "coalesced"
+    DEMO_LATCH.labels(source).inc()
+    _, ttl = await cache.aget_with_ttl(rkey)
+    return {"source": source, "key": key, "value": value, "ttl": ttl}
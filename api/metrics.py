@@ -0,0 +1,540 @@
+# api/metrics.py
+"""
+In-process metrics (counters, histograms, gauges) rendered in the Prometheus
+text format on /metrics.
+
+Recording is a dict lookup plus a locked add on a per-labelset child, so it
+is cheap enough for hot paths; callers that record a lot keep the child from
+`.labels(...)` around instead of looking it up each time.
+
+Several processes (uvicorn workers, Celery pool children): with METRICS_DIR
+set, each process dumps its values to METRICS_DIR/<host>-<pid>-<token>.json
+every METRICS_FLUSH_INTERVAL seconds (and at exit), and /metrics in any
+process merges every file in the directory: counters and histograms add up,
+gauges are summed, maxed or reported per pid over live processes only (see
+Gauge `mode`). A process is live if its pid exists (same host) or, for files
+from other hosts sharing the directory, if it flushed within STALE_AFTER.
+Counters and histograms of exited processes are folded into one
+compacted.json (so totals don't go backwards) and their files removed.
+Empty the directory when deploying, like prometheus_client's multiprocess mode.
+"""
+from __future__ import annotations
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+import atexit
+import glob
+import json
+import logging
+import os
+import socket
+import threading
+import time
+import uuid
+
+try:  # POSIX; elsewhere snapshots of exited processes are kept, not compacted
+    import fcntl
+except ImportError:  # pragma: no cover
+    fcntl = None
+
+log = logging.getLogger(__name__)
+
+METRICS_DIR = os.getenv("METRICS_DIR")
+METRICS_FLUSH_INTERVAL = float(os.getenv("METRICS_FLUSH_INTERVAL", "5"))
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+HOST = socket.gethostname()
+# Seconds without a flush after which another host's process counts as gone
+STALE_AFTER = max(60.0, 12 * METRICS_FLUSH_INTERVAL)
+COMPACTED = "compacted.json"
+
+# Seconds; spans a Redis round trip up to a slow Yahoo download
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+# ---------- children (one per label set) ----------
+
+class _CounterChild:
+    __slots__ = ("value", "_lock")
+
+    def __init__(self) -> None:
+        self.value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0) -> None:
+        with self._lock:
+            self.value += amount
+
+    def reset(self) -> None:
+        self.value = 0.0
+        self._lock = threading.Lock()
+
+    def dump(self):
+        return self.value
+
+
+class _GaugeChild(_CounterChild):
+    __slots__ = ()
+
+    def set(self, value: float) -> None:
+        self.value = float(value)
+
+    def dec(self, amount: float = 1.0) -> None:
+        self.inc(-amount)
+
+    @contextmanager
+    def track_inprogress(self) -> Iterator[None]:
+        self.inc()
+        try:
+            yield
+        finally:
+            self.dec()
+
+
+class _HistogramChild:
+    __slots__ = ("buckets", "counts", "sum", "_lock")
+
+    def __init__(self, buckets: Tuple[float, ...]) -> None:
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)   # per bucket (not cumulative); last is +Inf
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float) -> None:
+        i = bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[i] += 1
+            self.sum += value
+
+    @contextmanager
+    def time(self) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start)
+
+    def reset(self) -> None:
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def dump(self):
+        return [list(self.counts), self.sum]
+
+
+# ---------- metrics ----------
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()) -> None:
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple[str, ...], object] = {}
+        self._lock = threading.Lock()
+
+    def labels(self, *values: str):
+        key = tuple(str(v) for v in values)
+        child = self._children.get(key)
+        if child is None:
+            if len(key) != len(self.labelnames):
+                raise ValueError(f"{self.name} expects labels {self.labelnames}, got {key}")
+            with self._lock:
+                child = self._children.setdefault(key, self._new_child())
+        return child
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def _reset(self) -> None:
+        # In place: callers may hold on to children from .labels()
+        self._lock = threading.Lock()
+        for child in self._children.values():
+            child.reset()
+
+    def dump(self) -> dict:
+        return {
+            "kind": self.kind,
+            "help": self.help,
+            "labels": list(self.labelnames),
+            "samples": [[list(k), c.dump()] for k, c in list(self._children.items())],
+        }
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def _new_child(self) -> _CounterChild:
+        return _CounterChild()
+
+    def inc(self, amount: float = 1.0) -> None:
+        self.labels().inc(amount)
+
+
+class Gauge(_Metric):
+    """
+    mode (how processes combine): "sum" (e.g. in-flight requests), "max",
+    or "pid" (one series per process, with a pid label). A gauge built with
+    `fn` is read when dumped instead of being set.
+    """
+    kind = "gauge"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (),
+                 mode: str = "sum", fn: Optional[Callable[[], float]] = None) -> None:
+        super().__init__(name, help, labelnames)
+        if mode not in ("sum", "max", "pid"):
+            raise ValueError(f"unknown gauge mode {mode!r}")
+        if fn is not None and labelnames:
+            raise ValueError("callback gauges take no labels")
+        self.mode = mode
+        self.fn = fn
+
+    def _new_child(self) -> _GaugeChild:
+        return _GaugeChild()
+
+    def set(self, value: float) -> None:
+        self.labels().set(value)
+
+    def inc(self, amount: float = 1.0) -> None:
+        self.labels().inc(amount)
+
+    def dec(self, amount: float = 1.0) -> None:
+        self.labels().dec(amount)
+
+    def dump(self) -> dict:
+        if self.fn is not None:
+            try:
+                self.labels().set(self.fn())
+            except Exception as e:
+                log.debug("gauge %s callback failed: %s", self.name, e)
+        return {**super().dump(), "mode": self.mode}
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS) -> None:
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_child(self) -> _HistogramChild:
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value: float) -> None:
+        self.labels().observe(value)
+
+    def time(self):
+        return self.labels().time()
+
+    def dump(self) -> dict:
+        return {**super().dump(), "buckets": list(self.buckets)}
+
+
+# ---------- registry ----------
+
+class Registry:
+    def __init__(self, directory: Optional[str] = METRICS_DIR) -> None:
+        self.directory = directory
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+        self._flusher: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._new_identity()
+
+    def _new_identity(self) -> None:
+        self.pid = os.getpid()
+        self._file = (
+            os.path.join(self.directory, f"{HOST}-{self.pid}-{uuid.uuid4().hex[:8]}.json") if self.directory else None
+        )
+
+    def _register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                if existing.kind != metric.kind or existing.labelnames != metric.labelnames:
+                    raise ValueError(f"metric {metric.name} already registered differently")
+                return existing   # module re-imported: keep recording into the same series
+            self._metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name: str, help: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, help, labelnames))
+
+    def gauge(self, name: str, help: str, labelnames: Sequence[str] = (), mode: str = "sum",
+              fn: Optional[Callable[[], float]] = None) -> Gauge:
+        return self._register(Gauge(name, help, labelnames, mode=mode, fn=fn))
+
+    def histogram(self, name: str, help: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, help, labelnames, buckets))
+
+    # ---------- snapshots ----------
+
+    def dump(self) -> dict:
+        return {"host": HOST, "pid": self.pid, "at": time.time(),
+                "metrics": {n: m.dump() for n, m in list(self._metrics.items())}}
+
+    def flush(self) -> None:
+        """Write this process's snapshot (atomically) to the shared directory."""
+        if not self._file:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        tmp = f"{self._file}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(self.dump(), f)
+        os.replace(tmp, self._file)
+
+    def start_flusher(self, interval: float = METRICS_FLUSH_INTERVAL) -> None:
+        """Flush periodically from a daemon thread (call after forking, e.g. on worker start)."""
+        if not self.directory or (self._flusher is not None and self._flusher.is_alive()):
+            return
+
+        def loop() -> None:
+            while not self._stop.wait(interval):
+                try:
+                    self.flush()
+                except Exception as e:
+                    log.warning("metrics flush failed: %s", e)
+
+        self._stop.clear()
+        self._flusher = threading.Thread(target=loop, name="metrics-flush", daemon=True)
+        self._flusher.start()
+
+    def _after_fork(self) -> None:
+        # A forked child starts from zero under its own file; the parent's
+        # values are already reported by the parent.
+        for m in self._metrics.values():
+            m._reset()
+        self._flusher = None
+        self._stop = threading.Event()
+        self._new_identity()
+
+    def _snapshots(self) -> List[dict]:
+        if not self.directory:
+            return [self.dump()]
+        self.flush()
+        compacted_path = os.path.join(self.directory, COMPACTED)
+        loaded: Dict[str, dict] = {}
+        for path in glob.glob(os.path.join(self.directory, "*.json")):
+            if path != compacted_path:
+                snap = _read(path)
+                if snap is not None:   # None: being replaced or half-written; next scrape gets it
+                    loaded[os.path.basename(path)] = snap
+        # Read last: a file folded in while we were listing is then skipped, not counted twice
+        compacted = _read(compacted_path) or {"metrics": {}, "folded": []}
+        for name in compacted["folded"]:
+            loaded.pop(name, None)
+        dead = [name for name, snap in loaded.items() if not _alive(snap)]
+        if dead:
+            self._compact(dead)
+        return [compacted, *loaded.values()]
+
+    def _compact(self, names: List[str]) -> None:
+        """
+        Fold exited processes' counters and histograms into compacted.json and
+        delete their files. One compactor at a time (flock); the names folded
+        last time are kept in the file so readers skip them if a crash left
+        them behind, and are deleted first on the next run.
+        """
+        if fcntl is None:
+            return
+        compacted_path = os.path.join(self.directory, COMPACTED)
+        with open(os.path.join(self.directory, ".compact.lock"), "a") as lock:
+            try:
+                fcntl.flock(lock.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                return   # another process is compacting
+            try:
+                compacted = _read(compacted_path) or {"metrics": {}, "folded": []}
+                for name in compacted["folded"]:
+                    _remove(os.path.join(self.directory, name))
+                merged: Dict[str, dict] = {}
+                for name, m in compacted["metrics"].items():
+                    _merge(merged, name, m, 0, True)
+                folded = []
+                for name in names:
+                    snap = _read(os.path.join(self.directory, name))
+                    if snap is None:
+                        continue   # folded by another compactor since we listed
+                    for metric, m in snap["metrics"].items():
+                        _merge(merged, metric, m, snap["pid"], False)
+                    folded.append(name)
+                tmp = f"{compacted_path}.{os.getpid()}.tmp"
+                with open(tmp, "w") as f:
+                    json.dump({"metrics": {n: _unmerge(m) for n, m in merged.items()}, "folded": folded}, f)
+                os.replace(tmp, compacted_path)
+                for name in folded:
+                    _remove(os.path.join(self.directory, name))
+            except Exception as e:
+                log.warning("metrics compaction failed: %s", e)
+            finally:
+                fcntl.flock(lock.fileno(), fcntl.LOCK_UN)
+
+    # ---------- exposition ----------
+
+    def render(self) -> str:
+        """All processes' metrics merged, in Prometheus text format."""
+        merged: Dict[str, dict] = {}
+        for snap in self._snapshots():
+            alive = _alive(snap)
+            for name, m in snap["metrics"].items():
+                _merge(merged, name, m, snap.get("pid"), alive)
+        lines: List[str] = []
+        for name in sorted(merged):
+            _render(lines, name, merged[name])
+        return "\n".join(lines) + "\n"
+
+
+def _read(path: str) -> Optional[dict]:
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _remove(path: str) -> None:
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def _alive(snap: dict) -> bool:
+    pid = snap.get("pid")
+    if pid is None:
+        return True   # compacted.json: counters only
+    if snap.get("host") != HOST:
+        # Pids from another host (or container) mean nothing here
+        return time.time() - snap.get("at", 0.0) < STALE_AFTER
+    if pid == os.getpid():
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _merge(merged: Dict[str, dict], name: str, m: dict, pid: int, alive: bool) -> None:
+    kind = m["kind"]
+    if kind == "gauge" and not alive:
+        return   # a dead process's in-flight count or cache size means nothing now
+    labels = m["labels"] + (["pid"] if kind == "gauge" and m.get("mode") == "pid" else [])
+    out = merged.setdefault(name, {"kind": kind, "help": m["help"], "labels": labels,
+                                   "buckets": m.get("buckets"), "samples": {}})
+    samples = out["samples"]
+    for values, v in m["samples"]:
+        key = tuple(values)
+        if kind == "histogram":
+            counts, total = v
+            prev = samples.get(key)
+            if prev is None:
+                samples[key] = [list(counts), total]
+            else:
+                prev[0] = [a + b for a, b in zip(prev[0], counts)]
+                prev[1] += total
+        elif kind == "gauge" and m.get("mode") == "pid":
+            samples[key + (str(pid),)] = v
+        elif kind == "gauge" and m.get("mode") == "max":
+            samples[key] = max(samples.get(key, v), v)
+        else:
+            samples[key] = samples.get(key, 0.0) + v
+
+
+def _unmerge(m: dict) -> dict:
+    """A merged metric back in snapshot form (as in _Metric.dump)."""
+    return {"kind": m["kind"], "help": m["help"], "labels": m["labels"], "buckets": m["buckets"],
+            "samples": [[list(k), v] for k, v in m["samples"].items()]}
+
+
+def _escape(v: str) -> str:
+    return v.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _num(v: float) -> str:
+    if v == float("inf"):
+        return "+Inf"
+    return repr(float(v)) if v != int(v) else f"{int(v)}"
+
+
+def _render(lines: List[str], name: str, m: dict) -> None:
+    lines.append(f"# HELP {name} {m['help']}")
+    lines.append(f"# TYPE {name} {m['kind']}")
+    names = m["labels"]
+    for key in sorted(m["samples"]):
+        v = m["samples"][key]
+        if m["kind"] != "histogram":
+            lines.append(f"{name}{_labels(names, key)} {_num(v)}")
+            continue
+        counts, total = v
+        running = 0
+        for le, c in zip(list(m["buckets"]) + [float("inf")], counts):
+            running += c
+            le_label = 'le="' + _num(le) + '"'
+            lines.append(f"{name}_bucket{_labels(names, key, le_label)} {running}")
+        lines.append(f"{name}_sum{_labels(names, key)} {_num(total)}")
+        lines.append(f"{name}_count{_labels(names, key)} {running}")
+
+
+REGISTRY = Registry()
+counter = REGISTRY.counter
+gauge = REGISTRY.gauge
+histogram = REGISTRY.histogram
+
+os.register_at_fork(after_in_child=REGISTRY._after_fork)
+atexit.register(lambda: REGISTRY.flush() if REGISTRY.directory else None)
+
+
+# ---------- HTTP ----------
+
+HTTP_REQUESTS = histogram(
+    "http_request_duration_seconds", "HTTP request latency by route template and status.",
+    ("method", "route", "status"),
+)
+HTTP_IN_FLIGHT = gauge("http_requests_in_flight", "HTTP requests being served.")
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware timing every HTTP request. Labels use the matched route's
+    path template (/tasks/status/{task_id}), not the raw path, so series stay
+    bounded; unmatched paths are grouped as "unmatched". WebSockets pass
+    straight through. Time is measured to the end of the response body.
+    """
+
+    def __init__(self, app) -> None:
+        self.app = app
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        status = {"code": 500}
+
+        async def send_wrapper(message) -> None:
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        start = time.perf_counter()
+        HTTP_IN_FLIGHT.inc()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            HTTP_IN_FLIGHT.dec()
+            route = scope.get("route")
+            HTTP_REQUESTS.labels(
+                scope["method"], getattr(route, "path", "unmatched"), status["code"]
+            ).observe(time.perf_counter() - start)
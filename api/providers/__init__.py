@@ -1,6 +1,16 @@
 # api/providers/__init__.py
 from .mock_provider import MockProvider
 from .yfinance_provider import YFinanceProvider
-from .base import Quote, Bar, Provider
+from .base import Quote, Bar, Provider, AsyncProvider, FallbackBars, FallbackQuotes, is_fallback
+from .caching_provider import CachingProvider
+from .router import ProviderRouter, CircuitBreaker
+from .async_adapter import AsyncProviderAdapter
+from .bar_store import BarStore, BarStoreProvider
+from .resample import ResamplingProvider, resample
+from .factory import build_provider, build_upstream
 
-__all__ = ["MockProvider", "YFinanceProvider", "Quote", "Bar", "Provider"]
+__all__ = ["MockProvider", "YFinanceProvider", "Quote", "Bar", "Provider", "AsyncProvider",
+           "FallbackBars", "FallbackQuotes", "is_fallback",
+           "CachingProvider", "ProviderRouter", "CircuitBreaker", "AsyncProviderAdapter",
+           "BarStore", "BarStoreProvider", "ResamplingProvider", "resample",
+           "build_provider", "build_upstream"]
@@ -0,0 +1,68 @@
+# api/providers/async_adapter.py
+from __future__ import annotations
+from typing import Dict, List, Optional, Tuple
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+
+from .base import AsyncProvider, FallbackQuotes, Provider, Quote, Bar, Interval, Range, is_fallback
+
+
+class AsyncProviderAdapter(AsyncProvider):
+    """
+    Runs a sync Provider on a bounded thread pool so slow upstream calls never
+    block the event loop. `max_concurrency` caps in-flight upstream calls across
+    all requests; large quote lists are split into chunks fetched concurrently.
+    """
+
+    def __init__(
+        self,
+        inner: Provider,
+        max_workers: int = 16,
+        max_concurrency: int = 16,
+        quote_chunk_size: int = 50,
+    ) -> None:
+        self.inner = inner
+        self.name = inner.name
+        self.quote_chunk_size = max(1, quote_chunk_size)
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="aprovider")
+        self._max_concurrency = max_concurrency
+        self._sem: asyncio.Semaphore | None = None
+
+    def _semaphore(self) -> asyncio.Semaphore:
+        # Created lazily so it binds to the running loop, not import time
+        if self._sem is None:
+            self._sem = asyncio.Semaphore(self._max_concurrency)
+        return self._sem
+
+    async def _run(self, fn, *args):
+        async with self._semaphore():
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._pool, fn, *args)
+
+    async def get_quotes(self, symbols: List[str]) -> Dict[str, Quote]:
+        if not symbols:
+            return {}
+        size = self.quote_chunk_size
+        chunks = [symbols[i:i + size] for i in range(0, len(symbols), size)]
+        parts = await asyncio.gather(*(self._run(self.inner.get_quotes, c) for c in chunks))
+        out: Dict[str, Quote] = {}
+        for part in parts:
+            out.update(part)
+        # Keep the synthetic tag if any chunk came from the fallback
+        return FallbackQuotes(out) if any(is_fallback(p) for p in parts) else out
+
+    async def get_ohlc(self, symbol: str, interval: Interval, range_: Range) -> List[Bar]:
+        return await self._run(self.inner.get_ohlc, symbol, interval, range_)
+
+    async def get_ohlc_versioned(
+        self, symbol: str, interval: Interval, range_: Range, count: bool = True
+    ) -> Tuple[List[Bar], Optional[str]]:
+        """(bars, version stored with the cache entry or None); see CachingProvider."""
+        versioned = getattr(self.inner, "get_ohlc_versioned", None)
+        if versioned is None:
+            return await self.get_ohlc(symbol, interval, range_), None
+        return await self._run(versioned, symbol, interval, range_, count)
+
+    async def ohlc_version(self, symbol: str, interval: Interval, range_: Range) -> Optional[str]:
+        lookup = getattr(self.inner, "ohlc_version", None)
+        return await self._run(lookup, symbol, interval, range_) if lookup is not None else None
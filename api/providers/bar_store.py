@@ -0,0 +1,244 @@
+# api/providers/bar_store.py
+from __future__ import annotations
+from typing import Dict, Iterator, List, Optional, Tuple
+from contextlib import contextmanager
+from datetime import datetime, timezone
+import json
+import logging
+import os
+import threading
+import time
+
+import numpy as np
+
+try:  # POSIX; elsewhere writers are only serialized within one process
+    import fcntl
+except ImportError:  # pragma: no cover
+    fcntl = None
+
+from .base import Provider, Quote, Bar, Interval, Range, INTERVAL_SECONDS, RANGE_DAYS
+from .series import BarColumns, trim_to_range
+
+log = logging.getLogger(__name__)
+
+# Row order of the (6, n) float64 matrix stored per partition
+_ROWS = BarColumns.FIELDS
+
+# Calendar slack when deciding how far back fetched bars reach ('5d' over a weekend)
+_SLACK_DAYS = 4
+
+
+def _partition_key(interval: str, epoch_s: np.ndarray) -> np.ndarray:
+    """Intraday bars are partitioned by UTC month, daily bars by year."""
+    unit = "Y" if interval == "1d" else "M"
+    return epoch_s.astype("datetime64[s]").astype(f"datetime64[{unit}]")
+
+
+def _partition_bounds(name: str) -> Tuple[int, int]:
+    """[start, end) epoch seconds covered by partition file stem `name`."""
+    unit = "Y" if len(name) == 4 else "M"
+    p = np.datetime64(name, unit)
+    return int(p.astype("datetime64[s]").astype(np.int64)), int((p + 1).astype("datetime64[s]").astype(np.int64))
+
+
+class BarStore:
+    """
+    Local columnar bar store: <root>/<symbol>/<interval>/<partition>.npy
+
+    Each partition is one uncompressed .npy holding a (6, n) float64 matrix,
+    one contiguous row per column (t, o, h, l, c, v), so reads can memory-map
+    the file and slice a single column without touching the rest. Range reads
+    only open partitions that overlap the window. Writes merge into the
+    affected partitions and swap them in atomically (tmp file + os.replace).
+    Writers to one series hold an flock on <dir>/.lock, so API processes and
+    Celery workers merging into the same partition never lose each other's rows.
+    """
+
+    def __init__(self, root: str) -> None:
+        self.root = root
+        self._lock = threading.Lock()
+
+    def _dir(self, symbol: str, interval: str) -> str:
+        safe = symbol.replace(os.sep, "_").replace("/", "_")
+        return os.path.join(self.root, safe, interval)
+
+    def _partitions(self, symbol: str, interval: str) -> List[str]:
+        try:
+            names = os.listdir(self._dir(symbol, interval))
+        except FileNotFoundError:
+            return []
+        return sorted(n[:-4] for n in names if n.endswith(".npy"))
+
+    @contextmanager
+    def _locked(self, d: str) -> Iterator[None]:
+        """Exclusive per-series lock: threads via self._lock, processes via flock."""
+        with self._lock:
+            if fcntl is None:
+                yield
+                return
+            with open(os.path.join(d, ".lock"), "a") as fh:
+                fcntl.flock(fh.fileno(), fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(fh.fileno(), fcntl.LOCK_UN)
+
+    def _load(self, path: str) -> BarColumns:
+        m = np.load(path, mmap_mode="r")
+        return BarColumns(*(m[i] for i in range(len(_ROWS))))
+
+    # ---------- reads ----------
+
+    def read(self, symbol: str, interval: str, start: int | None = None, end: int | None = None) -> BarColumns:
+        """Bars with start <= t < end (epoch seconds), touching only overlapping partitions."""
+        d = self._dir(symbol, interval)
+        parts: List[BarColumns] = []
+        for name in self._partitions(symbol, interval):
+            p_start, p_end = _partition_bounds(name)
+            if (start is not None and p_end <= start) or (end is not None and p_start >= end):
+                continue
+            parts.append(self._load(os.path.join(d, name + ".npy")).between(start, end))
+        if not parts:
+            return BarColumns.empty()
+        return BarColumns(*(np.concatenate([getattr(p, f) for p in parts]) for f in _ROWS))
+
+    def last_timestamp(self, symbol: str, interval: str) -> Optional[int]:
+        names = self._partitions(symbol, interval)
+        if not names:
+            return None
+        last = self._load(os.path.join(self._dir(symbol, interval), names[-1] + ".npy"))
+        return int(last.t[-1]) if len(last) else None
+
+    def first_timestamp(self, symbol: str, interval: str) -> Optional[int]:
+        names = self._partitions(symbol, interval)
+        if not names:
+            return None
+        first = self._load(os.path.join(self._dir(symbol, interval), names[0] + ".npy"))
+        return int(first.t[0]) if len(first) else None
+
+    # ---------- writes ----------
+
+    def write(self, symbol: str, interval: str, cols: BarColumns) -> None:
+        """Merge `cols` into the store; rows for an existing timestamp are replaced."""
+        if len(cols) == 0:
+            return
+        d = self._dir(symbol, interval)
+        os.makedirs(d, exist_ok=True)
+
+        keys = _partition_key(interval, cols.t)
+        bounds = np.flatnonzero(np.diff(keys.astype(np.int64))) + 1
+        with self._locked(d):
+            for lo, hi in zip(np.r_[0, bounds], np.r_[bounds, len(cols)]):
+                name = str(keys[lo])
+                path = os.path.join(d, name + ".npy")
+                chunk = cols.between(int(cols.t[lo]), int(cols.t[hi - 1]) + 1)
+                if os.path.exists(path):
+                    chunk = self._load(path).merge(chunk)
+                matrix = np.vstack([getattr(chunk, f).astype(np.float64) for f in _ROWS])
+                tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+                with open(tmp, "wb") as fh:
+                    np.save(fh, matrix)
+                os.replace(tmp, path)
+
+    # ---------- coverage metadata ----------
+
+    def covered_range(self, symbol: str, interval: str) -> Optional[str]:
+        """Deepest range this series was backfilled for (see BarStoreProvider)."""
+        try:
+            with open(os.path.join(self._dir(symbol, interval), "meta.json")) as fh:
+                return json.load(fh).get("range")
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def set_covered_range(self, symbol: str, interval: str, range_: str) -> None:
+        """Record `range_` as backfilled, unless a deeper range already is."""
+        d = self._dir(symbol, interval)
+        os.makedirs(d, exist_ok=True)
+        with self._locked(d):
+            if _covers(self.covered_range(symbol, interval), range_):
+                return
+            tmp = os.path.join(d, f"meta.json.{os.getpid()}.{threading.get_ident()}.tmp")
+            with open(tmp, "w") as fh:
+                json.dump({"range": range_, "at": time.time()}, fh)
+            os.replace(tmp, os.path.join(d, "meta.json"))
+
+
+def _covers(have: Optional[str], want: str) -> bool:
+    if have is None:
+        return False
+    h, w = RANGE_DAYS[have], RANGE_DAYS[want]
+    return h is None or (w is not None and w <= h)
+
+
+def _reached(bars: List[Bar], requested: str) -> Optional[str]:
+    """
+    Deepest range (at most `requested`) the fetched bars actually reach back to.
+    Upstreams cap history per interval (Yahoo: ~7d of 1m bars), so a '1y'
+    request can come back with far less; a 'max' answer is everything there is.
+    """
+    if RANGE_DAYS[requested] is None:
+        return requested
+    first = datetime.fromisoformat(bars[0]["t"]).timestamp()
+    days = (time.time() - first) / 86400 + _SLACK_DAYS
+    reached = [r for r, d in RANGE_DAYS.items() if d is not None and d <= min(days, RANGE_DAYS[requested])]
+    return reached[-1] if reached else None
+
+
+class BarStoreProvider(Provider):
+    """
+    Serves get_ohlc from a BarStore and only goes upstream for what is missing:
+    a one-off backfill when the store doesn't reach back far enough, then just
+    the tail since the last stored bar. Upstreams exposing
+    get_ohlc_since(symbol, interval, since) (YFinanceProvider) fetch exactly
+    that window; others are asked for the smallest range that spans it.
+    Quotes pass straight through.
+    """
+
+    def __init__(self, inner: Provider, store: BarStore) -> None:
+        self.inner = inner
+        self.name = inner.name
+        self.store = store
+
+    def get_quotes(self, symbols: List[str]) -> Dict[str, Quote]:
+        return self.inner.get_quotes(symbols)
+
+    def get_ohlc(self, symbol: str, interval: Interval, range_: Range) -> List[Bar]:
+        if not _covers(self.store.covered_range(symbol, interval), range_):
+            bars = self.inner.get_ohlc(symbol, interval, range_)
+            if bars:
+                self.store.write(symbol, interval, BarColumns.from_bars(bars))
+                covered = _reached(bars, range_)
+                if covered is not None:
+                    self.store.set_covered_range(symbol, interval, covered)
+            return bars
+
+        last = self.store.last_timestamp(symbol, interval)
+        if last is not None:
+            try:
+                tail = self._fetch_tail(symbol, interval, last)
+            except Exception as e:
+                # Upstream outage: the stored series is still the best answer
+                log.warning("tail fetch failed, serving stored %s %s: %s", symbol, interval, e)
+                tail = []
+            if tail:
+                self.store.write(symbol, interval, BarColumns.from_bars(tail))
+
+        days = RANGE_DAYS[range_]
+        start = None
+        if days is not None:
+            # Calendar slack so session-based ranges ('5d' over a weekend) still fit
+            start = int(time.time()) - (days + 4) * 86400
+        return trim_to_range(self.store.read(symbol, interval, start=start).to_bars(), range_)
+
+    def _fetch_tail(self, symbol: str, interval: Interval, last: int) -> List[Bar]:
+        since = datetime.fromtimestamp(last, tz=timezone.utc)
+        fetch_since = getattr(self.inner, "get_ohlc_since", None)
+        if fetch_since is not None:
+            return fetch_since(symbol, interval, since)
+
+        gap_days = (time.time() - last + INTERVAL_SECONDS[interval]) / 86400
+        span = next(
+            (r for r, d in RANGE_DAYS.items() if d is not None and d >= gap_days), "max"
+        )
+        cutoff = since.isoformat()
+        return [b for b in self.inner.get_ohlc(symbol, interval, span) if b["t"] >= cutoff]
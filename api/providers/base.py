@@ -20,6 +20,22 @@ class Bar(TypedDict):
 Interval = Literal["1m", "5m", "15m", "1h", "1d"]
 Range = Literal["1d", "5d", "1m", "3m", "6m", "1y", "2y", "5y", "max"]
 
+# Bar length per interval, and calendar span per range (None = unbounded)
+INTERVAL_SECONDS: Dict[str, int] = {"1m": 60, "5m": 300, "15m": 900, "1h": 3600, "1d": 86400}
+RANGE_DAYS: Dict[str, int | None] = {
+    "1d": 1, "5d": 5, "1m": 30, "3m": 90, "6m": 180,
+    "1y": 365, "2y": 730, "5y": 1825, "max": None,
+}
+
+class FallbackBars(list):
+    """Bars from a router's last-resort provider (synthetic): cache briefly, never persist or publish."""
+
+class FallbackQuotes(dict):
+    """Quotes from a router's last-resort provider; same rules as FallbackBars."""
+
+def is_fallback(value: object) -> bool:
+    return isinstance(value, (FallbackBars, FallbackQuotes))
+
 class Provider(Protocol):
     name: str
 
@@ -30,3 +46,13 @@ class Provider(Protocol):
     def get_ohlc(self, symbol: str, interval: Interval, range_: Range) -> List[Bar]:
         """Return a list of normalized OHLC bars, oldest -> newest."""
         ...
+
+class AsyncProvider(Protocol):
+    """Same contract as Provider, but awaitable (see providers/async_adapter.py)."""
+    name: str
+
+    async def get_quotes(self, symbols: List[str]) -> Dict[str, Quote]:
+        ...
+
+    async def get_ohlc(self, symbol: str, interval: Interval, range_: Range) -> List[Bar]:
+        ...
@@ -0,0 +1,332 @@
+# api/providers/caching_provider.py
+from __future__ import annotations
+from typing import Dict, List, Optional, Sequence, Set, Tuple
+import json
+import time
+import uuid
+
+import redis
+
+from metrics import counter
+from singleflight import latch_key_for, release_token
+from .base import FallbackBars, FallbackQuotes, Provider, Quote, Bar, Interval, Range, is_fallback
+from .series import raw_version
+
+# Bar data goes stale at the speed of its interval: 1m charts expire fast,
+# daily bars can sit for hours.
+OHLC_TTL = {"1m": 30, "5m": 120, "15m": 300, "1h": 900, "1d": 4 * 3600}
+QUOTE_TTL = 15       # seconds
+EMPTY_TTL = 5        # short negative cache so a dead symbol can't stampede upstream
+FALLBACK_TTL = 10    # synthetic fallback data: just enough to shield a struggling upstream
+LATCH_TTL = 10       # seconds; upper bound on one upstream fetch
+POLL_INTERVAL = 0.05
+ACCESS_HALF_LIFE = 600.0   # seconds; OHLC access counts halve this often
+ACCESS_FLOOR = 0.05        # decayed counts below this are forgotten
+
+CACHE_LOOKUPS = counter("provider_cache_lookups_total", "Provider cache lookups (per symbol) by kind and result.",
+                        ("kind", "result"))
+LATCHES = counter("provider_cache_latch_total", "Cache misses by latch role: lead, follow, or timeout.",
+                  ("kind", "role"))
+
+
+def ohlc_key(provider: str, symbol: str, interval: str, range_: str) -> str:
+    return f"fs:ohlc:{provider}:{symbol}:{interval}:{range_}"
+
+
+def quote_key(provider: str, symbol: str) -> str:
+    return f"fs:quote:{provider}:{symbol}"
+
+
+def fallback_marker(resource_key: str) -> str:
+    """
+    OHLC: set (same TTL) while the cached entry holds synthetic fallback data.
+    Quotes: holds the synthetic quote itself, so the real key stays real.
+    """
+    return f"{resource_key}:fallback"
+
+
+def version_key(resource_key: str) -> str:
+    """Series version (providers.series.raw_version) of the cached entry, same TTL."""
+    return f"{resource_key}:ver"
+
+
+def _bars(raw: str, marker: Optional[str]) -> List[Bar]:
+    bars = json.loads(raw)
+    return FallbackBars(bars) if marker is not None else bars
+
+
+def _versioned(raw: str, marker: Optional[str], version: Optional[str]) -> Tuple[List[Bar], str]:
+    # Entries written before versions were stored: hash the text we already have
+    return _bars(raw, marker), version or raw_version(raw, marker is not None)
+
+
+# Fallback bars go in only if no copy is cached, together with their marker
+# and version, so no reader sees synthetic bars without the tag
+_SET_FALLBACK = """
+if redis.call('EXISTS', KEYS[1]) == 1 then
+  return 0
+end
+redis.call('SET', KEYS[1], ARGV[1], 'EX', ARGV[3])
+redis.call('SET', KEYS[2], '1', 'EX', ARGV[3])
+redis.call('SET', KEYS[3], ARGV[2], 'EX', ARGV[3])
+return 1
+"""
+
+def access_key(provider: str) -> str:
+    """ZSET of "symbol|interval|range" -> decayed OHLC read count."""
+    return f"fs:access:ohlc:{provider}"
+
+
+class CachingProvider(Provider):
+    """
+    Read-through Redis cache around any Provider.
+
+    Same pattern as /demo-latch in main.py: on a miss, only the caller that wins
+    the SET NX latch goes upstream; everyone else polls the cache until the
+    leader has written it (or the latch expires, then they fetch themselves).
+
+    OHLC reads also bump a decaying access count (same round trip as the GET),
+    which the warm_hot_ohlc beat task uses to refresh popular charts before
+    they expire; see hot_ohlc / decay_access / refresh_ohlc.
+    """
+
+    def __init__(
+        self,
+        inner: Provider,
+        redis_client: redis.Redis,
+        ohlc_ttl: Optional[Dict[str, int]] = None,
+        quote_ttl: int = QUOTE_TTL,
+        latch_ttl: int = LATCH_TTL,
+    ) -> None:
+        self.inner = inner
+        self.name = inner.name
+        self.r = redis_client
+        self.ohlc_ttl = {**OHLC_TTL, **(ohlc_ttl or {})}
+        self.quote_ttl = quote_ttl
+        self.latch_ttl = latch_ttl
+
+    # ---------- OHLC ----------
+
+    def get_ohlc(self, symbol: str, interval: Interval, range_: Range) -> List[Bar]:
+        return self.get_ohlc_versioned(symbol, interval, range_)[0]
+
+    def ohlc_version(self, symbol: str, interval: Interval, range_: Range) -> Optional[str]:
+        """
+        Stored version of a cached series without reading the bars (the ETag
+        check behind a 304). Counts as a read for refresh-ahead.
+        """
+        key = ohlc_key(self.name, symbol, interval, range_)
+        pipe = self.r.pipeline(transaction=False)
+        pipe.get(version_key(key))
+        pipe.zincrby(access_key(self.name), 1, f"{symbol}|{interval}|{range_}")
+        return pipe.execute()[0]
+
+    def get_ohlc_versioned(
+        self, symbol: str, interval: Interval, range_: Range, count: bool = True
+    ) -> Tuple[List[Bar], str]:
+        """
+        get_ohlc plus the version stored with the entry, read in the same MGET.
+        count=False when ohlc_version already counted this read.
+        """
+        key = ohlc_key(self.name, symbol, interval, range_)
+        entry = (key, fallback_marker(key), version_key(key))
+
+        pipe = self.r.pipeline(transaction=False)
+        pipe.mget(*entry)
+        if count:
+            pipe.zincrby(access_key(self.name), 1, f"{symbol}|{interval}|{range_}")
+        cached, marker, version = pipe.execute()[0]
+        if cached is not None:
+            CACHE_LOOKUPS.labels("ohlc", "hit").inc()
+            return _versioned(cached, marker, version)
+        CACHE_LOOKUPS.labels("ohlc", "miss").inc()
+
+        lkey = latch_key_for(key)
+        token = uuid.uuid4().hex
+        deadline = time.monotonic() + self.latch_ttl
+        followed = False
+        while True:
+            if self.r.set(lkey, token, nx=True, ex=self.latch_ttl):
+                LATCHES.labels("ohlc", "lead").inc()
+                try:
+                    return self._fetch_ohlc(key, symbol, interval, range_)
+                finally:
+                    self._release([lkey], token)
+
+            # Someone else is fetching; wait for their result
+            if not followed:
+                LATCHES.labels("ohlc", "follow").inc()
+                followed = True
+            time.sleep(POLL_INTERVAL)
+            cached, marker, version = self.r.mget(*entry)
+            if cached is not None:
+                return _versioned(cached, marker, version)
+            if time.monotonic() >= deadline:
+                # Leader is stuck or died without writing; don't wait forever
+                LATCHES.labels("ohlc", "timeout").inc()
+                return self._fetch_ohlc(key, symbol, interval, range_)
+
+    def peek_ohlc(self, symbol: str, pairs: Sequence[Tuple[str, str]]) -> List[Optional[str]]:
+        """
+        Raw cached JSON for each (interval, range) pair, one MGET, no upstream
+        calls. Synthetic fallback entries read as missing, so nothing is
+        resampled from them.
+        """
+        if not pairs:
+            return []
+        keys = [ohlc_key(self.name, symbol, i, r) for i, r in pairs]
+        raws = self.r.mget(keys + [fallback_marker(k) for k in keys])
+        n = len(keys)
+        return [None if marker is not None else raw for raw, marker in zip(raws[:n], raws[n:])]
+
+    def refresh_ohlc(self, symbol: str, interval: Interval, range_: Range) -> bool:
+        """Re-fetch one entry ahead of expiry; False if a reader is already fetching it."""
+        key = ohlc_key(self.name, symbol, interval, range_)
+        lkey = latch_key_for(key)
+        token = uuid.uuid4().hex
+        if not self.r.set(lkey, token, nx=True, ex=self.latch_ttl):
+            return False
+        try:
+            self._fetch_ohlc(key, symbol, interval, range_)
+        finally:
+            self._release([lkey], token)
+        return True
+
+    def _release(self, lkeys: List[str], token: str) -> None:
+        """Drop the latches we still own, one round trip."""
+        pipe = self.r.pipeline(transaction=False)
+        for lkey in lkeys:
+            release_token(pipe, lkey, token)
+        pipe.execute()
+
+    # ---------- access stats (refresh-ahead) ----------
+
+    def hot_ohlc(self, limit: int) -> List[Tuple[str, str, str, float, int]]:
+        """Most-read entries: (symbol, interval, range, score, ms left on the cached copy), hottest first."""
+        hot = self.r.zrevrange(access_key(self.name), 0, limit - 1, withscores=True)
+        entries = [tuple(member.split("|")) for member, _ in hot]
+        pipe = self.r.pipeline(transaction=False)
+        for sym, interval, range_ in entries:
+            pipe.pttl(ohlc_key(self.name, sym, interval, range_))
+        ttls = pipe.execute() if entries else []
+        return [(*e, score, ttl) for e, (_, score), ttl in zip(entries, hot, ttls)]
+
+    def decay_access(self, half_life: float = ACCESS_HALF_LIFE, floor: float = ACCESS_FLOOR) -> int:
+        """
+        Scale every count by 0.5 ** (elapsed / half_life) since the last decay
+        (ZUNIONSTORE onto itself with a weight), then drop the ones below
+        `floor`; returns how many were dropped.
+        """
+        akey = access_key(self.name)
+        stamp = akey + ":decayed"
+        now = time.time()
+        last = float(self.r.get(stamp) or now)
+        factor = 0.5 ** (max(0.0, now - last) / half_life)
+        pipe = self.r.pipeline(transaction=False)
+        if factor < 1.0:
+            pipe.zunionstore(akey, {akey: factor})
+        pipe.zremrangebyscore(akey, "-inf", f"({floor}")
+        pipe.set(stamp, now)
+        return pipe.execute()[-2]
+
+    def _fetch_ohlc(self, key: str, symbol: str, interval: Interval, range_: Range) -> Tuple[List[Bar], str]:
+        bars = self.inner.get_ohlc(symbol, interval, range_)
+        raw = json.dumps(bars)
+        version = raw_version(raw, is_fallback(bars))
+        if is_fallback(bars):
+            # Never replace a real copy that is still cached (refresh-ahead runs before expiry)
+            self.r.eval(_SET_FALLBACK, 3, key, fallback_marker(key), version_key(key), raw, version, FALLBACK_TTL)
+            return bars, version
+        ttl = self.ohlc_ttl.get(interval, 60) if bars else EMPTY_TTL
+        pipe = self.r.pipeline()   # MULTI: readers never see new bars with an old version
+        pipe.set(key, raw, ex=ttl)
+        pipe.set(version_key(key), version, ex=ttl)
+        pipe.delete(fallback_marker(key))
+        pipe.execute()
+        return bars, version
+
+    # ---------- quotes ----------
+
+    def get_quotes(self, symbols: List[str]) -> Dict[str, Quote]:
+        if not symbols:
+            return {}
+
+        symbols = list(dict.fromkeys(symbols))
+        keys = {s: quote_key(self.name, s) for s in symbols}
+        out: Dict[str, Quote] = {}
+        synthetic: Set[str] = set()   # symbols answered from fallback quotes
+
+        missing = self._read_quotes(symbols, keys, out, synthetic)
+        CACHE_LOOKUPS.labels("quote", "hit").inc(len(symbols) - len(missing))
+        if not missing:
+            return self._tagged(out, synthetic)
+        CACHE_LOOKUPS.labels("quote", "miss").inc(len(missing))
+
+        # Latch each missing symbol in one round trip; fetch the ones we lead
+        token = uuid.uuid4().hex
+        pipe = self.r.pipeline(transaction=False)
+        for s in missing:
+            pipe.set(latch_key_for(keys[s]), token, nx=True, ex=self.latch_ttl)
+        acquired = pipe.execute()
+        lead = [s for s, ok in zip(missing, acquired) if ok]
+        follow = [s for s, ok in zip(missing, acquired) if not ok]
+        LATCHES.labels("quote", "lead").inc(len(lead))
+        LATCHES.labels("quote", "follow").inc(len(follow))
+
+        if lead:
+            try:
+                out.update(self._fetch_quotes(lead, keys, synthetic))
+            finally:
+                self._release([latch_key_for(keys[s]) for s in lead], token)
+
+        deadline = time.monotonic() + self.latch_ttl
+        while follow and time.monotonic() < deadline:
+            time.sleep(POLL_INTERVAL)
+            follow = self._read_quotes(follow, keys, out, synthetic)
+        if follow:
+            LATCHES.labels("quote", "timeout").inc(len(follow))
+            out.update(self._fetch_quotes(follow, keys, synthetic))
+
+        return self._tagged({s: out[s] for s in symbols if s in out}, synthetic)
+
+    @staticmethod
+    def _tagged(quotes: Dict[str, Quote], synthetic: Set[str]) -> Dict[str, Quote]:
+        return FallbackQuotes(quotes) if synthetic & quotes.keys() else quotes
+
+    def _read_quotes(self, symbols: List[str], keys: Dict[str, str], out: Dict[str, Quote],
+                     synthetic: Set[str]) -> List[str]:
+        """
+        MGET cached quotes into `out`; return the symbols still missing. A real
+        quote wins over a fallback one (kept under its own marker key, never
+        the real key that /v1/quotes reads directly).
+        """
+        missing: List[str] = []
+        real = self.r.mget([keys[s] for s in symbols] + [fallback_marker(keys[s]) for s in symbols])
+        n = len(symbols)
+        for s, raw, fake in zip(symbols, real[:n], real[n:]):
+            if raw is not None:
+                if raw != "null":  # "null" = upstream had nothing, recently
+                    out[s] = json.loads(raw)
+            elif fake is not None:
+                out[s] = json.loads(fake)
+                synthetic.add(s)
+            else:
+                missing.append(s)
+        return missing
+
+    def _fetch_quotes(self, symbols: List[str], keys: Dict[str, str], synthetic: Set[str]) -> Dict[str, Quote]:
+        quotes = self.inner.get_quotes(symbols)
+        pipe = self.r.pipeline(transaction=False)
+        if is_fallback(quotes):
+            for s, q in quotes.items():
+                pipe.set(fallback_marker(keys[s]), json.dumps(q), ex=FALLBACK_TTL)
+            pipe.execute()
+            synthetic.update(quotes)
+            return quotes
+        for s in symbols:
+            if s in quotes:
+                pipe.set(keys[s], json.dumps(quotes[s]), ex=self.quote_ttl)
+            else:
+                pipe.set(keys[s], "null", ex=EMPTY_TTL, nx=True)   # never blank a quote written meanwhile
+        pipe.execute()
+        return quotes
@@ -0,0 +1,41 @@
+# api/providers/factory.py
+from __future__ import annotations
+import os
+
+import redis
+
+from .bar_store import BarStore, BarStoreProvider
+from .base import Provider
+from .caching_provider import CachingProvider
+from .mock_provider import MockProvider
+from .resample import ResamplingProvider
+from .router import ProviderRouter
+from .yfinance_provider import YFinanceProvider
+
+
+def build_upstream(kind: str | None = None) -> Provider:
+    """
+    The uncached provider: router (YFinance, falling back to Mock).
+    Mock is only used when Yahoo fails or its breaker is open, never as a
+    hedge, and its results are tagged (FallbackBars / FallbackQuotes) so they
+    get a short TTL and aren't published as real data.
+    PROVIDER=mock skips Yahoo entirely (offline dev / load tests).
+    BAR_STORE_DIR enables the on-disk bar store in front of Yahoo (never Mock,
+    so synthetic fallback data is not persisted).
+    """
+    kind = (kind or os.getenv("PROVIDER", "yfinance")).lower()
+    if kind == "mock":
+        return MockProvider()
+    yahoo: Provider = YFinanceProvider()
+    store_dir = os.getenv("BAR_STORE_DIR")
+    if store_dir:
+        yahoo = BarStoreProvider(yahoo, BarStore(store_dir))
+    return ProviderRouter([yahoo], fallback=MockProvider(), hedge=False)
+
+
+def build_provider(redis_client: redis.Redis, kind: str | None = None) -> Provider:
+    """
+    The provider stack shared by the API and Celery workers:
+    resampler -> Redis cache -> upstream (see build_upstream).
+    """
+    return ResamplingProvider(CachingProvider(build_upstream(kind), redis_client))
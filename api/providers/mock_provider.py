@@ -1,72 +1,93 @@
 # api/providers/mock_provider.py
 from __future__ import annotations
 from typing import Dict, List
-from datetime import datetime, timezone, timedelta
-import math as _math
-import random
+from datetime import datetime, timezone
+import hashlib
+
+import numpy as np
+
+from .base import Provider, Quote, Bar, Interval, Range, INTERVAL_SECONDS
+
+# Calendar days per range; "max" is capped to a year of synthetic history
+_RANGE_DAYS = {
+    "1d":1, "5d":5, "1m":30, "3m":90, "6m":180,
+    "1y":365, "2y":730, "5y":1825, "max":365
+}
+
+
+def _stable_hash(text: str) -> int:
+    """64-bit hash that is identical in every process (unlike built-in hash())."""
+    return int.from_bytes(hashlib.blake2b(text.encode(), digest_size=8).digest(), "little")
+
+
+def _base_price(symbol: str) -> float:
+    return 50 + (_stable_hash(symbol) % 400) * 0.5   # 50 .. ~250
 
-from .base import Provider, Quote, Bar, Interval, Range
 
 class MockProvider(Provider):
+    """
+    Deterministic synthetic data, vectorized with NumPy.
+
+    Seeds come from a stable hash of the symbol, so every uvicorn/Celery process
+    returns the same series (up to the wall-clock anchor of the last bar).
+    `max_bars=None` lifts the per-series cap for load testing.
+    """
     name = "MockProvider"
 
-    def __init__(self) -> None:
-        pass
+    def __init__(self, max_bars: int | None = 1200) -> None:
+        self.max_bars = max_bars
 
-    def _rng(self, seed_text: str) -> random.Random:
-        return random.Random(hash(seed_text) & 0xFFFFFFFF)
+    def _rng(self, seed_text: str) -> np.random.Generator:
+        return np.random.default_rng(_stable_hash(seed_text))
 
     def get_quotes(self, symbols: List[str]) -> Dict[str, Quote]:
+        if not symbols:
+            return {}
         now = datetime.now(timezone.utc).isoformat()
-        out: Dict[str, Quote] = {}
-        for sym in symbols:
-            r = self._rng(f"quote:{sym}")
-            base = 50 + (abs(hash(sym)) % 400) * 0.5   # 50 .. ~250
-            drift = (r.random() - 0.5) * 2.0           # -1..+1
-            price = round(base * (1 + drift * 0.01), 2)
-            changePct = round(drift, 2)                # pretend drift is %
-            change = round(price * changePct / 100.0, 2)
-            out[sym] = Quote(
-                symbol=sym,
-                price=price,
-                change=change,
-                changePct=changePct,
-                ts=now,
-            )
-        return out
 
-    def get_ohlc(self, symbol: str, interval: Interval, range_: Range) -> List[Bar]:
-        step_min = {"1m":1, "5m":5, "15m":15, "1h":60, "1d":1440}[interval]
-        range_days = {
-            "1d":1, "5d":5, "1m":30, "3m":90, "6m":180,
-            "1y":365, "2y":730, "5y":1825, "max":365
-        }[range_]
-        max_bars = min((range_days*1440)//step_min, 1200)
+        hashes = [_stable_hash(f"quote:{sym}") for sym in symbols]
+        base = np.array([_base_price(sym) for sym in symbols])
+        drift = (np.array([h & 0xFFFFFFFF for h in hashes]) / 2**32 - 0.5) * 2.0  # -1..+1
+        price = np.round(base * (1 + drift * 0.01), 2)
+        change_pct = np.round(drift, 2)                # pretend drift is %
+        change = np.round(price * change_pct / 100.0, 2)
+
+        return {
+            sym: Quote(symbol=sym, price=p, change=c, changePct=cp, ts=now)
+            for sym, p, c, cp in zip(symbols, price.tolist(), change.tolist(), change_pct.tolist())
+        }
+
+    def ohlc_arrays(self, symbol: str, interval: Interval, range_: Range) -> Dict[str, np.ndarray]:
+        """Column form of get_ohlc: t (datetime64[s], UTC), o/h/l/c (float64), v (int64)."""
+        step_s = INTERVAL_SECONDS[interval]
+        n = (_RANGE_DAYS[range_] * 86400) // step_s
+        if self.max_bars is not None:
+            n = min(n, self.max_bars)
 
         r = self._rng(f"ohlc:{symbol}")
-        base = 50 + (abs(hash(symbol)) % 400) * 0.5
-
-        bars: List[Bar] = []
-        now = datetime.now(timezone.utc).replace(second=0, microsecond=0)
-        start = now - timedelta(minutes=step_min * max_bars)
-        price = base
-        for i in range(max_bars):
-            t = start + timedelta(minutes=i*step_min)
-            angle = (i / max(10, max_bars)) * 2 * _math.pi
-            drift = _math.sin(angle) * 0.015 * base
-            noise = (r.random() - 0.5) * 0.004 * base
-            close = max(1.0, base + drift + noise)
-            high = close * (1 + abs(r.random()) * 0.002)
-            low  = close * (1 - abs(r.random()) * 0.002)
-            open_ = (close + price) / 2
-            vol = int(1_000 + r.random() * 9_000)
-            price = close
-            bars.append(Bar(
-                t=t.isoformat(),
-                o=round(open_, 2),
-                h=round(high, 2),
-                l=round(low, 2),
-                c=round(close, 2),
-                v=vol,
-            ))
-        return bars
+        base = _base_price(symbol)
+
+        now = np.datetime64(datetime.now(timezone.utc).replace(second=0, microsecond=0, tzinfo=None), "s")
+        i = np.arange(n)
+        t = now - np.timedelta64(step_s, "s") * (n - i)
+
+        angle = (i / max(10, n)) * 2 * np.pi
+        drift = np.sin(angle) * 0.015 * base
+        noise = (r.random(n) - 0.5) * 0.004 * base
+        close = np.maximum(1.0, base + drift + noise)
+        high = close * (1 + r.random(n) * 0.002)
+        low = close * (1 - r.random(n) * 0.002)
+        prev = np.concatenate(([base], close[:-1]))
+        open_ = (close + prev) / 2
+        vol = (1_000 + r.random(n) * 9_000).astype(np.int64)
+
+        return {"t": t, "o": open_, "h": high, "l": low, "c": close, "v": vol}
+
+    def get_ohlc(self, symbol: str, interval: Interval, range_: Range) -> List[Bar]:
+        a = self.ohlc_arrays(symbol, interval, range_)
+        stamps = np.char.add(np.datetime_as_string(a["t"], unit="s"), "+00:00").tolist()
+        o, h, l, c = (np.round(a[k], 2).tolist() for k in ("o", "h", "l", "c"))
+        return [
+            Bar(t=t, o=o_, h=h_, l=l_, c=c_, v=v_)
+            for t, o_, h_, l_, c_, v_ in zip(stamps, o, h, l, c, a["v"].tolist())
+        ]
@@ -0,0 +1,155 @@
+# api/providers/resample.py
+from __future__ import annotations
+from typing import Dict, List, Optional, Tuple
+import json
+import time
+
+import numpy as np
+import pandas as pd
+
+from .base import Provider, Quote, Bar, Interval, Range, INTERVAL_SECONDS, RANGE_DAYS
+from .series import BarColumns, trim_to_range
+
+SESSION_TZ = "America/New_York"
+SESSION_OPEN_S = 9 * 3600 + 30 * 60   # 09:30 local
+
+# Finer intervals each interval can be built from, coarsest (cheapest) first
+_SOURCES: Dict[str, Tuple[str, ...]] = {
+    "5m": ("1m",),
+    "15m": ("5m", "1m"),
+    "1h": ("15m", "5m", "1m"),
+    "1d": ("1h", "15m", "5m", "1m"),
+}
+
+
+def _bucket_starts(t: np.ndarray, interval: str, session_tz: str | None, session_open_s: int) -> np.ndarray:
+    """
+    UTC start of the target bucket for every bar start in `t` (epoch seconds).
+
+    With a session timezone, buckets are aligned in exchange-local time:
+    intraday buckets are anchored at the session open (so 1h bars run 09:30,
+    10:30, ... like Yahoo's) and daily buckets at local midnight.
+    Without one, buckets are plain multiples of the interval since the epoch.
+    """
+    step = INTERVAL_SECONDS[interval]
+    if session_tz is None:
+        return t - t % step
+
+    utc = pd.to_datetime(t, unit="s", utc=True)
+    local = utc.tz_convert(session_tz).tz_localize(None).as_unit("s").asi8
+    day = local - local % 86400
+    if interval == "1d":
+        bucket_local = day
+    else:
+        sec = local - day
+        bucket_local = day + session_open_s + ((sec - session_open_s) // step) * step
+    # Same-day offset, so shift by the local distance back to the bucket start
+    return t - (local - bucket_local)
+
+
+def resample(
+    cols: BarColumns,
+    interval: str,
+    session_tz: str | None = SESSION_TZ,
+    session_open_s: int = SESSION_OPEN_S,
+) -> BarColumns:
+    """
+    Aggregate finer bars (sorted by t) into `interval` bars:
+    open=first, high=max, low=min, close=last, volume=sum (NaN if all missing).
+    """
+    n = len(cols)
+    if n == 0:
+        return BarColumns.empty()
+
+    buckets = _bucket_starts(cols.t, interval, session_tz, session_open_s)
+    starts = np.r_[0, np.flatnonzero(np.diff(buckets)) + 1]
+    ends = np.r_[starts[1:], n] - 1
+
+    have_v = ~np.isnan(cols.v)
+    v_sum = np.add.reduceat(np.where(have_v, cols.v, 0.0), starts)
+    v_cnt = np.add.reduceat(have_v.astype(np.int64), starts)
+
+    return BarColumns(
+        buckets[starts],
+        cols.o[starts],
+        np.maximum.reduceat(cols.h, starts),
+        np.minimum.reduceat(cols.l, starts),
+        cols.c[ends],
+        np.where(v_cnt > 0, v_sum, np.nan),
+    )
+
+
+def _covers(bars: List[Bar], range_: str) -> bool:
+    """Does a cached finer series reach back far enough for `range_`?"""
+    days = RANGE_DAYS[range_]
+    if not bars:
+        return False
+    if days is None:
+        return False  # can't prove a finer series holds 'max' history
+    if range_ in ("1d", "5d"):
+        return len({b["t"][:10] for b in bars}) >= days
+    oldest = time.time() - days * 86400 + 86400   # one day of slack
+    return BarColumns.from_bars(bars[:1]).t[0] <= oldest
+
+
+class ResamplingProvider(Provider):
+    """
+    Serves coarser intervals from finer bars that are already cached, e.g. a
+    user flipping 1m -> 5m -> 15m -> 1h on the same chart costs one download.
+
+    `inner` should expose peek_ohlc(symbol, [(interval, range), ...]) returning
+    raw cached JSON (CachingProvider does); otherwise this is a pass-through.
+    """
+
+    def __init__(self, inner: Provider, session_tz: str | None = SESSION_TZ) -> None:
+        self.inner = inner
+        self.name = inner.name
+        self.session_tz = session_tz
+
+    def get_quotes(self, symbols: List[str]) -> Dict[str, Quote]:
+        return self.inner.get_quotes(symbols)
+
+    def get_ohlc(self, symbol: str, interval: Interval, range_: Range) -> List[Bar]:
+        bars = self._from_finer(symbol, interval, range_)
+        if bars is not None:
+            return bars
+        return self.inner.get_ohlc(symbol, interval, range_)
+
+    def get_ohlc_versioned(
+        self, symbol: str, interval: Interval, range_: Range, count: bool = True
+    ) -> Tuple[List[Bar], Optional[str]]:
+        """(bars, stored version); resampled bars have none stored (None)."""
+        bars = self._from_finer(symbol, interval, range_)
+        if bars is not None:
+            return bars, None
+        versioned = getattr(self.inner, "get_ohlc_versioned", None)
+        if versioned is None:
+            return self.inner.get_ohlc(symbol, interval, range_), None
+        return versioned(symbol, interval, range_, count)
+
+    def ohlc_version(self, symbol: str, interval: Interval, range_: Range) -> Optional[str]:
+        lookup = getattr(self.inner, "ohlc_version", None)
+        return lookup(symbol, interval, range_) if lookup is not None else None
+
+    def _from_finer(self, symbol: str, interval: str, range_: str) -> Optional[List[Bar]]:
+        peek = getattr(self.inner, "peek_ohlc", None)
+        sources = _SOURCES.get(interval)
+        if peek is None or not sources:
+            return None
+
+        want = RANGE_DAYS[range_]
+        ranges = [
+            r for r, d in RANGE_DAYS.items()
+            if d is None or (want is not None and d >= want)
+        ]
+        pairs = [(src, r) for src in sources for r in ranges]
+        for (src, r), raw in zip(pairs, peek(symbol, pairs)):
+            if raw is None:
+                continue
+            fine = json.loads(raw)
+            if not _covers(fine, range_):
+                continue
+            cols = resample(BarColumns.from_bars(fine), interval, self.session_tz)
+            return trim_to_range(cols.to_bars(), range_)
+        return None
+
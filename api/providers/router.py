@@ -0,0 +1,248 @@
+# api/providers/router.py
+from __future__ import annotations
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+import logging
+import threading
+import time
+
+from metrics import histogram
+from .base import FallbackBars, FallbackQuotes, Provider, Quote, Bar, Interval, Range
+
+log = logging.getLogger(__name__)
+
+# Every attempt the router makes (hedges included); outcome ok, empty or error
+PROVIDER_CALLS = histogram("provider_call_duration_seconds", "Upstream provider calls by provider, method and outcome.",
+                           ("provider", "method", "outcome"))
+
+
+class CircuitBreaker:
+    """
+    Rolling-window breaker for one provider.
+
+    closed    -> calls flow; opens when, over the last `window` calls (and at
+                 least `min_calls`), the error rate or slow-call rate crosses
+                 its threshold.
+    open      -> calls are skipped until `cooldown` seconds have passed.
+    half_open -> one trial call is let through; success closes, failure reopens.
+    """
+
+    def __init__(
+        self,
+        window: int = 50,
+        min_calls: int = 10,
+        error_rate: float = 0.5,
+        slow_call_s: float = 5.0,
+        slow_rate: float = 0.5,
+        cooldown: float = 30.0,
+    ) -> None:
+        self.window = window
+        self.min_calls = min_calls
+        self.error_rate = error_rate
+        self.slow_call_s = slow_call_s
+        self.slow_rate = slow_rate
+        self.cooldown = cooldown
+
+        self.state = "closed"
+        self._opened_at = 0.0
+        self._trial_in_flight = False
+        self._outcomes: deque = deque(maxlen=window)    # (ok, slow)
+        self._latencies: deque = deque(maxlen=window)   # seconds, successful calls
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == "closed":
+                return True
+            if self.state == "open" and time.monotonic() - self._opened_at >= self.cooldown:
+                self.state = "half_open"
+                self._trial_in_flight = False
+            if self.state == "half_open" and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return True
+            return False
+
+    def record(self, ok: bool, latency: float) -> None:
+        slow = latency >= self.slow_call_s
+        with self._lock:
+            if ok:
+                self._latencies.append(latency)
+
+            if self.state == "half_open":
+                self._trial_in_flight = False
+                if ok and not slow:
+                    self.state = "closed"
+                    self._outcomes.clear()
+                else:
+                    self._open()
+                return
+
+            self._outcomes.append((ok, slow))
+            n = len(self._outcomes)
+            if self.state == "closed" and n >= self.min_calls:
+                errors = sum(1 for o, _ in self._outcomes if not o)
+                slows = sum(1 for _, s in self._outcomes if s)
+                if errors / n >= self.error_rate or slows / n >= self.slow_rate:
+                    self._open()
+
+    def _open(self) -> None:
+        self.state = "open"
+        self._opened_at = time.monotonic()
+        self._outcomes.clear()
+
+    def p95(self, min_samples: int = 20) -> Optional[float]:
+        with self._lock:
+            if len(self._latencies) < min_samples:
+                return None
+            ordered = sorted(self._latencies)
+        return ordered[min(len(ordered) - 1, int(0.95 * len(ordered)))]
+
+
+class ProviderRouter(Provider):
+    """
+    Provider over an ordered list of providers (primary first).
+
+    Each provider sits behind a CircuitBreaker; open breakers are skipped.
+    With `hedge=True`, if the current provider hasn't answered within its
+    p95-derived deadline, the next one is fired too and whichever returns a
+    usable result first wins. Without hedging the next provider is only
+    tried on error/empty, or once `attempt_timeout` has passed. A call never
+    blocks longer than `timeout` overall.
+
+    `fallback` is a last resort (e.g. synthetic data), never raced against
+    the others: it is only called when every provider failed, timed out or
+    was skipped by its breaker (not when one answered "no data"), and its
+    results come back tagged as FallbackBars / FallbackQuotes so callers can
+    cache them briefly and keep them away from stores and stream clients.
+    """
+
+    name = "Router"
+
+    def __init__(
+        self,
+        providers: Sequence[Provider],
+        fallback: Optional[Provider] = None,
+        hedge: bool = True,
+        hedge_default_s: float = 1.0,
+        hedge_min_s: float = 0.1,
+        hedge_max_s: float = 5.0,
+        attempt_timeout: float = 10.0,
+        timeout: float = 15.0,
+        max_workers: int = 32,
+        breaker_factory: Callable[[], CircuitBreaker] = CircuitBreaker,
+    ) -> None:
+        if not providers:
+            raise ValueError("ProviderRouter needs at least one provider")
+        self.providers = list(providers)
+        self.fallback = fallback
+        self.hedge = hedge
+        self.hedge_default_s = hedge_default_s
+        self.hedge_min_s = hedge_min_s
+        self.hedge_max_s = hedge_max_s
+        self.attempt_timeout = attempt_timeout
+        self.timeout = timeout
+        everyone = self.providers + ([fallback] if fallback is not None else [])
+        self.breakers: Dict[str, CircuitBreaker] = {p.name: breaker_factory() for p in everyone}
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="provider")
+
+    # ---------- Provider protocol ----------
+
+    def get_quotes(self, symbols: List[str]) -> Dict[str, Quote]:
+        if not symbols:
+            return {}
+        return self._route("get_quotes", (symbols,), empty={}, tag=FallbackQuotes)
+
+    def get_ohlc(self, symbol: str, interval: Interval, range_: Range) -> List[Bar]:
+        return self._route("get_ohlc", (symbol, interval, range_), empty=[], tag=FallbackBars)
+
+    # ---------- routing ----------
+
+    def _next_deadline(self, provider: Provider) -> float:
+        """How long to give `provider` before firing the next one."""
+        if not self.hedge:
+            return self.attempt_timeout
+        p95 = self.breakers[provider.name].p95()
+        if p95 is None:
+            return self.hedge_default_s
+        return min(self.hedge_max_s, max(self.hedge_min_s, p95))
+
+    def _call(self, provider: Provider, method: str, args: Tuple) -> Tuple[bool, Any]:
+        t0 = time.monotonic()
+        try:
+            value = getattr(provider, method)(*args)
+            ok = True
+        except Exception as e:
+            log.warning("%s.%s failed: %s", provider.name, method, e)
+            value, ok = None, False
+        elapsed = time.monotonic() - t0
+        self.breakers[provider.name].record(ok, elapsed)
+        outcome = "error" if not ok else "ok" if value else "empty"
+        PROVIDER_CALLS.labels(provider.name, method, outcome).observe(elapsed)
+        return ok, value
+
+    def _route(self, method: str, args: Tuple, empty: Any, tag: type) -> Any:
+        give_up = time.monotonic() + self.timeout
+        answered, value = self._route_primaries(method, args, give_up)
+        if value:
+            return value
+        if answered or self.fallback is None:
+            return empty   # a provider answered "no data": don't make some up
+        ok, value = self._call(self.fallback, method, args)
+        return tag(value) if ok and value else empty
+
+    def _route_primaries(self, method: str, args: Tuple, give_up: float) -> Tuple[bool, Any]:
+        """(some provider answered without error, first usable value or None)."""
+        order = self.providers
+        pending: Dict[Future, Provider] = {}
+        next_idx = 0
+        answered = False
+
+        def submit(provider: Provider) -> Provider:
+            pending[self._pool.submit(self._call, provider, method, args)] = provider
+            return provider
+
+        def launch() -> Optional[Provider]:
+            # Breakers are consulted lazily so a half-open trial slot is only
+            # taken when we actually call that provider.
+            nonlocal next_idx
+            while next_idx < len(order):
+                provider = order[next_idx]
+                next_idx += 1
+                if self.breakers[provider.name].allow():
+                    return submit(provider)
+            return None
+
+        current = launch()
+        if current is None:
+            if self.fallback is not None:
+                return False, None   # everything tripped: straight to the fallback
+            # No fallback: still try the last provider rather than fail outright
+            current = submit(order[-1])
+
+        while pending:
+            remaining = give_up - time.monotonic()
+            if remaining <= 0:
+                break
+            budget = remaining
+            if next_idx < len(order):
+                budget = min(budget, self._next_deadline(current))
+
+            done, _ = wait(pending, timeout=budget, return_when=FIRST_COMPLETED)
+            if not done:
+                # Current provider is slow: hedge / fall back to the next one
+                current = launch() or current
+                continue
+
+            for fut in done:
+                pending.pop(fut)
+                ok, value = fut.result()
+                if ok and value:
+                    return True, value
+                answered = answered or ok
+
+            if not pending:
+                current = launch() or current
+
+        # Nothing usable; stragglers keep running in the pool and feed their breakers
+        return answered, None
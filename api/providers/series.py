@@ -0,0 +1,131 @@
+# api/providers/series.py
+"""Helpers shared by providers that keep, merge or store bar series."""
+from __future__ import annotations
+from typing import List
+from datetime import datetime, timedelta, timezone
+import hashlib
+
+import numpy as np
+
+from .base import Bar, RANGE_DAYS
+
+
+def raw_version(raw: str, synthetic: bool = False) -> str:
+    """
+    Version of a series from its JSON text (json.dumps(bars), as cached):
+    any change to any bar gives a new one, and synthetic fallback data never
+    shares a version with real bars.
+    """
+    h = hashlib.blake2b(digest_size=12)
+    if synthetic:
+        h.update(b"fallback|")
+    h.update(raw.encode())
+    return h.hexdigest()
+
+
+def trim_to_range(bars: List[Bar], range_: str) -> List[Bar]:
+    """
+    Drop bars older than the requested range. '1d'/'5d' mean trading sessions,
+    so those keep the last N distinct session dates; longer ranges are calendar.
+    """
+    days = RANGE_DAYS[range_]
+    if days is None or not bars:
+        return bars
+    if range_ in ("1d", "5d"):
+        dates: set = set()
+        for i in range(len(bars) - 1, -1, -1):
+            dates.add(bars[i]["t"][:10])
+            if len(dates) > days:
+                return bars[i + 1:]
+        return bars
+    cutoff = (datetime.now(timezone.utc) - timedelta(days=days)).isoformat()
+    for i, b in enumerate(bars):
+        if b["t"] >= cutoff:
+            return bars[i:] if i else bars
+    return []
+
+
+def merge_tail(bars: List[Bar], tail: List[Bar]) -> List[Bar]:
+    """Replace the still-forming last bar(s) with `tail` and append anything newer."""
+    if not tail:
+        return bars
+    first = tail[0]["t"]
+    keep = len(bars)
+    while keep and bars[keep - 1]["t"] >= first:
+        keep -= 1
+    return bars[:keep] + tail
+
+
+class BarColumns:
+    """
+    Array-backed bar series: `t` is epoch seconds (int64, UTC bar start),
+    o/h/l/c are float64 and `v` is float64 with NaN for missing volume.
+    """
+    __slots__ = ("t", "o", "h", "l", "c", "v")
+
+    FIELDS = ("t", "o", "h", "l", "c", "v")
+
+    def __init__(self, t, o, h, l, c, v) -> None:
+        self.t = np.asarray(t, dtype=np.int64)
+        self.o = np.asarray(o, dtype=np.float64)
+        self.h = np.asarray(h, dtype=np.float64)
+        self.l = np.asarray(l, dtype=np.float64)
+        self.c = np.asarray(c, dtype=np.float64)
+        self.v = np.asarray(v, dtype=np.float64)
+
+    def __len__(self) -> int:
+        return len(self.t)
+
+    @classmethod
+    def empty(cls) -> "BarColumns":
+        return cls(*([],) * 6)
+
+    @classmethod
+    def from_bars(cls, bars: List[Bar]) -> "BarColumns":
+        if not bars:
+            return cls.empty()
+        # Contract timestamps are UTC ISO-8601; the first 19 chars are the wall time
+        t = np.array([b["t"][:19] for b in bars], dtype="datetime64[s]").astype(np.int64)
+        return cls(
+            t,
+            [b["o"] for b in bars],
+            [b["h"] for b in bars],
+            [b["l"] for b in bars],
+            [b["c"] for b in bars],
+            [np.nan if b.get("v") is None else b["v"] for b in bars],
+        )
+
+    def to_bars(self) -> List[Bar]:
+        if len(self) == 0:
+            return []
+        stamps = np.char.add(np.datetime_as_string(self.t.astype("datetime64[s]"), unit="s"), "+00:00")
+        missing = np.isnan(self.v)
+        vols = np.where(missing, 0, self.v).astype(np.int64).tolist()
+        if missing.any():
+            vols = [None if m else x for x, m in zip(vols, missing.tolist())]
+        return [
+            Bar(t=t, o=o, h=h, l=l, c=c, v=v)
+            for t, o, h, l, c, v in zip(
+                stamps.tolist(), self.o.tolist(), self.h.tolist(),
+                self.l.tolist(), self.c.tolist(), vols,
+            )
+        ]
+
+    def between(self, start: int | None = None, end: int | None = None) -> "BarColumns":
+        """Bars with start <= t < end (epoch seconds; None = unbounded)."""
+        lo = 0 if start is None else int(np.searchsorted(self.t, start, side="left"))
+        hi = len(self) if end is None else int(np.searchsorted(self.t, end, side="left"))
+        return BarColumns(*(getattr(self, f)[lo:hi] for f in self.FIELDS))
+
+    def merge(self, newer: "BarColumns") -> "BarColumns":
+        """Union by timestamp, `newer` wins on collisions; result sorted by t."""
+        if len(newer) == 0:
+            return self
+        if len(self) == 0:
+            return newer
+        cat = {f: np.concatenate((getattr(self, f), getattr(newer, f))) for f in self.FIELDS}
+        # Last occurrence of each t wins: unique over the reversed array
+        rev_t = cat["t"][::-1]
+        _, first_in_rev = np.unique(rev_t, return_index=True)
+        keep = len(rev_t) - 1 - first_in_rev   # ascending t order
+        return BarColumns(*(cat[f][keep] for f in self.FIELDS))
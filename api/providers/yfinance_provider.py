@@ -1,12 +1,20 @@
 # api/providers/yfinance_provider.py
 from __future__ import annotations
 from typing import Dict, List
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timezone
+import logging
+import threading
+import time
 
-import yfinance as yf
+import numpy as np
 import pandas as pd
+import yfinance as yf
 
-from .base import Provider, Quote, Bar, Interval, Range
+from metrics import histogram
+from .base import Provider, Quote, Bar, Interval, Range, RANGE_DAYS
+from .series import merge_tail, trim_to_range
 
 # Map our contract intervals/ranges to yfinance
 _YF_INTERVAL = {"1m": "1m", "5m": "5m", "15m": "15m", "1h": "60m", "1d": "1d"}
@@ -14,6 +22,15 @@ _YF_RANGE    = {"1d":"1d","5d":"5d","1m":"1mo","3m":"3mo","6m":"6mo","1y":"1y","
 
 _EXPECTED = {"open", "high", "low", "close", "volume"}
 
+log = logging.getLogger(__name__)
+
+# Raw Yahoo round trips (below the router's per-provider view); outcome ok, empty or error
+YAHOO_CALLS = histogram("yahoo_request_duration_seconds", "yfinance calls by call and outcome.", ("call", "outcome"))
+
+
+class YahooUnavailable(RuntimeError):
+    """Every Yahoo call for a request raised; nothing (not even "no data") came back."""
+
 
 # ---------- helpers ----------
 
@@ -94,51 +111,84 @@ def _flatten_and_normalize(df: pd.DataFrame | None) -> pd.DataFrame:
 
 
 def _bars_from_df(df: pd.DataFrame) -> List[Bar]:
-    bars: List[Bar] = []
-    for idx, row in df.iterrows():
-        ts = pd.Timestamp(idx)
-        if ts.tzinfo is None:
-            ts = ts.tz_localize("UTC")
-        else:
-            ts = ts.tz_convert("UTC")
-        # By now row['Close'] etc. are scalars (we deduped columns)
-        bars.append(
-            Bar(
-                t=ts.isoformat(),
-                o=round(float(row["Open"]),  4),
-                h=round(float(row["High"]),  4),
-                l=round(float(row["Low"]),   4),
-                c=round(float(row["Close"]), 4),
-                v=int(row["Volume"]) if "Volume" in df.columns and not pd.isna(row.get("Volume")) else None,
-            )
-        )
-    bars.sort(key=lambda b: b["t"])  # oldest → newest
-    return bars
+    """
+    Vectorized DataFrame -> List[Bar]. Index is UTC-normalized once, OHLC columns
+    are rounded in bulk and NaN volume is resolved with a single mask; we only
+    sort when the index isn't already oldest -> newest.
+    """
+    if len(df) == 0:
+        return []
+
+    idx = pd.DatetimeIndex(df.index)
+    if idx.tz is None:
+        idx = idx.tz_localize("UTC")
+    else:
+        idx = idx.tz_convert("UTC")
+
+    if not idx.is_monotonic_increasing:
+        order = np.argsort(idx.asi8, kind="stable")  # oldest → newest
+        idx = idx[order]
+        df = df.iloc[order]
+
+    # Same text as Timestamp.isoformat() for whole-second UTC bars
+    stamps = np.char.add(
+        np.datetime_as_string(idx.tz_convert(None).to_numpy(), unit="s"), "+00:00"
+    ).tolist()
+
+    # By now df['Close'] etc. are single columns (we deduped columns)
+    ohlc = df[["Open", "High", "Low", "Close"]].to_numpy(dtype="float64").round(4)
+    o, h, l, c = (ohlc[:, i].tolist() for i in range(4))
+
+    if "Volume" in df.columns:
+        vol = df["Volume"].to_numpy(dtype="float64")
+        missing = np.isnan(vol)
+        v = np.where(missing, 0, vol).astype("int64").tolist()
+        if missing.any():
+            v = [None if m else x for x, m in zip(v, missing.tolist())]
+    else:
+        v = [None] * len(stamps)
 
+    return [
+        Bar(t=t, o=o_, h=h_, l=l_, c=c_, v=v_)
+        for t, o_, h_, l_, c_, v_ in zip(stamps, o, h, l, c, v)
+    ]
 
-def _safe_download(symbol: str, interval: str, period: str, group_by: str) -> pd.DataFrame:
-    """Try yf.download with given group_by ('column' or 'ticker'), normalize or return empty."""
+
+def _safe_download(
+    symbol: str, interval: str, period: str | None, group_by: str, start: datetime | None = None
+) -> pd.DataFrame | None:
+    """
+    Try yf.download with given group_by ('column' or 'ticker') and normalize.
+    Empty frame = Yahoo answered with no rows; None = the call raised.
+    Pass `start` instead of `period` to fetch only the window since that instant.
+    """
+    window = {"start": start} if start is not None else {"period": period}
+    t0 = time.perf_counter()
     try:
         df = yf.download(
             tickers=symbol,
             interval=interval,
-            period=period,
+            **window,
             auto_adjust=False,
             prepost=False,
             progress=False,
             threads=False,     # more predictable on Windows
             group_by=group_by, # "column" or "ticker"
         )
-    except Exception:
+    except Exception as e:
+        log.debug("yf.download %s %s failed: %s", symbol, interval, e)
         df = None
-    return _flatten_and_normalize(df)
+    out = _flatten_and_normalize(df)
+    _observe_yahoo("download", t0, df, out)
+    return None if df is None else out
 
 
-def _safe_history(symbol: str, interval: str, period: str) -> pd.DataFrame:
+def _safe_history(symbol: str, interval: str, period: str) -> pd.DataFrame | None:
     """
-    Fallback to Ticker.history; if SciPy is required internally and missing,
-    yfinance throws — we swallow and return empty.
+    Fallback to Ticker.history; same contract as _safe_download (None when it
+    raised, e.g. SciPy is required internally and missing).
     """
+    t0 = time.perf_counter()
     try:
         tkr = yf.Ticker(symbol)
         df = tkr.history(
@@ -149,9 +199,17 @@ def _safe_history(symbol: str, interval: str, period: str) -> pd.DataFrame:
             prepost=False,
             repair=True,
         )
-    except Exception:
+    except Exception as e:
+        log.debug("Ticker.history %s %s failed: %s", symbol, interval, e)
         df = None
-    return _flatten_and_normalize(df)
+    out = _flatten_and_normalize(df)
+    _observe_yahoo("history", t0, df, out)
+    return None if df is None else out
+
+
+def _observe_yahoo(call: str, t0: float, raw: pd.DataFrame | None, out: pd.DataFrame) -> None:
+    outcome = "error" if raw is None else "empty" if out.empty else "ok"
+    YAHOO_CALLS.labels(call, outcome).observe(time.perf_counter() - t0)
 
 
 def _fallback_periods(interval: str, requested: str) -> List[str]:
@@ -172,76 +230,289 @@ def _fallback_periods(interval: str, requested: str) -> List[str]:
     return out
 
 
+def _download_quote_chunk(symbols: List[str]) -> pd.DataFrame:
+    """One batched yf.download for a chunk of symbols; raises on upstream failure."""
+    t0 = time.perf_counter()
+    try:
+        df = yf.download(
+            tickers=symbols,
+            interval="1d",
+            period="2d",
+            auto_adjust=False,
+            prepost=False,
+            progress=False,
+            threads=False,     # we already parallelize across chunks
+            group_by="ticker", # top column level = symbol
+        )
+    except Exception:
+        YAHOO_CALLS.labels("download_quotes", "error").observe(time.perf_counter() - t0)
+        raise
+    outcome = "empty" if df is None or df.empty else "ok"
+    YAHOO_CALLS.labels("download_quotes", outcome).observe(time.perf_counter() - t0)
+    return df
+
+
+def _closes_for(df: pd.DataFrame | None, symbol: str) -> pd.Series | None:
+    """Pull one symbol's Close series out of a ticker-grouped batch frame."""
+    if df is None or len(df) == 0:
+        return None
+    if isinstance(df.columns, pd.MultiIndex):
+        if (symbol, "Close") in df.columns:
+            # Fast path: the usual (ticker, field) layout
+            closes = pd.to_numeric(df[(symbol, "Close")], errors="coerce").dropna()
+            return closes if len(closes) > 0 else None
+        if symbol not in df.columns.get_level_values(0):
+            return None
+        sub = df[symbol]
+    else:
+        sub = df  # single-symbol download may come back flat
+    sub = _flatten_and_normalize(sub.copy())
+    if len(sub) == 0:
+        return None
+    return sub["Close"]
+
+
+def _quote_from_closes(symbol: str, closes: pd.Series, now_iso: str) -> Quote:
+    last_price = float(closes.iloc[-1])
+    prev_close = float(closes.iloc[-2]) if len(closes) > 1 else None
+
+    if prev_close is None or prev_close == 0:
+        change = 0.0
+        change_pct = 0.0
+    else:
+        change = round(last_price - prev_close, 4)
+        change_pct = round((change / prev_close) * 100.0, 4)
+
+    return Quote(
+        symbol=symbol,
+        price=round(last_price, 4),
+        change=round(change, 4),
+        changePct=round(change_pct, 4),
+        ts=now_iso,
+    )
+
+
+class _ExpiringMemo:
+    """Tiny thread-safe LRU of key -> value with a fixed TTL per entry."""
+
+    def __init__(self, ttl: float, maxsize: int = 4096) -> None:
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._data: "OrderedDict[tuple, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: tuple):
+        with self._lock:
+            hit = self._data.get(key)
+            if hit is None:
+                return None
+            value, expires = hit
+            if time.monotonic() >= expires:
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key: tuple, value) -> None:
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + self.ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def discard(self, key: tuple) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+
+
+class _Series:
+    """Last full series we served for a (symbol, interval), plus what it covers."""
+    __slots__ = ("bars", "range_", "fetched_at")
+
+    def __init__(self, bars: List[Bar], range_: str) -> None:
+        self.bars = bars
+        self.range_ = range_
+        self.fetched_at = time.monotonic()
+
+    def covers(self, range_: str) -> bool:
+        have, want = RANGE_DAYS[self.range_], RANGE_DAYS[range_]
+        return have is None or (want is not None and want <= have)
+
+
 # ---------- provider ----------
 
 class YFinanceProvider(Provider):
     name = "YFinance"
 
-    def get_quotes(self, symbols: List[str]) -> Dict[str, Quote]:
-        if not symbols:
-            return {}
+    def __init__(
+        self,
+        quote_chunk_size: int = 100,
+        quote_workers: int = 4,
+        incremental: bool = True,
+        series_max_age: float = 6 * 3600,
+        max_series: int = 512,
+        ladder_memo_ttl: float = 3600,
+        empty_ttl: float = 120,
+    ) -> None:
+        self.quote_chunk_size = max(1, quote_chunk_size)
+        self.quote_workers = max(1, quote_workers)
+
+        # Incremental OHLC: keep the last series per (symbol, interval) and only
+        # pull the tail since its last bar; full refetch after series_max_age.
+        self.incremental = incremental
+        self.series_max_age = series_max_age
+        self.max_series = max_series
+        self._series: "OrderedDict[tuple, _Series]" = OrderedDict()
+        self._series_lock = threading.Lock()
+
+        # Fallback ladder memo: which (period, method) last worked per request,
+        # and a short negative cache for tickers where every rung came back empty.
+        self._ladder_memo = _ExpiringMemo(ladder_memo_ttl)
+        self._empty = _ExpiringMemo(empty_ttl)
+
+    def _quotes_for_chunk(self, chunk: List[str], now_iso: str) -> Dict[str, Quote] | None:
+        """Quotes for one chunk; None if the download itself failed."""
+        try:
+            df = _download_quote_chunk(chunk)
+        except Exception as e:
+            log.warning("quote chunk failed (%d symbols): %s", len(chunk), e)
+            return None
 
-        tickers = yf.Tickers(" ".join(symbols))
-        now_iso = datetime.now(timezone.utc).isoformat()
         out: Dict[str, Quote] = {}
-
-        for sym in symbols:
+        for sym in chunk:
             try:
-                info = tickers.tickers.get(sym)
+                closes = _closes_for(df, sym)
             except Exception:
-                info = None
+                closes = None
+            if closes is not None:
+                out[sym] = _quote_from_closes(sym, closes, now_iso)
+        return out
 
-            last_price = None
-            prev_close = None
-            try:
-                hist = info.history(period="2d", interval="1d")
-                if isinstance(hist, pd.DataFrame) and len(hist) > 0:
-                    last_price = float(hist["Close"].iloc[-1])
-                    if len(hist) > 1:
-                        prev_close = float(hist["Close"].iloc[-2])
-            except Exception:
-                pass
+    def get_quotes(self, symbols: List[str]) -> Dict[str, Quote]:
+        if not symbols:
+            return {}
 
-            if last_price is None:
-                continue
+        symbols = list(dict.fromkeys(symbols))  # dedupe, keep order
+        now_iso = datetime.now(timezone.utc).isoformat()
+        size = self.quote_chunk_size
+        chunks = [symbols[i:i + size] for i in range(0, len(symbols), size)]
 
-            if prev_close is None or prev_close == 0:
-                change = 0.0
-                change_pct = 0.0
-            else:
-                change = round(last_price - prev_close, 4)
-                change_pct = round((change / prev_close) * 100.0, 4)
+        if len(chunks) == 1:
+            parts = [self._quotes_for_chunk(chunks[0], now_iso)]
+        else:
+            workers = min(self.quote_workers, len(chunks))
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                parts = list(pool.map(lambda c: self._quotes_for_chunk(c, now_iso), chunks))
+        if all(p is None for p in parts):
+            # An outage, not "no quotes": the router's breaker and fallback take it from here
+            raise YahooUnavailable(f"all {len(chunks)} quote chunk(s) failed")
 
-            out[sym] = Quote(
-                symbol=sym,
-                price=round(last_price, 4),
-                change=round(change, 4),
-                changePct=round(change_pct, 4),
-                ts=now_iso,
-            )
+        out: Dict[str, Quote] = {}
+        for part in parts:
+            out.update(part or {})
 
+        # A bad symbol never fails the batch; it is just absent from the result
+        failed = [s for s in symbols if s not in out]
+        if failed:
+            log.info("no quote for %d symbol(s): %s", len(failed), ", ".join(failed[:20]))
         return out
 
     def get_ohlc(self, symbol: str, interval: Interval, range_: Range) -> List[Bar]:
-        yf_interval  = _YF_INTERVAL[interval]
-        yf_requested = _YF_RANGE[range_]
-
-        # Try requested, then fallbacks
-        for period in _fallback_periods(yf_interval, yf_requested):
-            # 1) column-grouped (ideal shape)
-            df = _safe_download(symbol, yf_interval, period, group_by="column")
-            if len(df) > 0:
-                return _bars_from_df(df)
-
-            # 2) ticker-grouped (the “Price / Ticker / Date” shape you saw)
-            df = _safe_download(symbol, yf_interval, period, group_by="ticker")
+        if not self.incremental:
+            return self._fetch_full(symbol, interval, range_)
+
+        key = (symbol, interval)
+        with self._series_lock:
+            series = self._series.get(key)
+            if series is not None:
+                self._series.move_to_end(key)
+
+        if (
+            series is not None
+            and series.covers(range_)
+            and time.monotonic() - series.fetched_at < self.series_max_age
+        ):
+            since = datetime.fromisoformat(series.bars[-1]["t"])
+            try:
+                tail = self.get_ohlc_since(symbol, interval, since)
+            except YahooUnavailable as e:
+                # The series we hold is still good, just not updated; better than Mock bars
+                log.warning("tail fetch failed, serving held %s %s series: %s", symbol, interval, e)
+                return trim_to_range(series.bars, range_)
+            bars = trim_to_range(merge_tail(series.bars, tail), series.range_)
+            with self._series_lock:
+                series.bars = bars
+            return trim_to_range(bars, range_)
+
+        bars = self._fetch_full(symbol, interval, range_)
+        if bars:
+            with self._series_lock:
+                self._series[key] = _Series(bars, range_)
+                self._series.move_to_end(key)
+                while len(self._series) > self.max_series:
+                    self._series.popitem(last=False)
+        return bars
+
+    def get_ohlc_since(self, symbol: str, interval: Interval, since: datetime) -> List[Bar]:
+        """Bars whose start is >= `since` (the bar at `since` comes back re-formed)."""
+        yf_interval = _YF_INTERVAL[interval]
+        answered = False
+        for group_by in ("column", "ticker"):
+            df = _safe_download(symbol, yf_interval, None, group_by=group_by, start=since)
+            if df is None:
+                continue
+            answered = True
             if len(df) > 0:
-                return _bars_from_df(df)
+                bars = _bars_from_df(df)
+                cutoff = since.astimezone(timezone.utc).isoformat()
+                return [b for b in bars if b["t"] >= cutoff]
+        if not answered:
+            raise YahooUnavailable(f"tail download failed for {symbol} {interval}")
+        return []
 
-            # 3) per-ticker history (ok to be empty if SciPy is missing)
-            df = _safe_history(symbol, yf_interval, period)
+    def _fetch_full(self, symbol: str, interval: Interval, range_: Range) -> List[Bar]:
+        yf_interval  = _YF_INTERVAL[interval]
+        yf_requested = _YF_RANGE[range_]
+        key = (symbol, yf_interval, yf_requested)
+
+        if self._empty.get(key):
+            return []
+
+        # Requested period, then fallbacks; each period tries
+        #   1) column-grouped download (ideal shape)
+        #   2) ticker-grouped download (the “Price / Ticker / Date” shape you saw)
+        #   3) per-ticker history (ok to be empty if SciPy is missing)
+        ladder = [
+            (period, method)
+            for period in _fallback_periods(yf_interval, yf_requested)
+            for method in ("column", "ticker", "history")
+        ]
+        # Start from whatever worked last time
+        hit = self._ladder_memo.get(key)
+        if hit in ladder:
+            ladder.remove(hit)
+            ladder.insert(0, hit)
+
+        errors = 0
+        for period, method in ladder:
+            if method == "history":
+                df = _safe_history(symbol, yf_interval, period)
+            else:
+                df = _safe_download(symbol, yf_interval, period, group_by=method)
+            if df is None:
+                errors += 1
+                continue
             if len(df) > 0:
+                if (period, method) != hit:
+                    self._ladder_memo.set(key, (period, method))
                 return _bars_from_df(df)
 
-        # Nothing worked -> router will fall back to Mock
+        self._ladder_memo.discard(key)
+        if errors == len(ladder):
+            # An outage, not an answer: let the router's breaker see it and
+            # don't negative-cache the ticker
+            raise YahooUnavailable(f"all {errors} Yahoo calls failed for {symbol} {interval}")
+        # At least one rung answered, and none had rows (a raising rung, e.g.
+        # history without SciPy, doesn't make "no such ticker" an outage)
+        self._empty.set(key, True)
         return []
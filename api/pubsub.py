@@ -0,0 +1,24 @@
+# api/pubsub.py
+"""Redis pub/sub channels shared by Celery publishers and the API's stream hub."""
+import json
+from typing import Dict, List
+
+import redis
+
+TAPE_CHANNEL = "fs:pub:tape"      # message: JSON list of tape prints
+QUOTES_CHANNEL = "fs:pub:quotes"  # message: JSON object {symbol: Quote}
+
+CHANNELS = {"tape": TAPE_CHANNEL, "quotes": QUOTES_CHANNEL}
+
+
+def publish_prints(r: redis.Redis, prints: List[dict]) -> int:
+    """Publish a batch of tape prints; returns the number of API processes listening."""
+    if not prints:
+        return 0
+    return int(r.publish(TAPE_CHANNEL, json.dumps(prints)))
+
+
+def publish_quotes(r: redis.Redis, quotes: Dict[str, dict]) -> int:
+    if not quotes:
+        return 0
+    return int(r.publish(QUOTES_CHANNEL, json.dumps(quotes)))
@@ -0,0 +1,169 @@
+# api/queues.py
+"""
+Celery queues, routing and admission control.
+
+Work is split so a big backfill or universe refresh can't starve a
+user-triggered task:
+  interactive  user-triggered tasks; shallow prefetch, many slots
+  refresh      beat-driven cache refreshes (quotes, tape, hotset, warming)
+  backfill     bulk historical loads; few slots, one task at a time each
+
+Run one worker per queue with WORKER_PROFILE=<queue> (see QUEUE_PROFILES
+and celery_app.py); a worker started without it consumes all three.
+
+Enqueueing from the API goes through `enqueue`, which:
+- refuses when the target queue is deeper than its SHED_AT limit
+  (raises Backlogged; /tasks/* turn it into a 503 with Retry-After), and
+- de-duplicates on (task, args): while an identical task is queued or
+  running, callers get its id back instead of a second copy. The dedup key
+  is released by celery_app's task_postrun/task_failure/task_revoked
+  handlers; a key left behind by a task that finished without them (worker
+  killed mid-run) is dropped once the result backend shows it finished,
+  and its TTL bounds everything else.
+"""
+from __future__ import annotations
+from typing import Dict, Optional, Sequence, Tuple
+import hashlib
+import json
+import os
+
+import redis
+from celery import states, uuid
+from kombu import Queue
+
+from singleflight import release_token
+
+INTERACTIVE = "interactive"
+REFRESH = "refresh"
+BACKFILL = "backfill"
+
+TASK_QUEUES = (Queue(INTERACTIVE), Queue(REFRESH), Queue(BACKFILL))
+
+TASK_ROUTES = {
+    "celery_app.hello_task": {"queue": INTERACTIVE},
+    "celery_app.fetch_ohlc": {"queue": INTERACTIVE},
+    "celery_app.refresh_*": {"queue": REFRESH},
+    "celery_app.warm_hot_ohlc": {"queue": REFRESH},
+    "celery_app.backfill_*": {"queue": BACKFILL},
+}
+
+# Worker settings per queue, applied when WORKER_PROFILE names one
+QUEUE_PROFILES: Dict[str, Dict[str, int]] = {
+    INTERACTIVE: {"concurrency": 8, "prefetch_multiplier": 1},  # never hold tasks behind a slow one
+    REFRESH: {"concurrency": 4, "prefetch_multiplier": 2},
+    BACKFILL: {"concurrency": 2, "prefetch_multiplier": 1},
+}
+
+# Queue depth (messages waiting) at which enqueue refuses new work
+SHED_AT = {
+    INTERACTIVE: int(os.getenv("SHED_INTERACTIVE_AT", "200")),
+    REFRESH: int(os.getenv("SHED_REFRESH_AT", "2000")),
+    BACKFILL: int(os.getenv("SHED_BACKFILL_AT", "500")),
+}
+RETRY_AFTER = 5          # seconds suggested to shed callers
+DEDUP_TTL = 600          # seconds; upper bound if a worker dies without task_postrun
+DEDUP_PREFIX = "fs:dedup:"
+_DEDUP_ATTEMPTS = 3      # SET NX retries when the key vanishes between SET NX and GET
+
+# Kombu's Redis transport keeps one list per priority step: "queue", "queue\x06\x163", ...
+_PRIORITY_SEP = "\x06\x16"
+_PRIORITY_STEPS = (0, 3, 6, 9)
+
+
+class Backlogged(RuntimeError):
+    def __init__(self, queue: str, depth: int, limit: int) -> None:
+        super().__init__(f"queue {queue!r} has {depth} waiting tasks (limit {limit})")
+        self.queue = queue
+        self.depth = depth
+        self.limit = limit
+
+
+def queue_for(task_name: str) -> str:
+    """Queue a task name routes to (same glob rules as TASK_ROUTES)."""
+    for pattern, route in TASK_ROUTES.items():
+        if task_name == pattern or (pattern.endswith("*") and task_name.startswith(pattern[:-1])):
+            return route["queue"]
+    return REFRESH
+
+
+def queue_depth(r: redis.Redis, queue: str) -> int:
+    """Messages waiting in `queue` on the Redis broker (all priority lists, one round trip)."""
+    pipe = r.pipeline(transaction=False)
+    for pri in _PRIORITY_STEPS:
+        pipe.llen(f"{queue}{_PRIORITY_SEP}{pri}" if pri else queue)
+    return sum(pipe.execute())
+
+
+def depths(r: redis.Redis) -> Dict[str, int]:
+    return {q.name: queue_depth(r, q.name) for q in TASK_QUEUES}
+
+
+def dedup_key(task_name: str, args: Sequence = (), kwargs: Optional[dict] = None) -> str:
+    raw = json.dumps([list(args), kwargs or {}], sort_keys=True, default=str)
+    return f"{DEDUP_PREFIX}{task_name}:{hashlib.sha1(raw.encode()).hexdigest()}"
+
+
+def admit(r: redis.Redis, queue: str) -> int:
+    """Raise Backlogged if `queue` is over its limit; returns the current depth."""
+    depth = queue_depth(r, queue)
+    limit = SHED_AT.get(queue)
+    if limit is not None and depth >= limit:
+        raise Backlogged(queue, depth, limit)
+    return depth
+
+
+def enqueue(
+    r: redis.Redis,
+    task,
+    args: Sequence = (),
+    kwargs: Optional[dict] = None,
+    dedup: bool = True,
+) -> Tuple[str, bool]:
+    """
+    Admission-checked, de-duplicated apply_async; returns (task_id, queued),
+    where queued=False means an identical task was already pending.
+    """
+    queue = queue_for(task.name)
+    key = dedup_key(task.name, args, kwargs) if dedup else None
+    if key is not None:
+        existing = _pending(r, task, key)
+        if existing is not None:
+            return existing, False
+    admit(r, queue)
+
+    task_id = uuid()
+    if key is not None:
+        for _ in range(_DEDUP_ATTEMPTS):
+            if r.set(key, task_id, nx=True, ex=DEDUP_TTL):
+                break
+            existing = _pending(r, task, key)
+            if existing is not None:   # lost the race to an identical enqueue
+                return existing, False
+            # Released (or stale) between our SET NX and GET: try to take it again
+    try:
+        task.apply_async(args=list(args), kwargs=kwargs or {}, task_id=task_id, queue=queue)
+    except Exception:
+        if key is not None:
+            release(r, task.name, args, kwargs, task_id)
+        raise
+    return task_id, True
+
+
+def release(r: redis.Redis, task_name: str, args: Sequence, kwargs: Optional[dict], task_id: str) -> None:
+    # Only if the key still points at this task
+    release_token(r, dedup_key(task_name, args, kwargs), task_id)
+
+
+def _pending(r: redis.Redis, task, key: str) -> Optional[str]:
+    """Task id held by the dedup key if that task may still run; a finished holder's key is dropped."""
+    existing = r.get(key)
+    if existing is None:
+        return None
+    try:
+        done = task.AsyncResult(existing).state in states.READY_STATES
+    except Exception:
+        return existing   # backend unreachable: trust the key (its TTL still applies)
+    if not done:
+        return existing
+    release_token(r, key, existing)
+    return None
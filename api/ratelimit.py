@@ -0,0 +1,58 @@
+# api/ratelimit.py
+"""
+Token bucket in Redis, shared by every worker that calls the same upstream.
+
+State is one hash {tokens, ts}; refill and take happen in a single Lua call
+using the Redis server clock, so workers on different hosts agree and two
+takers can never both spend the last token.
+"""
+import time
+
+import redis
+
+# KEYS[1] bucket; ARGV: rate (tokens/s), capacity, tokens wanted.
+# Returns 0 if granted, else ms to wait until enough tokens have refilled.
+_TAKE = """
+local rate = tonumber(ARGV[1])
+local capacity = tonumber(ARGV[2])
+local want = tonumber(ARGV[3])
+local t = redis.call('TIME')
+local now = tonumber(t[1]) * 1000 + math.floor(tonumber(t[2]) / 1000)
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1]) or capacity
+local ts = tonumber(state[2]) or now
+tokens = math.min(capacity, tokens + (now - ts) * rate / 1000)
+local wait = 0
+if tokens >= want then
+  tokens = tokens - want
+else
+  wait = math.ceil((want - tokens) * 1000 / rate)
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', now)
+redis.call('PEXPIRE', KEYS[1], math.ceil(capacity * 1000 / rate) + 1000)
+return wait
+"""
+
+
+class TokenBucket:
+    def __init__(self, r: redis.Redis, key: str, rate: float, capacity: float) -> None:
+        self.r = r
+        self.key = key
+        self.rate = rate
+        self.capacity = capacity
+        self._take = r.register_script(_TAKE)
+
+    def try_take(self, n: float = 1) -> float:
+        """Take `n` tokens if available; returns 0.0 on success, else seconds to wait."""
+        return int(self._take(keys=[self.key], args=[self.rate, self.capacity, n])) / 1000
+
+    def acquire(self, n: float = 1, timeout: float = 30.0) -> bool:
+        """Block until `n` tokens are taken; False if that would take longer than `timeout`."""
+        deadline = time.monotonic() + timeout
+        while True:
+            wait = self.try_take(n)
+            if wait == 0:
+                return True
+            if time.monotonic() + wait > deadline:
+                return False
+            time.sleep(wait)
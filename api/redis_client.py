@@ -1,9 +1,65 @@
 # api/redis_client.py
+"""
+Shared Redis clients, one connection pool each per process.
+
+  redis_client  sync; threadpool endpoints, providers, Celery tasks
+  aredis        asyncio; anything awaited on the event loop
+  ablocking     asyncio; only for blocking commands (XREAD BLOCK long-polls)
+
+All pools are bounded and block (up to REDIS_POOL_TIMEOUT) when exhausted
+instead of opening unbounded connections under load. Long-polls hold a
+connection for their whole wait, so they get their own pool: a crowd of
+pollers can't starve the rest of the async endpoints. Pub/sub listeners
+(stream hub, single-flight, L1 invalidation) hold their own dedicated
+connection and don't draw from these pools.
+"""
 import os
+
 import redis
+import redis.asyncio as aioredis
+from dotenv import load_dotenv
+
+load_dotenv()  # REDIS_* may live in api/.env
 
 REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
-redis_client = redis.Redis.from_url(REDIS_URL, decode_responses=True)
+# Sync pool serves the provider thread pool and FastAPI's threadpool (40 by default)
+REDIS_MAX_CONNECTIONS = int(os.getenv("REDIS_MAX_CONNECTIONS", "64"))
+REDIS_ASYNC_MAX_CONNECTIONS = int(os.getenv("REDIS_ASYNC_MAX_CONNECTIONS", "64"))
+REDIS_POOL_TIMEOUT = float(os.getenv("REDIS_POOL_TIMEOUT", "5"))         # wait for a free connection
+REDIS_SOCKET_TIMEOUT = float(os.getenv("REDIS_SOCKET_TIMEOUT", "30"))    # no blocking commands here
+REDIS_CONNECT_TIMEOUT = float(os.getenv("REDIS_CONNECT_TIMEOUT", "2"))
+REDIS_BLOCKING_MAX_CONNECTIONS = int(os.getenv("REDIS_BLOCKING_MAX_CONNECTIONS", "256"))
+REDIS_MAX_BLOCK = 25.0   # seconds; callers cap BLOCK at this (tape.MAX_POLL)
+
+_pool_kwargs = dict(
+    decode_responses=True,
+    timeout=REDIS_POOL_TIMEOUT,
+    socket_timeout=REDIS_SOCKET_TIMEOUT,
+    socket_connect_timeout=REDIS_CONNECT_TIMEOUT,
+    health_check_interval=30,
+)
+
+redis_client = redis.Redis(
+    connection_pool=redis.BlockingConnectionPool.from_url(
+        REDIS_URL, max_connections=REDIS_MAX_CONNECTIONS, **_pool_kwargs
+    )
+)
+
+# Connections are opened lazily on whichever event loop first uses them
+aredis = aioredis.Redis(
+    connection_pool=aioredis.BlockingConnectionPool.from_url(
+        REDIS_URL, max_connections=REDIS_ASYNC_MAX_CONNECTIONS, **_pool_kwargs
+    )
+)
+
+# Socket timeout outlives the longest BLOCK, so a quiet poll never looks like a dead socket
+ablocking = aioredis.Redis(
+    connection_pool=aioredis.BlockingConnectionPool.from_url(
+        REDIS_URL,
+        max_connections=REDIS_BLOCKING_MAX_CONNECTIONS,
+        **{**_pool_kwargs, "socket_timeout": REDIS_MAX_BLOCK + 5},
+    )
+)
 
 def check_redis() -> None:
     """Raise on failure; used by /healthz."""
@@ -0,0 +1,267 @@
+# api/singleflight.py
+"""
+Single-flight for async endpoints: concurrent requests for the same key share
+one upstream call.
+
+Two layers:
+  - in-process: callers for a key that is already in flight await the same
+    future, so one process never runs the same work twice at once;
+  - cross-process: one process wins a SET NX latch and runs the work; the
+    others wait for the leader's completion message on fs:sf:done:<key>
+    (one PSUBSCRIBE connection per process, no polling).
+
+If the leader fails, waiting followers get LeaderFailed instead of None.
+If the leader dies without publishing, followers retry the latch once it expires.
+
+Usage:
+    value, led = await flights.run(key, fetch, lookup=read_cache)
+
+    @flights.wrap(lambda symbol: f"quote:{symbol}")
+    async def fetch_quote(symbol): ...
+"""
+from __future__ import annotations
+from typing import Awaitable, Callable, Dict, Optional, Set, Tuple
+import asyncio
+import functools
+import json
+import logging
+import uuid
+
+import redis.asyncio as aioredis
+
+from metrics import counter
+
+log = logging.getLogger(__name__)
+
+CHANNEL_PREFIX = "fs:sf:done:"
+LATCH_TTL = 5   # seconds; upper bound on one leader run
+
+# led: ran fn; shared: joined a call in flight in this process;
+# coalesced: got another process's result; failed: raised
+FLIGHTS = counter("singleflight_calls_total", "Single-flight calls by outcome.", ("outcome",))
+
+# Delete a key only if it still holds our token (it may have expired and been re-taken)
+_RELEASE = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+  return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+
+class SingleFlightError(RuntimeError):
+    """No result: the leader never finished and the latch couldn't be taken over in time."""
+
+
+class LeaderFailed(SingleFlightError):
+    """The leader's run raised; the message carries its error."""
+
+
+def latch_key_for(resource_key: str) -> str:
+    return f"fs:latch:{resource_key}"
+
+
+def release_token(r, key: str, token: str):
+    """
+    Compare-and-delete for every token-held key (latches, locks, dedup keys).
+    Works on sync and asyncio clients and on pipelines; await the result on
+    an asyncio client.
+    """
+    return r.eval(_RELEASE, 1, key, token)
+
+
+class _Completions:
+    """One pattern subscription per process, fanning completion messages out to waiters."""
+
+    def __init__(self, redis_url: str) -> None:
+        self.redis_url = redis_url
+        self._waiters: Dict[str, Set[asyncio.Future]] = {}
+        self._task: Optional[asyncio.Task] = None
+        self._ready: Optional[asyncio.Event] = None
+
+    async def ensure_started(self) -> None:
+        if self._task is None or self._task.done():
+            self._ready = asyncio.Event()
+            self._task = asyncio.create_task(self._run(), name="single-flight")
+        await self._ready.wait()
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def expect(self, key: str) -> asyncio.Future:
+        fut = asyncio.get_running_loop().create_future()
+        self._waiters.setdefault(key, set()).add(fut)
+        return fut
+
+    def forget(self, key: str, fut: asyncio.Future) -> None:
+        waiters = self._waiters.get(key)
+        if waiters is not None:
+            waiters.discard(fut)
+            if not waiters:
+                del self._waiters[key]
+
+    def _dispatch(self, channel: str, data: str) -> None:
+        key = channel[len(CHANNEL_PREFIX):]
+        waiters = self._waiters.get(key)
+        if not waiters:
+            return
+        try:
+            msg = json.loads(data)
+        except ValueError:
+            return
+        for fut in waiters:
+            if not fut.done():
+                fut.set_result(msg)
+
+    async def _run(self) -> None:
+        backoff = 0.5
+        while True:
+            client = aioredis.Redis.from_url(self.redis_url, decode_responses=True)
+            pubsub = client.pubsub(ignore_subscribe_messages=True)
+            try:
+                await pubsub.psubscribe(CHANNEL_PREFIX + "*")
+                self._ready.set()
+                backoff = 0.5
+                async for msg in pubsub.listen():
+                    if msg.get("type") == "pmessage":
+                        self._dispatch(msg["channel"], msg["data"])
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                log.warning("single-flight listener lost Redis (%s); retrying in %.1fs", e, backoff)
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, 10.0)
+            finally:
+                try:
+                    await pubsub.aclose()
+                    await client.aclose()
+                except Exception:
+                    pass
+
+
+class SingleFlight:
+    def __init__(self, client: aioredis.Redis, redis_url: str, latch_ttl: int = LATCH_TTL) -> None:
+        self.r = client
+        self.latch_ttl = latch_ttl
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._completions = _Completions(redis_url)
+
+    async def stop(self) -> None:
+        await self._completions.stop()
+
+    async def run(
+        self,
+        key: str,
+        fn: Callable[[], Awaitable[str]],
+        lookup: Optional[Callable[[], Awaitable[Optional[str]]]] = None,
+    ) -> Tuple[str, bool]:
+        """
+        Run `fn` once across all concurrent callers of `key`.
+        Returns (value, led): led is True only for the caller that ran `fn`.
+
+        `lookup` reads the result the leader stored (usually the cache); it is
+        used when the leader finished before this caller started waiting.
+        Values cross processes in the completion message, so they are strings.
+        """
+        shared = self._inflight.get(key)
+        if shared is not None:
+            try:
+                value, _ = await asyncio.shield(shared)
+            except Exception:
+                FLIGHTS.labels("failed").inc()
+                raise
+            FLIGHTS.labels("shared").inc()
+            return value, False
+
+        fut = asyncio.get_running_loop().create_future()
+        self._inflight[key] = fut
+        try:
+            result = await self._across_processes(key, fn, lookup)
+        except asyncio.CancelledError:
+            # The leading request went away; don't cancel the callers sharing it
+            fut.set_exception(SingleFlightError(f"leader for {key!r} was cancelled"))
+            fut.exception()  # mark retrieved in case nobody was waiting
+            raise
+        except Exception as e:
+            fut.set_exception(e)
+            fut.exception()
+            FLIGHTS.labels("failed").inc()
+            raise
+        else:
+            fut.set_result(result)
+            FLIGHTS.labels("led" if result[1] else "coalesced").inc()
+            return result
+        finally:
+            self._inflight.pop(key, None)
+
+    def wrap(self, key_fn: Callable[..., str]):
+        """Decorator form: the key is computed from the call's arguments."""
+        def decorate(fn: Callable[..., Awaitable[str]]):
+            @functools.wraps(fn)
+            async def wrapper(*args, **kwargs) -> str:
+                value, _ = await self.run(key_fn(*args, **kwargs), lambda: fn(*args, **kwargs))
+                return value
+            return wrapper
+        return decorate
+
+    async def _across_processes(self, key, fn, lookup) -> Tuple[str, bool]:
+        await self._completions.ensure_started()
+        lkey = latch_key_for(key)
+        token = uuid.uuid4().hex
+        # Allow one takeover after an expired latch, then give up
+        deadline = asyncio.get_running_loop().time() + 2 * self.latch_ttl + 1
+        while True:
+            if await self.r.set(lkey, token, nx=True, ex=self.latch_ttl):
+                return await self._lead(key, lkey, token, fn), True
+
+            waiter = self._completions.expect(key)
+            try:
+                # Registered before this check, so a completion published after it can't be missed
+                pttl = await self.r.pttl(lkey)
+                if pttl == -2:
+                    value = await lookup() if lookup is not None else None
+                    if value is not None:
+                        return value, False
+                    continue   # leader gone without a result we can read: take over
+                remaining = deadline - asyncio.get_running_loop().time()
+                if remaining <= 0:
+                    raise SingleFlightError(f"no result for {key!r} within {2 * self.latch_ttl}s")
+                latch_left = pttl / 1000 if pttl > 0 else self.latch_ttl
+                try:
+                    msg = await asyncio.wait_for(waiter, timeout=min(remaining, latch_left + 0.05))
+                except asyncio.TimeoutError:
+                    continue   # leader died holding the latch; it has expired by now
+            finally:
+                self._completions.forget(key, waiter)
+
+            if msg.get("ok"):
+                return msg.get("value"), False
+            raise LeaderFailed(msg.get("error") or "leader failed")
+
+    async def _lead(self, key: str, lkey: str, token: str, fn) -> str:
+        channel = CHANNEL_PREFIX + key
+        try:
+            value = await fn()
+        except Exception as e:
+            await self._finish(lkey, token, channel, {"ok": False, "error": f"{type(e).__name__}: {e}"})
+            raise
+        await self._finish(lkey, token, channel, {"ok": True, "value": value})
+        return value
+
+    async def _finish(self, lkey: str, token: str, channel: str, msg: dict) -> None:
+        # Release before publishing: a follower that sees no latch reads the
+        # stored result, one that still sees it is sure to get the message.
+        try:
+            await release_token(self.r, lkey, token)
+        except Exception as e:
+            log.warning("single-flight: couldn't release %s (%s); it expires in %ss", lkey, e, self.latch_ttl)
+        try:
+            await self.r.publish(channel, json.dumps(msg))
+        except Exception as e:
+            log.warning("single-flight: couldn't publish completion for %s (%s)", channel, e)
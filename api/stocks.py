@@ -0,0 +1,171 @@
+# api/stocks.py
+"""
+Symbol universe storage: bulk upsert, keyset pages and search over `stocks`.
+
+- bulk_upsert: one INSERT ... ON CONFLICT (symbol) DO UPDATE per batch
+  (Postgres, SQLite); big Postgres loads go through COPY into a temp table
+  and a single INSERT ... SELECT ... ON CONFLICT. Rows whose name didn't
+  change aren't rewritten.
+- page: keyset pagination on symbol (WHERE symbol > :after ORDER BY symbol),
+  so page N costs the same as page 1.
+- search: symbol prefix matches first (btree text_pattern_ops index), then
+  fuzzy trigram matches on symbol/name (pg_trgm GIN indexes); see the
+  2b7c41d9e0aa migration. Other databases fall back to LIKE.
+"""
+from __future__ import annotations
+from typing import Dict, Iterable, List, Optional, Tuple
+import csv
+import io
+
+from sqlalchemy import func, select
+from sqlalchemy.engine import Engine
+
+from models import Stock
+
+UPSERT_BATCH = 5_000
+COPY_THRESHOLD = 20_000     # rows; above this Postgres loads use COPY
+MAX_PAGE = 1_000
+MAX_BULK = 50_000           # rows per /stocks/bulk request
+SEARCH_LIMIT = 20
+
+
+def normalize(rows: Iterable[dict]) -> List[dict]:
+    """Upper-case symbols, drop blanks, keep the last row per symbol (one statement can't touch a row twice)."""
+    out: Dict[str, dict] = {}
+    for r in rows:
+        sym = (r.get("symbol") or "").strip().upper()
+        if not sym:
+            continue
+        name = r.get("name")
+        out[sym] = {"symbol": sym, "name": name.strip() if isinstance(name, str) and name.strip() else None}
+    return list(out.values())
+
+
+def _insert_for(engine: Engine):
+    if engine.dialect.name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    elif engine.dialect.name == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert
+    else:
+        raise NotImplementedError(f"bulk upsert not supported on {engine.dialect.name}")
+    return insert
+
+
+def _upsert_batches(engine: Engine, rows: List[dict], batch_size: int) -> int:
+    insert = _insert_for(engine)
+    stmt = insert(Stock.__table__)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[Stock.symbol],
+        set_={"name": func.coalesce(stmt.excluded.name, Stock.name)},
+        # Skip rewriting rows that wouldn't change (no dead tuples on re-loads)
+        where=stmt.excluded.name.is_not(None) & Stock.name.is_distinct_from(stmt.excluded.name),
+    )
+    written = 0
+    with engine.begin() as conn:
+        for i in range(0, len(rows), batch_size):
+            written += conn.execute(stmt, rows[i:i + batch_size]).rowcount or 0
+    return written
+
+
+def _copy_upsert(engine: Engine, rows: List[dict]) -> int:
+    """COPY into a temp table, then one set-based upsert (psycopg2 only)."""
+    buf = io.StringIO()
+    w = csv.writer(buf)
+    for r in rows:
+        w.writerow((r["symbol"], r["name"] if r["name"] is not None else r"\N"))
+    buf.seek(0)
+
+    raw = engine.raw_connection()
+    try:
+        with raw.cursor() as cur:
+            cur.execute("CREATE TEMP TABLE stocks_load (symbol text, name text) ON COMMIT DROP")
+            cur.copy_expert(r"COPY stocks_load (symbol, name) FROM STDIN WITH (FORMAT csv, NULL '\N')", buf)
+            cur.execute(
+                """
+                INSERT INTO stocks (symbol, name)
+                SELECT symbol, name FROM stocks_load
+                ON CONFLICT (symbol) DO UPDATE
+                   SET name = COALESCE(EXCLUDED.name, stocks.name)
+                 WHERE EXCLUDED.name IS NOT NULL
+                   AND stocks.name IS DISTINCT FROM EXCLUDED.name
+                """
+            )
+            written = cur.rowcount
+        raw.commit()
+        return written
+    except Exception:
+        raw.rollback()
+        raise
+    finally:
+        raw.close()
+
+
+def bulk_upsert(engine: Engine, rows: Iterable[dict], batch_size: int = UPSERT_BATCH) -> Dict[str, int]:
+    """Insert new symbols and update changed names; returns {"received", "written"}."""
+    rows = normalize(rows)
+    if not rows:
+        return {"received": 0, "written": 0}
+    use_copy = (
+        engine.dialect.name == "postgresql"
+        and engine.dialect.driver == "psycopg2"
+        and len(rows) >= COPY_THRESHOLD
+    )
+    written = _copy_upsert(engine, rows) if use_copy else _upsert_batches(engine, rows, batch_size)
+    return {"received": len(rows), "written": written}
+
+
+def _row(r) -> dict:
+    return {"id": r.id, "symbol": r.symbol, "name": r.name}
+
+
+def page(engine: Engine, after: Optional[str] = None, limit: int = 100) -> Tuple[List[dict], Optional[str]]:
+    """One page ordered by symbol, starting after `after`; returns (items, next cursor or None)."""
+    limit = max(1, min(limit, MAX_PAGE))
+    q = select(Stock.id, Stock.symbol, Stock.name).order_by(Stock.symbol).limit(limit + 1)
+    if after:
+        q = q.where(Stock.symbol > after.strip().upper())
+    with engine.connect() as conn:
+        rows = conn.execute(q).all()
+    items = [_row(r) for r in rows[:limit]]
+    return items, (items[-1]["symbol"] if len(rows) > limit else None)
+
+
+def _like_escape(s: str) -> str:
+    return s.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def search(engine: Engine, q: str, limit: int = SEARCH_LIMIT) -> List[dict]:
+    """Prefix matches on symbol (alphabetical), then fuzzy symbol/name matches (best first)."""
+    q = q.strip()
+    if not q:
+        return []
+    limit = max(1, min(limit, 100))
+    prefix = _like_escape(q.upper()) + "%"
+    cols = (Stock.id, Stock.symbol, Stock.name)
+
+    with engine.connect() as conn:
+        hits = conn.execute(
+            select(*cols).where(Stock.symbol.like(prefix, escape="\\")).order_by(Stock.symbol).limit(limit)
+        ).all()
+        if len(hits) < limit:
+            seen = [h.symbol for h in hits]
+            rest = limit - len(hits)
+            if engine.dialect.name == "postgresql":
+                # % uses the trigram GIN indexes; rank by the better of the two similarities
+                rank = func.greatest(func.similarity(Stock.symbol, q), func.similarity(Stock.name, q))
+                fuzzy = (
+                    select(*cols)
+                    .where(Stock.symbol.op("%")(q) | Stock.name.op("%")(q))
+                    .order_by(rank.desc(), Stock.symbol)
+                    .limit(rest + len(seen))
+                )
+            else:
+                contains = "%" + _like_escape(q) + "%"
+                fuzzy = (
+                    select(*cols)
+                    .where(Stock.name.ilike(contains, escape="\\") | Stock.symbol.like(contains.upper(), escape="\\"))
+                    .order_by(Stock.symbol)
+                    .limit(rest + len(seen))
+                )
+            hits += [r for r in conn.execute(fuzzy).all() if r.symbol not in seen][:rest]
+    return [_row(r) for r in hits]
@@ -0,0 +1,160 @@
+# api/streaming.py
+"""
+Push streaming of tape prints and quotes.
+
+One StreamHub per API process holds a single Redis pub/sub subscription and
+fans messages out to every connected client (WebSocket or SSE). Each client
+has its own symbol filter and a bounded buffer. A slow consumer never slows
+the hub: quotes are coalesced per symbol (latest wins) and the oldest prints
+are dropped once the buffer is full.
+"""
+from __future__ import annotations
+from typing import Dict, List, Optional, Set
+from collections import deque
+import asyncio
+import json
+import logging
+
+import redis.asyncio as aioredis
+
+from pubsub import CHANNELS, QUOTES_CHANNEL, TAPE_CHANNEL
+
+log = logging.getLogger(__name__)
+
+MAX_PENDING_PRINTS = 500
+
+
+class Subscriber:
+    """One client connection's view of the hub."""
+
+    def __init__(self, symbols: Optional[Set[str]], channels: Set[str], max_prints: int = MAX_PENDING_PRINTS) -> None:
+        self.symbols = symbols          # None = everything
+        self.channels = channels        # subset of {"tape", "quotes"}
+        self._prints: deque = deque(maxlen=max_prints)
+        self._quotes: Dict[str, dict] = {}
+        self._wake = asyncio.Event()
+        self.dropped = 0
+
+    def wants(self, symbol: Optional[str]) -> bool:
+        return self.symbols is None or (symbol or "").upper() in self.symbols
+
+    def set_symbols(self, symbols: Optional[Set[str]]) -> None:
+        self.symbols = symbols
+
+    def offer_prints(self, prints: List[dict]) -> None:
+        added = False
+        for p in prints:
+            if self.wants(p.get("symbol")):
+                if len(self._prints) == self._prints.maxlen:
+                    self.dropped += 1   # deque evicts the oldest
+                self._prints.append(p)
+                added = True
+        if added:
+            self._wake.set()
+
+    def offer_quotes(self, quotes: Dict[str, dict]) -> None:
+        added = False
+        for sym, q in quotes.items():
+            if self.wants(sym):
+                self._quotes[sym] = q   # coalesce: only the latest per symbol
+                added = True
+        if added:
+            self._wake.set()
+
+    async def next_batch(self, timeout: float) -> List[dict]:
+        """Wait up to `timeout` for new events; [] means idle (send a heartbeat)."""
+        if not self._prints and not self._quotes:
+            self._wake.clear()
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout)
+            except asyncio.TimeoutError:
+                return []
+        out = [{"type": "tape", "data": p} for p in self._prints]
+        out.extend({"type": "quote", "data": q} for q in self._quotes.values())
+        self._prints.clear()
+        self._quotes.clear()
+        return out
+
+
+class StreamHub:
+    def __init__(self, redis_url: str) -> None:
+        self.redis_url = redis_url
+        self._subs: Set[Subscriber] = set()
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def client_count(self) -> int:
+        return len(self._subs)
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run(), name="stream-hub")
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def subscribe(self, symbols: Optional[Set[str]], channels: Set[str]) -> Subscriber:
+        sub = Subscriber(symbols, channels)
+        self._subs.add(sub)
+        return sub
+
+    def unsubscribe(self, sub: Subscriber) -> None:
+        self._subs.discard(sub)
+
+    def _dispatch(self, channel: str, data: str) -> None:
+        try:
+            payload = json.loads(data)
+        except ValueError:
+            return
+        if channel == TAPE_CHANNEL:
+            for sub in self._subs:
+                if "tape" in sub.channels:
+                    sub.offer_prints(payload)
+        elif channel == QUOTES_CHANNEL:
+            for sub in self._subs:
+                if "quotes" in sub.channels:
+                    sub.offer_quotes(payload)
+
+    async def _run(self) -> None:
+        backoff = 0.5
+        while True:
+            client = aioredis.Redis.from_url(self.redis_url, decode_responses=True)
+            pubsub = client.pubsub(ignore_subscribe_messages=True)
+            try:
+                await pubsub.subscribe(*CHANNELS.values())
+                backoff = 0.5
+                async for msg in pubsub.listen():
+                    if msg.get("type") == "message":
+                        self._dispatch(msg["channel"], msg["data"])
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                log.warning("stream hub lost Redis (%s); retrying in %.1fs", e, backoff)
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, 10.0)
+            finally:
+                try:
+                    await pubsub.aclose()
+                    await client.aclose()
+                except Exception:
+                    pass
+
+
+def parse_symbols(raw: Optional[str]) -> Optional[Set[str]]:
+    if not raw:
+        return None
+    syms = {s.strip().upper() for s in raw.split(",") if s.strip()}
+    return syms or None
+
+
+def parse_channels(raw: Optional[str]) -> Set[str]:
+    if not raw:
+        return set(CHANNELS)
+    chans = {c.strip().lower() for c in raw.split(",")} & set(CHANNELS)
+    return chans or set(CHANNELS)
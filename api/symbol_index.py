@@ -0,0 +1,283 @@
+# api/symbol_index.py
+"""
+In-process symbol index for command-bar autocomplete (/v1/symbols/search).
+
+A snapshot holds the universe as sorted arrays: symbols, and (word, symbol)
+pairs for company names (first words and later words kept apart). Lookups
+are a few bisects plus a scan that stops once `limit` hits are found, so a
+keystroke never touches Postgres. Ranking:
+  0 exact symbol, 1 symbol prefix (alphabetical), 2 name starts with the
+  query, 3 a later name word starts with it (by word, then symbol).
+Multi-word queries match names that have a word starting with each query word.
+
+Freshness: writers (POST /stocks, /stocks/bulk) bump fs:symbols:version and
+append the changed rows to the fs:symbols:changes stream in one Lua call, so
+versions and stream order agree. Each process polls the version (one GET),
+replays only the entries it hasn't seen, and swaps in a new snapshot
+(copy-on-write; readers never see a half-applied batch). Big loads, or a gap
+because the stream was trimmed, trigger a full reload from the database.
+"""
+from __future__ import annotations
+from bisect import bisect_left
+from typing import Dict, Iterable, List, Optional, Tuple
+import asyncio
+import json
+import logging
+import re
+
+import redis
+from sqlalchemy import select
+from sqlalchemy.engine import Engine
+
+from models import Stock
+
+log = logging.getLogger(__name__)
+
+VERSION_KEY = "fs:symbols:version"
+CHANGES_STREAM = "fs:symbols:changes"
+CHANGES_MAXLEN = 1_000      # entries; each carries up to CHANGE_CHUNK rows
+CHANGE_CHUNK = 500
+RELOAD_OVER = 5_000         # rows; bigger writes just tell readers to reload
+REFRESH_INTERVAL = 1.0      # seconds between version checks
+NAME_SCAN = 5_000           # cap on name-word entries scanned per tier
+
+_WORD = re.compile(r"[a-z0-9]+")
+
+# Bump the version and log the change atomically, so stream order == version order
+_RECORD = """
+local v = redis.call('INCR', KEYS[1])
+redis.call('XADD', KEYS[2], 'MAXLEN', '~', ARGV[1], '*', 'v', v, 'op', ARGV[2], 'rows', ARGV[3])
+return v
+"""
+
+
+def _tokens(name: Optional[str]) -> List[str]:
+    return _WORD.findall(name.lower()) if name else []
+
+
+def record_changes(r: redis.Redis, rows: List[dict]) -> None:
+    """Publish upserted {"symbol", "name"} rows (symbols already normalized) to every index."""
+    if not rows:
+        return
+    if len(rows) > RELOAD_OVER:
+        r.eval(_RECORD, 2, VERSION_KEY, CHANGES_STREAM, CHANGES_MAXLEN, "reload", "[]")
+        return
+    for i in range(0, len(rows), CHANGE_CHUNK):
+        chunk = [{"symbol": x["symbol"], "name": x.get("name")} for x in rows[i:i + CHANGE_CHUNK]]
+        r.eval(_RECORD, 2, VERSION_KEY, CHANGES_STREAM, CHANGES_MAXLEN, "upsert", json.dumps(chunk))
+
+
+def _name_key(name: Optional[str]) -> str:
+    """' word word ...' so `' ' + w in key` means some word starts with w."""
+    return " " + " ".join(_tokens(name))
+
+
+def _splice(arr: list, remove: list, add: list) -> list:
+    """
+    New sorted list: `arr` minus `remove` plus `add` (both sorted). Cuts `arr`
+    at bisected positions and joins the slices, so a small change costs one
+    copy of the list instead of a re-sort or a memmove per item.
+    """
+    if not remove and not add:
+        return arr
+    edits = sorted([(x, 1) for x in add] + [(x, 0) for x in remove])
+    out, start = [], 0
+    for x, is_add in edits:
+        pos = bisect_left(arr, x, start)
+        out.extend(arr[start:pos])
+        if is_add:
+            out.append(x)
+            start = pos
+        else:
+            start = pos + 1 if pos < len(arr) and arr[pos] == x else pos
+    out.extend(arr[start:])
+    return out
+
+
+class _Snapshot:
+    __slots__ = ("symbols", "names", "keys", "lead", "other")
+
+    def __init__(
+        self,
+        symbols: List[str],
+        names: Dict[str, Optional[str]],
+        lead: List[Tuple[str, str]],
+        other: List[Tuple[str, str]],
+        keys: Optional[Dict[str, str]] = None,
+    ) -> None:
+        self.symbols = symbols                  # sorted
+        self.names = names                      # symbol -> name
+        self.keys = keys if keys is not None else {s: _name_key(n) for s, n in names.items()}
+        self.lead = lead                        # sorted (first name word, symbol)
+        self.other = other                      # sorted (later name word, symbol)
+
+    @staticmethod
+    def _split(names: Dict[str, Optional[str]]) -> Tuple[List[Tuple[str, str]], List[Tuple[str, str]]]:
+        lead, other = [], []
+        for sym, name in names.items():
+            toks = _tokens(name)
+            if toks:
+                lead.append((toks[0], sym))
+                other.extend((t, sym) for t in set(toks[1:]))
+        return lead, other
+
+    @classmethod
+    def build(cls, rows: Iterable[Tuple[str, Optional[str]]]) -> "_Snapshot":
+        names = {sym: name for sym, name in rows}
+        lead, other = cls._split(names)
+        lead.sort()
+        other.sort()
+        return cls(sorted(names), names, lead, other)
+
+    def with_upserts(self, rows: List[dict]) -> "_Snapshot":
+        """New snapshot with `rows` applied; the current one is left untouched."""
+        names = dict(self.names)
+        changed: Dict[str, Optional[str]] = {}
+        added: List[str] = []
+        for row in rows:
+            sym, name = row["symbol"], row.get("name")
+            if sym in names and (name is None or name == names[sym]):
+                continue   # upsert keeps the existing name
+            if sym not in names:
+                added.append(sym)
+            names[sym] = changed[sym] = name
+        if not changed:
+            return self
+
+        symbols = _splice(self.symbols, [], sorted(added))
+        old_lead, old_other = self._split({s: self.names[s] for s in changed if s in self.names})
+        new_lead, new_other = self._split(changed)
+        lead = _splice(self.lead, sorted(old_lead), sorted(new_lead))
+        other = _splice(self.other, sorted(old_other), sorted(new_other))
+        keys = dict(self.keys)
+        keys.update((s, _name_key(n)) for s, n in changed.items())
+        return _Snapshot(symbols, names, lead, other, keys)
+
+    @staticmethod
+    def _prefix_range(arr: list, prefix: str) -> Tuple[int, int]:
+        return bisect_left(arr, (prefix,)), bisect_left(arr, (prefix + "\uffff",))
+
+    def search(self, q: str, limit: int) -> List[dict]:
+        qu = q.strip().upper()
+        if not qu:
+            return []
+        out: List[str] = []
+        seen = set()
+
+        # Tiers 0/1: exact symbol, then symbols starting with the query
+        syms = self.symbols
+        i = bisect_left(syms, qu)
+        while i < len(syms) and len(out) < limit and syms[i].startswith(qu):
+            out.append(syms[i])
+            seen.add(syms[i])
+            i += 1
+
+        words = _tokens(q)
+        if words and len(out) < limit:
+            # Tiers 2/3: names whose first / a later word starts with the
+            # first query word; every other query word must start some word too.
+            first, rest = words[0], [" " + w for w in words[1:]]
+            keys = self.keys
+            for arr in (self.lead, self.other):
+                lo, hi = self._prefix_range(arr, first)
+                for k in range(lo, min(hi, lo + NAME_SCAN)):
+                    sym = arr[k][1]
+                    if sym in seen:
+                        continue
+                    if rest and not all(w in keys[sym] for w in rest):
+                        continue
+                    out.append(sym)
+                    seen.add(sym)
+                    if len(out) >= limit:
+                        break
+                if len(out) >= limit:
+                    break
+
+        return [{"symbol": s, "name": self.names[s]} for s in out]
+
+
+class SymbolIndex:
+    def __init__(self, engine: Engine, redis_client: redis.Redis, refresh_interval: float = REFRESH_INTERVAL) -> None:
+        self.engine = engine
+        self.r = redis_client
+        self.refresh_interval = refresh_interval
+        self._snap: Optional[_Snapshot] = None
+        self.version = 0
+        self._last_id = "0-0"
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def ready(self) -> bool:
+        return self._snap is not None
+
+    def __len__(self) -> int:
+        return len(self._snap.symbols) if self._snap else 0
+
+    def search(self, q: str, limit: int = 10) -> List[dict]:
+        snap = self._snap
+        return snap.search(q, limit) if snap is not None else []
+
+    # ---------- refresh (blocking; run off the event loop) ----------
+
+    def reload(self) -> None:
+        """Full rebuild from the database; changes logged after the version read get replayed."""
+        pipe = self.r.pipeline(transaction=False)
+        pipe.get(VERSION_KEY)
+        pipe.xrevrange(CHANGES_STREAM, count=1)
+        version, last = pipe.execute()
+        with self.engine.connect() as conn:
+            rows = conn.execute(select(Stock.symbol, Stock.name)).all()
+        self._snap = _Snapshot.build(rows)
+        self.version = int(version or 0)
+        self._last_id = last[0][0] if last else "0-0"
+        log.info("symbol index loaded: %d symbols at version %d", len(rows), self.version)
+
+    def refresh(self) -> bool:
+        """Catch up with the change stream; True if anything changed."""
+        if self._snap is None:
+            self.reload()
+            return True
+        current = int(self.r.get(VERSION_KEY) or 0)
+        if current == self.version:
+            return False
+        entries = self.r.xrange(CHANGES_STREAM, min=f"({self._last_id}", max="+")
+        snap, version = self._snap, self.version
+        for entry_id, fields in entries:
+            v = int(fields["v"])
+            if v <= version:
+                continue
+            if v != version + 1 or fields.get("op") == "reload":
+                self.reload()   # trimmed past us, or a load too big to ship as rows
+                return True
+            snap = snap.with_upserts(json.loads(fields["rows"]))
+            version, self._last_id = v, entry_id
+        if version < current:
+            self.reload()       # version moved but the entries are gone
+            return True
+        self._snap, self.version = snap, version
+        return True
+
+    # ---------- background loop ----------
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._loop(), name="symbol-index")
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _loop(self) -> None:
+        while True:
+            try:
+                await asyncio.to_thread(self.refresh)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                log.warning("symbol index refresh failed (%s)", e)
+            await asyncio.sleep(self.refresh_interval)
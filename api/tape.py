@@ -0,0 +1,74 @@
+# api/tape.py
+"""
+Tape prints in a capped Redis Stream (fs:tape:stream).
+
+Writers XADD each print (pipelined, approximate MAXLEN trim); readers page
+with a cursor, which is the stream ID of the last print they saw, so nobody
+re-downloads prints they already have.
+"""
+import json
+import re
+from typing import List, Optional, Tuple
+
+import redis
+
+TAPE_STREAM = "fs:tape:stream"
+TAPE_MAXLEN = 10_000
+MAX_PAGE = 1_000
+TAPE_PAGE_PREFIX = "fs:tape:page:"   # API-side L1 cache keys for tape pages
+MAX_POLL = 25.0                       # seconds; longest XREAD BLOCK (see redis_client.ablocking)
+
+_STREAM_ID = re.compile(r"\d+(-\d+)?", re.ASCII)
+
+
+def valid_cursor(since: Optional[str]) -> bool:
+    """A cursor is absent/empty or a stream ID ("<ms>" or "<ms>-<seq>")."""
+    return not since or _STREAM_ID.fullmatch(since) is not None
+
+
+def append_prints(r: redis.Redis, prints: List[dict]) -> List[str]:
+    """XADD a batch in one round trip; returns the new stream IDs."""
+    if not prints:
+        return []
+    pipe = r.pipeline(transaction=False)
+    for p in prints:
+        pipe.xadd(TAPE_STREAM, {"p": json.dumps(p)}, maxlen=TAPE_MAXLEN, approximate=True)
+    return pipe.execute()
+
+
+def decode_entries(entries) -> List[dict]:
+    out = []
+    for entry_id, fields in entries:
+        try:
+            item = json.loads(fields["p"])
+        except (KeyError, ValueError):
+            continue
+        item["id"] = entry_id
+        out.append(item)
+    return out
+
+
+def read_since(r: redis.Redis, since: Optional[str], limit: int) -> Tuple[List[dict], Optional[str]]:
+    """
+    Prints strictly after `since`, oldest first. Without a cursor, the most
+    recent `limit` prints (still oldest first).
+    """
+    limit = max(1, min(limit, MAX_PAGE))
+    if since:
+        entries = r.xrange(TAPE_STREAM, min=f"({since}", max="+", count=limit)
+    else:
+        entries = list(reversed(r.xrevrange(TAPE_STREAM, max="+", min="-", count=limit)))
+    items = decode_entries(entries)
+    return items, items[-1]["id"] if items else since
+
+
+async def wait_since(ar, since: Optional[str], limit: int, timeout_s: float) -> Tuple[List[dict], Optional[str]]:
+    """
+    Long-poll on an async client: XREAD BLOCK until prints newer than `since`
+    exist (or only new ones, without a cursor) or `timeout_s` passes.
+    """
+    limit = max(1, min(limit, MAX_PAGE))
+    block_ms = max(1, int(min(timeout_s, MAX_POLL) * 1000))
+    resp = await ar.xread({TAPE_STREAM: since or "$"}, count=limit, block=block_ms)
+    items = decode_entries(resp[0][1]) if resp else []
+    return items, items[-1]["id"] if items else since
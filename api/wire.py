@@ -0,0 +1,140 @@
+# api/wire.py
+"""
+OHLC wire formats + ETags for /v1/ohlc.
+
+Formats (picked by ?format= or the Accept header):
+  json      default; the contract's array of Bar objects
+  columnar  parallel arrays, epoch-second timestamps delta-encoded:
+            {"t": [t0, dt1, dt2, ...], "o": [...], "h": [...], "l": [...], "c": [...], "v": [...]}
+            (t[i] = t0 + dt1 + ... + dti)
+  msgpack   the columnar payload as MessagePack (needs `msgpack`)
+  arrow     Arrow IPC stream, one row per bar (needs `pyarrow`)
+"""
+from __future__ import annotations
+from typing import Dict, List, Optional, Tuple
+import hashlib
+import importlib.util
+import json
+
+import numpy as np
+
+from providers.base import Bar, is_fallback
+from providers.series import BarColumns, raw_version
+
+MEDIA_TYPES = {
+    "json": "application/json",
+    "columnar": "application/vnd.flowsnipr.columnar+json",
+    "msgpack": "application/x-msgpack",
+    "arrow": "application/vnd.apache.arrow.stream",
+}
+_ACCEPT = {
+    "application/vnd.flowsnipr.columnar+json": "columnar",
+    "application/x-msgpack": "msgpack",
+    "application/msgpack": "msgpack",
+    "application/vnd.apache.arrow.stream": "arrow",
+}
+
+
+class UnsupportedFormat(ValueError):
+    """Requested format is unknown or its optional dependency isn't installed."""
+
+
+_OPTIONAL_DEPS = {"msgpack": "msgpack", "arrow": "pyarrow"}
+
+
+def _available(fmt: str) -> bool:
+    dep = _OPTIONAL_DEPS.get(fmt)
+    return dep is None or importlib.util.find_spec(dep) is not None
+
+
+def negotiate(format_: Optional[str], accept: Optional[str]) -> str:
+    """?format= wins; otherwise the first usable Accept entry; else json."""
+    if format_:
+        fmt = format_.strip().lower()
+        if fmt not in MEDIA_TYPES:
+            raise UnsupportedFormat(f"unknown format: {format_}")
+        if not _available(fmt):
+            raise UnsupportedFormat(f"{fmt} output needs {_OPTIONAL_DEPS[fmt]} installed")
+        return fmt
+    for part in (accept or "").split(","):
+        media = part.split(";")[0].strip().lower()
+        if media in _ACCEPT and _available(_ACCEPT[media]):
+            return _ACCEPT[media]
+    return "json"
+
+
+def series_version(bars: List[Bar]) -> str:
+    """
+    Version of bars that didn't come with one (resampled series): same value
+    CachingProvider stores next to each cache entry, at the cost of one
+    json.dumps.
+    """
+    return raw_version(json.dumps(bars), is_fallback(bars))
+
+
+def etag_for(version: str, fmt: str, extra: str = "") -> str:
+    tag = hashlib.blake2b(f"{version}|{fmt}|{extra}".encode(), digest_size=12).hexdigest()
+    return f'"{tag}"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    candidates = [c.strip() for c in if_none_match.split(",")]
+    return "*" in candidates or etag in candidates
+
+
+def _columnar(bars: List[Bar], indicators: Optional[Dict[str, list]]) -> Dict:
+    cols = BarColumns.from_bars(bars)
+    t = np.diff(cols.t, prepend=0) if len(cols) else cols.t
+    payload = {
+        "t": t.tolist(),
+        "o": [b["o"] for b in bars],
+        "h": [b["h"] for b in bars],
+        "l": [b["l"] for b in bars],
+        "c": [b["c"] for b in bars],
+        "v": [b["v"] for b in bars],
+    }
+    if indicators is not None:
+        payload["indicators"] = indicators
+    return payload
+
+
+def _arrow(bars: List[Bar], indicators: Optional[Dict[str, list]]) -> bytes:
+    try:
+        import pyarrow as pa
+    except ImportError as e:
+        raise UnsupportedFormat("arrow output needs pyarrow installed") from e
+    cols = BarColumns.from_bars(bars)
+    arrays = {
+        "t": pa.array(cols.t.astype("datetime64[s]"), type=pa.timestamp("s", tz="UTC")),
+        "o": pa.array(cols.o), "h": pa.array(cols.h), "l": pa.array(cols.l), "c": pa.array(cols.c),
+        "v": pa.array([b["v"] for b in bars], type=pa.int64()),
+    }
+    for name, values in (indicators or {}).items():
+        arrays[name] = pa.array(values, type=pa.float64())
+    table = pa.table(arrays)
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+
+def encode(bars: List[Bar], fmt: str, indicators: Optional[Dict[str, list]] = None) -> Tuple[bytes, str]:
+    """Serialize for `fmt`; returns (body, media type)."""
+    if fmt == "json":
+        payload = bars if indicators is None else {"bars": bars, "indicators": indicators}
+        body = json.dumps(payload, separators=(",", ":")).encode()
+    elif fmt == "columnar":
+        body = json.dumps(_columnar(bars, indicators), separators=(",", ":")).encode()
+    elif fmt == "msgpack":
+        try:
+            import msgpack
+        except ImportError as e:
+            raise UnsupportedFormat("msgpack output needs msgpack installed") from e
+        body = msgpack.packb(_columnar(bars, indicators))
+    elif fmt == "arrow":
+        body = _arrow(bars, indicators)
+    else:
+        raise UnsupportedFormat(f"unknown format: {fmt}")
+    return body, MEDIA_TYPES[fmt]